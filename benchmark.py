@@ -0,0 +1,248 @@
+"""Набор бенчмарков песочницы.
+
+Каждый сценарий строит сцену в безголовой песочнице и прогоняет заданное
+число кадров тем же путем, что и основной цикл: физика идет через
+advance_physics с подшагами, подстройкой итераций решателя и удалением
+улетевших тел. Отдельно замеряются фазы кадра: подгрузка чанков рельефа,
+глобальные силы, шаг пространства, частицы, проверка скоростей для
+заданий, фон, отрисовка тел и частиц, интерфейс и прогресс уровня. Отдельно замеряется холодный запуск
+PhysicsSandbox() в новом процессе. Результаты пишутся в JSON и при
+наличии базового файла сравниваются с ним.
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --threshold 0.1
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pygame
+import pymunk
+
+from entities import KIND_BALL, KIND_BOX, KIND_POLYGON, KIND_TRIANGLE, grid_positions
+from main import PhysicsSandbox
+
+PHASES = ("streaming", "forces", "step", "particles", "speed_tasks", "background", "bodies", "ui", "progress")
+
+
+def spawn_mixed(sandbox, count, spacing=24, size=10):
+    """Смешанная сцена: шары, ящики, многоугольники и треугольники сеткой над полом"""
+    columns = max(1, int((sandbox.width - 100) // spacing))
+    top = sandbox.height - 40 - (count // columns + 1) * spacing
+    positions = grid_positions(count, (50, top), spacing, columns)
+    kinds = (KIND_BALL, KIND_BOX, KIND_POLYGON, KIND_TRIANGLE)
+    for kind in kinds:
+        sandbox.spawn_bulk(kind, positions[kind::len(kinds)], size=size)
+
+
+def scene_mixed(count):
+    def build(sandbox):
+        spawn_mixed(sandbox, count)
+    return build
+
+
+def scene_box_stack(sandbox, columns=8, height=40, size=20):
+    """Высокие столбики ящиков, стоящие вплотную друг на друге"""
+    floor = sandbox.height - 20
+    positions = [(150 + column * 80, floor - size * (row + 0.5))
+                 for column in range(columns) for row in range(height)]
+    sandbox.spawn_bulk(KIND_BOX, positions, size=size)
+
+
+def scene_polygons(sandbox, count=1000):
+    """Сцена только из случайных многоугольников"""
+    columns = (sandbox.width - 100) // 30
+    top = sandbox.height - 40 - (count // columns + 1) * 30
+    sandbox.spawn_bulk(KIND_POLYGON, grid_positions(count, (50, top), 30, columns), size=12)
+
+
+def scene_night(sandbox):
+    """Ночь со звездами и тысячей тел; цикл день/ночь остановлен"""
+    while sandbox.day_night.is_day:
+        sandbox.update_day_night_cycle()
+    sandbox.day_night.speed = 0
+    spawn_mixed(sandbox, 1000)
+
+
+def scene_drag(sandbox):
+    """Тысяча тел, одно из которых все время тащат по кругу"""
+    spawn_mixed(sandbox, 1000)
+    body = sandbox.entities.entities[len(sandbox.entities) // 2].body
+    sandbox.start_drag(body, tuple(body.position))
+
+
+def scene_particles(sandbox, count=20000):
+    """Двадцать тысяч частиц песка и сотня тел, на которые они сыплются"""
+    spawn_mixed(sandbox, 100)
+    sandbox.spawn_particles(count)
+
+
+SCENARIOS = {
+    "mixed_100": scene_mixed(100),
+    "mixed_1000": scene_mixed(1000),
+    "mixed_10000": scene_mixed(10000),
+    "box_stack": scene_box_stack,
+    "polygons": scene_polygons,
+    "night_stars": scene_night,
+    "drag_under_load": scene_drag,
+    "particles_20000": scene_particles,
+}
+
+
+def run_scenario(name, frames, warmup):
+    """Прогоняет сценарий и возвращает статистику по фазам (мс на кадр).
+
+    Силы, шаг пространства и частицы берутся из профилировщика песочницы,
+    который отмечает их внутри advance_physics; снятие положений для
+    интерполяции засчитывается шагу. Ступень качества закреплена на
+    нулевой, чтобы прогоны можно было сравнивать между собой.
+    """
+    random.seed(0)
+    sandbox = PhysicsSandbox(headless=True)
+    sandbox.quality.enabled = False
+    SCENARIOS[name](sandbox)
+    frame_dt = 1.0 / sandbox.fps
+    profiler = sandbox.profiler
+    profiler.enabled = True
+    slots = [profiler.slots[phase] for phase in ("forces", "step", "particles")]
+    timings = {phase: [] for phase in PHASES}
+    for frame in range(warmup + frames):
+        frame_start = time.perf_counter()
+        if sandbox.dragging_body:
+            angle = frame * 0.05
+            sandbox.move_drag((500 + 200 * math.cos(angle), 300 + 150 * math.sin(angle)))
+        streaming_start = time.perf_counter()
+        sandbox.update_streaming()
+        profiler.begin_frame()
+        streaming = time.perf_counter() - streaming_start
+        sandbox.advance_physics(frame_dt)
+        physics = [profiler.current[slot] for slot in slots]
+        marks = [time.perf_counter()]
+        sandbox.update_speed_tasks(sandbox.update_sleep_state())
+        marks.append(time.perf_counter())
+        sandbox.update_day_night_cycle()
+        sandbox.draw_background()
+        marks.append(time.perf_counter())
+        sandbox.draw_bodies()
+        sandbox.draw_particles()
+        sandbox.despawn_out_of_bounds(sandbox.renderer.current_positions(sandbox.entities))
+        marks.append(time.perf_counter())
+        sandbox.draw_ui()
+        sandbox.draw_physics_info()
+        sandbox.draw_next_object_info()
+        marks.append(time.perf_counter())
+        sandbox.level_system.draw_progress(sandbox.screen, sandbox.large_font, sandbox.is_day)
+        marks.append(time.perf_counter())
+        sandbox.tune_solver_iterations(time.perf_counter() - frame_start)
+        if frame >= warmup:
+            for phase, value in zip(PHASES, [streaming] + physics):
+                timings[phase].append(value)
+            for phase, start, end in zip(PHASES[4:], marks, marks[1:]):
+                timings[phase].append(end - start)
+    result = {"frames": frames, "bodies": len(sandbox.entities), "phases": {}}
+    totals = np.zeros(frames)
+    for phase, values in timings.items():
+        values = np.array(values) * 1000
+        totals += values
+        result["phases"][phase] = summarize(values)
+    result["phases"]["total"] = summarize(totals)
+    pygame.quit()
+    return result
+
+
+def summarize(values):
+    """Среднее, медиана, p95 и максимум ряда замеров"""
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "max_ms": float(values.max()),
+    }
+
+
+def measure_startup(repeats):
+    """Холодный запуск: импорт main и создание PhysicsSandbox в новом процессе"""
+    code = ("import time; start = time.perf_counter(); import main; "
+            "main.PhysicsSandbox(headless=True); print(time.perf_counter() - start)")
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        samples.append(float(output.stdout.strip().splitlines()[-1]) * 1000)
+    return summarize(np.array(samples))
+
+
+def compare(results, baseline, threshold, min_delta_ms=0.05):
+    """Сравнивает средние времена фаз с базовыми; возвращает список регрессий"""
+    regressions = []
+    pairs = [("startup", results["startup"], baseline.get("startup"))]
+    for name, scenario in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        for phase, stats in scenario["phases"].items():
+            pairs.append((f"{name}.{phase}", stats, base["phases"].get(phase) if base else None))
+    for label, stats, base in pairs:
+        if not base:
+            continue
+        old, new = base["mean_ms"], stats["mean_ms"]
+        change = (new - old) / old if old > 0 else 0.0
+        marker = ""
+        if change > threshold and new - old > min_delta_ms:
+            regressions.append(label)
+            marker = "  REGRESSION"
+        print(f"{label:32s} {old:9.3f} -> {new:9.3f} ms ({change:+.1%}){marker}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки физической песочницы")
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="сценарии для прогона (по умолчанию все)")
+    parser.add_argument("--frames", type=int, default=120, help="замеряемых кадров на сценарий")
+    parser.add_argument("--warmup", type=int, default=20, help="кадров разгона перед замером")
+    parser.add_argument("--startup-repeats", type=int, default=3, help="число холодных запусков")
+    parser.add_argument("--output", default="benchmark.json", help="файл результатов JSON")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="допустимый относительный рост времени фазы")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "pymunk": pymunk.version,
+            "numpy": np.__version__,
+        },
+        "startup": measure_startup(args.startup_repeats),
+        "scenarios": {},
+    }
+    print(f"startup: {results['startup']['mean_ms']:.1f} ms")
+    for name in args.scenarios:
+        result = results["scenarios"][name] = run_scenario(name, args.frames, args.warmup)
+        phases = "  ".join(f"{phase} {stats['mean_ms']:.2f}" for phase, stats in result["phases"].items())
+        print(f"{name} ({result['bodies']} bodies): {phases} ms")
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
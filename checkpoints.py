@@ -0,0 +1,55 @@
+"""Снимки сцены для отмотки назад и их буфер, ограниченный по памяти"""
+
+from collections import deque
+
+
+class Checkpoint:
+    """Снимок сцены: состояние тел массивом и описания объектов для их пересоздания.
+
+    state - (N, 6): x, y, угол, vx, vy, угловая скорость в порядке ids.
+    specs - (тип, цвет, радиус, вершины, масса, упругость, трение) для каждого
+    тела; список общий у снимков, между которыми набор тел не менялся.
+    """
+
+    __slots__ = ("ids", "state", "specs", "nbytes")
+
+    def __init__(self, ids, state, specs, specs_bytes=0):
+        self.ids = ids
+        self.state = state
+        self.specs = specs
+        # Оценка занимаемой памяти: массивы плюс описания, если они новые
+        self.nbytes = ids.nbytes + state.nbytes + 8 * len(specs) + specs_bytes
+
+
+class CheckpointBuffer:
+    """Кольцевой буфер снимков, ограниченный по памяти.
+
+    При переполнении max_bytes вытесняются самые старые снимки.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.items = deque()
+        self.used_bytes = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, checkpoint):
+        """Добавляет снимок, вытесняя старые при нехватке памяти"""
+        self.items.append(checkpoint)
+        self.used_bytes += checkpoint.nbytes
+        while self.used_bytes > self.max_bytes and len(self.items) > 1:
+            self.used_bytes -= self.items.popleft().nbytes
+
+    def pop(self):
+        """Забирает самый свежий снимок или возвращает None"""
+        if not self.items:
+            return None
+        checkpoint = self.items.pop()
+        self.used_bytes -= checkpoint.nbytes
+        return checkpoint
+
+    def clear(self):
+        self.items.clear()
+        self.used_bytes = 0
@@ -0,0 +1,170 @@
+"""Реестр динамических объектов, пул тел и раскладки положений для массового создания"""
+
+import math
+import random
+
+import numpy as np
+import pymunk
+
+
+# Типы объектов в реестре (совпадают с индексами PhysicsSandbox.object_types)
+KIND_BALL, KIND_BOX, KIND_POLYGON, KIND_TRIANGLE = range(4)
+KIND_NAMES = ("Ball", "Box", "Polygon", "Triangle")
+
+
+class Entity:
+    """Запись реестра об одном динамическом объекте"""
+
+    __slots__ = ("id", "row", "body", "shape", "kind", "color",
+                 "mass", "elasticity", "friction", "vertices", "offset", "radius", "bound")
+
+    def __init__(self, entity_id, body, shape, kind, color, vertices=None):
+        self.id = entity_id
+        self.row = -1  # Позиция в плотном списке реестра
+        self.body = body
+        self.shape = shape
+        self.kind = kind
+        self.color = color
+        # Материал
+        self.mass = body.mass
+        self.elasticity = shape.elasticity
+        self.friction = shape.friction
+        # Данные для отрисовки: локальные вершины многоугольника или центр и радиус круга,
+        # radius у многоугольника - радиус описанной окружности, bound - радиус
+        # окружности вокруг центра тела, в которую помещается вся форма
+        if isinstance(shape, pymunk.Circle):
+            self.vertices = None
+            self.offset = tuple(shape.offset)
+            self.radius = shape.radius
+        else:
+            if vertices is None:
+                vertices = [tuple(v) for v in shape.get_vertices()]
+            self.vertices = np.array(vertices, dtype=float)
+            self.offset = (0.0, 0.0)
+            self.radius = max(math.hypot(x, y) for x, y in self.vertices.tolist())
+        self.bound = self.radius + math.hypot(*self.offset)
+
+
+class EntityStore:
+    """Реестр динамических объектов со стабильными целочисленными id.
+
+    Записи лежат плотным списком: при удалении на место удаленной встает
+    последняя. Тело хранит id своей записи в body.entity_id, так что
+    поиск записи по телу не требует словаря с ключами-телами. version
+    меняется при каждом добавлении и удалении - по нему остальные
+    подсистемы понимают, что пора перестроить свои массивы.
+    """
+
+    def __init__(self):
+        self.entities = []
+        self.by_id = {}
+        self.next_id = 0
+        self.version = 0
+        # Кэш столбцов и списка тел, сбрасывается при смене version
+        self._columns = {}
+        self._columns_version = None
+        self._bodies = []
+        self._bodies_version = None
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def add(self, body, shape, kind, color, vertices=None, entity_id=None):
+        """Регистрирует объект и возвращает его запись.
+
+        vertices - уже известные локальные вершины многоугольника, чтобы не
+        читать их из формы повторно. entity_id - готовый id (например, id того
+        же объекта в другом процессе), по умолчанию выдается следующий свободный.
+        """
+        if entity_id is None:
+            entity_id = self.next_id
+        entity = Entity(entity_id, body, shape, kind, color, vertices)
+        self.next_id = max(self.next_id, entity_id + 1)
+        entity.row = len(self.entities)
+        self.entities.append(entity)
+        self.by_id[entity.id] = entity
+        body.entity_id = entity.id
+        self.version += 1
+        return entity
+
+    def remove(self, entity):
+        """Удаляет запись из реестра"""
+        last = self.entities.pop()
+        if last is not entity:
+            last.row = entity.row
+            self.entities[entity.row] = last
+        del self.by_id[entity.id]
+        entity.row = -1
+        self.version += 1
+
+    def get(self, body):
+        """Возвращает запись тела или None"""
+        return self.by_id.get(getattr(body, "entity_id", None))
+
+    def bodies(self):
+        """Тела в порядке плотного списка"""
+        if self._bodies_version != self.version:
+            self._bodies = [entity.body for entity in self.entities]
+            self._bodies_version = self.version
+        return self._bodies
+
+    def column(self, name):
+        """Поле записей как массив NumPy в порядке плотного списка (кэшируется до изменения реестра)"""
+        if self._columns_version != self.version:
+            self._columns = {}
+            self._columns_version = self.version
+        array = self._columns.get(name)
+        if array is None:
+            array = np.array([getattr(entity, name) for entity in self.entities], dtype=float)
+            self._columns[name] = array
+        return array
+
+    def clear(self):
+        """Удаляет все записи"""
+        self.entities.clear()
+        self.by_id.clear()
+        self.version += 1
+
+
+class BodyPool:
+    """Пул удаленных тел и форм для повторного использования.
+
+    Тела и формы складываются по типу объекта и при следующем создании
+    объекта того же типа переиспользуются вместо новых выделений.
+    """
+
+    def __init__(self, max_per_kind=20000):
+        self.max_per_kind = max_per_kind
+        self.free = {}  # {тип: [(тело, форма), ...]}
+
+    def __len__(self):
+        return sum(len(items) for items in self.free.values())
+
+    def acquire(self, kind):
+        """Возвращает свободную пару (тело, форма) или None"""
+        items = self.free.get(kind)
+        return items.pop() if items else None
+
+    def release(self, kind, body, shape):
+        """Возвращает пару в пул"""
+        items = self.free.setdefault(kind, [])
+        if len(items) < self.max_per_kind:
+            items.append((body, shape))
+
+    def clear(self):
+        self.free.clear()
+
+
+def grid_positions(count, origin, spacing, columns):
+    """Положения count объектов сеткой из columns колонок с шагом spacing"""
+    x0, y0 = origin
+    return [(x0 + (i % columns) * spacing, y0 + (i // columns) * spacing) for i in range(count)]
+
+
+def random_positions(count, region):
+    """Случайные положения count объектов в прямоугольнике region = (x, y, ширина, высота)"""
+    x, y, width, height = region
+    return [(random.uniform(x, x + width), random.uniform(y, y + height)) for _ in range(count)]
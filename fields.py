@@ -0,0 +1,141 @@
+"""Силовые поля, вычисляемые векторно по всем динамическим телам"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pygame
+
+
+class ForceField(ABC):
+    """Базовое силовое поле.
+
+    evaluate() получает массивы положений (N, 2), скоростей (N, 2) и масс (N,)
+    всех динамических тел и возвращает силы (N, 2) в мировых координатах.
+    region - pygame.Rect, вне которого поле не действует (None - везде).
+    """
+
+    def __init__(self, region=None):
+        self.region = pygame.Rect(region) if region is not None else None
+        self.enabled = True
+
+    def is_active(self):
+        """Дает ли поле ненулевую силу"""
+        return self.enabled
+
+    @abstractmethod
+    def evaluate(self, positions, velocities, masses):
+        """Силы поля (N, 2) для тел с данными положениями, скоростями и массами"""
+
+    def forces(self, positions, velocities, masses):
+        """Силы поля с учетом ограничивающей области"""
+        forces = self.evaluate(positions, velocities, masses)
+        if self.region is not None:
+            region = self.region
+            inside = ((positions[:, 0] >= region.left) & (positions[:, 0] < region.right) &
+                      (positions[:, 1] >= region.top) & (positions[:, 1] < region.bottom))
+            forces[~inside] = 0
+        return forces
+
+
+class UniformField(ForceField):
+    """Одинаковая для всех тел сила (ветер, притяжение)"""
+
+    def __init__(self, force=(0, 0), region=None):
+        super().__init__(region)
+        self.force = force
+
+    def is_active(self):
+        return self.enabled and self.force != (0, 0)
+
+    def evaluate(self, positions, velocities, masses):
+        return np.tile(np.asarray(self.force, dtype=float), (len(positions), 1))
+
+
+class PointAttractor(ForceField):
+    """Радиальное поле к точке center (отрицательная strength отталкивает).
+
+    Ускорение равно strength у центра и спадает как 1 / (1 + (d / radius)^2).
+    """
+
+    def __init__(self, center, strength=2000, radius=150, region=None):
+        super().__init__(region)
+        self.center = center
+        self.strength = strength
+        self.radius = radius
+
+    def evaluate(self, positions, velocities, masses):
+        delta = np.asarray(self.center, dtype=float) - positions
+        distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-6)
+        accel = self.strength / (1 + (distance / self.radius) ** 2)
+        return delta * (accel * masses / distance)[:, None]
+
+
+class VortexField(PointAttractor):
+    """Вихрь вокруг точки center: сила направлена по касательной"""
+
+    def evaluate(self, positions, velocities, masses):
+        radial = super().evaluate(positions, velocities, masses)
+        # Поворот радиальной силы на 90 градусов
+        return np.column_stack((-radial[:, 1], radial[:, 0]))
+
+
+class DragField(ForceField):
+    """Вязкое сопротивление: сила против скорости, пропорциональная массе"""
+
+    def __init__(self, coefficient=0.5, region=None):
+        super().__init__(region)
+        self.coefficient = coefficient
+
+    def is_active(self):
+        return self.enabled and self.coefficient != 0
+
+    def evaluate(self, positions, velocities, masses):
+        return -self.coefficient * velocities * masses[:, None]
+
+
+class ForceFieldSystem:
+    """Набор силовых полей, вычисляемых одним векторным проходом по всем телам.
+
+    Силы всех полей складываются в один массив (N, 2) по столбцам реестра
+    и записываются телам как body.force. Гравитация пространства не
+    меняется: ее же читают частицы и сохраненные сцены.
+    """
+
+    def __init__(self):
+        self.fields = []
+
+    def add(self, field):
+        self.fields.append(field)
+        return field
+
+    def remove(self, field):
+        self.fields.remove(field)
+
+    def apply(self, store):
+        """Записывает бодрствующим телам суммарные силы полей.
+
+        Уснувшие тела пропускаются: присваивание body.force будит тело.
+        """
+        fields = [field for field in self.fields if field.is_active()]
+        bodies = store.bodies()
+        if not fields or not bodies:
+            return
+        awake = np.flatnonzero(np.fromiter((not body.is_sleeping for body in bodies), bool, len(bodies)))
+        if not len(awake):
+            return
+        masses = store.column("mass")[awake]
+        total = np.zeros((len(awake), 2))
+        positions = velocities = None
+        for field in fields:
+            if isinstance(field, UniformField) and field.region is None:
+                total += field.force
+                continue
+            if positions is None:
+                # Положения и скорости бодрствующих тел - одним проходом
+                state = np.array([(*bodies[index].position, *bodies[index].velocity)
+                                  for index in awake.tolist()], dtype=float)
+                positions, velocities = state[:, 0:2], state[:, 2:4]
+            total += field.forces(positions, velocities, masses)
+        pushed = np.flatnonzero(total.any(axis=1))
+        for index, force in zip(awake[pushed].tolist(), total[pushed].tolist()):
+            bodies[index].force = force
@@ -1,32 +1,90 @@
+import numpy as np
 import pygame
 import pymunk
 import pymunk.pygame_util
+import argparse
+import gc
+import os
 import sys
 import random
 import math
+import time
 from pygame.constants import KMOD_SHIFT
 from pygame.locals import *
 
+from checkpoints import Checkpoint, CheckpointBuffer
+from entities import (KIND_BALL, KIND_BOX, KIND_NAMES, KIND_POLYGON, KIND_TRIANGLE, BodyPool, EntityStore,
+                      grid_positions, random_positions)
+from fields import ForceFieldSystem, PointAttractor, UniformField, VortexField
+from particles import ParticleSystem
+from physics_process import PhysicsClient
+from profiler import FrameProfiler
+from quality import QualityGovernor
+from rendering import BatchRenderer, DayNightCycle, LayerCompositor, text_cache
+from replay import InputRecorder, LiveInput, ReplayInput
+from scene import read_scene, scene_moments, write_scene
+from sweep import SCENARIOS, run_sweep
+from telemetry import TelemetryServer, quantize_telemetry
+from world import Camera, TerrainChunk
+
+
+# События, на которые подписываются задания системы уровней
+EVENT_OBJECT_CREATED = "object_created"  # Создан объект
+EVENT_SPEED_REACHED = "speed_reached"  # Тело разогналось выше порога скорости
+EVENT_SHAPE_USED = "shape_used"  # Создан объект формы type
+SPEED_TASK_THRESHOLD = 100
+
 
 class LevelSystem:
+    """Система уровней с заданиями, подписанными на события.
+
+    Каждое задание слушает одно событие. Задания проиндексированы по имени
+    и по событию, поэтому событие без слушателей отбрасывается одной
+    проверкой словаря, а обработка не зависит от размера пула заданий.
+    """
+
     def __init__(self):
         self.level = 1
         self.current_xp = 0
         self.xp_to_next_level = 100
         self.tasks = []
         self.completed_tasks = []
+        # "unique": задание засчитывает только новые значения этого поля события
         self.task_pool = [
-            {"name": "Create objects", "target": 5, "reward": 50},
-            {"name": "Reach speed 100", "target": 5, "reward": 100}
+            {"name": "Create objects", "event": EVENT_OBJECT_CREATED, "target": 5, "reward": 50},
+            {"name": "Reach speed 100", "event": EVENT_SPEED_REACHED, "target": 5, "reward": 100}
         ]
+        self.tasks_by_name = {}
+        self.listeners = {}  # {событие: [задание, ...]}
         self.generate_tasks()
         self.level_up_animation = 0  # Для анимации повышения уровня
 
     def generate_tasks(self):
         """Генерирует новые задания из пула"""
-        self.tasks = random.sample(self.task_pool, 2)
+        self.tasks = [dict(task, current=0) for task in random.sample(self.task_pool, 2)]
+        self.index_tasks()
+
+    def index_tasks(self):
+        """Перестраивает индексы заданий по имени и по событию"""
+        self.tasks_by_name = {task["name"]: task for task in self.tasks}
+        self.listeners = {}
         for task in self.tasks:
-            task['current'] = 0
+            self.listeners.setdefault(task["event"], []).append(task)
+
+    def wants(self, event):
+        """Есть ли задания, которые слушают событие"""
+        return event in self.listeners
+
+    def emit(self, event, count=1, **data):
+        """Передает событие заданиям, которые на него подписаны"""
+        listeners = self.listeners.get(event)
+        if not listeners:
+            return
+        for task in list(listeners):
+            # Завершение предыдущего задания могло повысить уровень и заменить задания
+            if self.tasks_by_name.get(task["name"]) is not task:
+                continue
+            self.advance_task(task, count, data)
 
     def add_xp(self, amount):
         """Добавляет опыт и проверяет повышение уровня."""
@@ -44,37 +102,43 @@ class LevelSystem:
         print(f"Level up! You are now level {self.level}")
 
     def update_task(self, task_name, progress=1, extra_data=None):
-        """Обновляет прогресс задания."""
-        # Убедимся, что extra_data всегда является словарем
-        extra_data = extra_data or {}
-
-        for task in self.tasks:
-            if task["name"] == task_name:
-                if task_name == "Use all shapes":
-                    used_shapes = getattr(self, '_used_shapes', set())
-                    shape_type = extra_data.get('type')  # Безопасный доступ
-                    if shape_type and shape_type not in used_shapes:
-                        used_shapes.add(shape_type)
-                        task["current"] += 1
-                    setattr(self, '_used_shapes', used_shapes)
-                else:
-                    task["current"] += progress
+        """Обновляет прогресс задания по имени."""
+        task = self.tasks_by_name.get(task_name)
+        if task:
+            self.advance_task(task, progress, extra_data or {})
 
-                if task["current"] >= task["target"]:
-                    self.complete_task(task)
-                break
+    def advance_task(self, task, progress, data):
+        """Засчитывает прогресс заданию и завершает его при достижении цели."""
+        unique = task.get("unique")
+        if unique:
+            value = data.get(unique)
+            seen = task.setdefault("seen", set())
+            if value is None or value in seen:
+                return
+            seen.add(value)
+            task["current"] += 1
+        else:
+            task["current"] += progress
+        if task["current"] >= task["target"]:
+            self.complete_task(task)
 
     def complete_task(self, task):
         """Завершает задание и выдает награду."""
-        self.add_xp(task["reward"])
-        self.completed_tasks.append(task)
+        # Сначала снимаем задание: повышение уровня заменяет список заданий
         self.tasks.remove(task)
+        self.index_tasks()
+        self.completed_tasks.append(task)
         print(f"Task completed: {task['name']}")
+        self.add_xp(task["reward"])
         if not self.tasks:  # Если все задания выполнены
             self.generate_tasks()
 
     def draw_progress(self, screen, font, is_day):
-        """Отображает прогресс уровня и заданий по центру экрана."""
+        """Отображает прогресс уровня и заданий по центру экрана.
+
+        Возвращает список занятых областей экрана.
+        """
+        rects = []
         center_x = screen.get_width() // 2
         y_offset = screen.get_height() // 2 - 100
 
@@ -83,35 +147,36 @@ class LevelSystem:
 
         # Анимация повышения уровня
         if self.level_up_animation > 0:
-            level_text = font.render(f"LEVEL UP!", True, (255, 255, 0))
+            # Копия: поверхность из кэша нельзя менять на месте
+            level_text = text_cache.render(font, f"LEVEL UP!", (255, 255, 0)).copy()
             level_rect = level_text.get_rect(center=(center_x, y_offset))
             alpha_surf = pygame.Surface(level_rect.size, pygame.SRCALPHA)
             alpha_surf.fill((255, 255, 255, self.level_up_animation))
             level_text.blit(alpha_surf, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
-            screen.blit(level_text, level_rect)
+            rects.append(screen.blit(level_text, level_rect))
             self.level_up_animation -= 5
             y_offset += 50
 
         # Отображение текущего уровня
-        level_text = font.render(f"Level: {self.level}", True, text_color)
-        xp_text = font.render(f"XP: {self.current_xp}/{self.xp_to_next_level}", True, text_color)
+        level_text = text_cache.render(font, f"Level: {self.level}", text_color)
+        xp_text = text_cache.render(font, f"XP: {self.current_xp}/{self.xp_to_next_level}", text_color)
         level_rect = level_text.get_rect(center=(center_x, y_offset))
-        screen.blit(level_text, level_rect)
+        rects.append(screen.blit(level_text, level_rect))
         y_offset += 30
         xp_rect = xp_text.get_rect(center=(center_x, y_offset))
-        screen.blit(xp_text, xp_rect)
+        rects.append(screen.blit(xp_text, xp_rect))
         y_offset += 50
 
         # Отображение заданий
         for task in self.tasks:
             progress = min(task['current'], task['target'])
-            task_text = font.render(
-                f"{task['name']}: {progress}/{task['target']}",
-                True, text_color
+            task_text = text_cache.render(
+                font, f"{task['name']}: {progress}/{task['target']}", text_color
             )
             task_rect = task_text.get_rect(center=(center_x, y_offset))
-            screen.blit(task_text, task_rect)
+            rects.append(screen.blit(task_text, task_rect))
             y_offset += 30
+        return rects
 
 class MainMenu:
     def __init__(self, screen, width, height):
@@ -155,14 +220,14 @@ class MainMenu:
             self.fade_alpha -= 5
 
         # Заголовок
-        title = self.font_title.render("PHYSICAL SANDBOX", True, (255, 255, 255))
+        title = text_cache.render(self.font_title, "PHYSICAL SANDBOX", (255, 255, 255))
         title_rect = title.get_rect(center=(self.width // 2, self.height // 4))
         self.screen.blit(title, title_rect)
 
         # Пункты меню
         for i, item in enumerate(self.menu_items):
             color = (255, 255, 0) if i == self.selected_item else (255, 255, 255)
-            text = self.font_items.render(item, True, color)
+            text = text_cache.render(self.font_items, item, color)
             rect = text.get_rect(center=(self.width // 2, self.height // 2 + i * 50))
             self.screen.blit(text, rect)
 
@@ -179,40 +244,139 @@ class MainMenu:
         return None
 
 
+# pymunk.Space(threaded=True) использует не больше двух потоков решателя
+MAX_SOLVER_THREADS = 2
+
+
 class PhysicsSandbox:
-    def __init__(self):
+    def __init__(self, headless=False, substeps=3, day_speed=1.0, broadphase="tree", threads=1, split=False,
+                 large_world=False):
+        # В безголовом режиме SDL рисует в память и окно не открывается
+        self.headless = headless
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
         pygame.init()
         self.width, self.height = 1000, 700
         self.screen = pygame.display.set_mode((self.width, self.height))
         pygame.display.set_caption("Физическая песочница")
         # Добавляем флаг для отображения меню
-        self.show_menu = True
+        self.show_menu = not headless
         self.main_menu = MainMenu(self.screen, self.width, self.height)
         # Физическое пространство
-        self.space = pymunk.Space()
-        self.space.gravity = (0, 900)
+        self.gravity = (0, 900)
+        # Засыпание: тело, двигавшееся медленнее idle_speed_threshold дольше
+        # sleep_time_threshold секунд, исключается из расчета до следующего толчка
+        self.sleep_time_threshold = 0.5
+        self.idle_speed_threshold = 5.0
+        # Широкая фаза: "tree" - дерево ограничивающих рамок (по умолчанию в pymunk),
+        # "hash" - пространственный хеш, настраиваемый по размерам и числу тел
+        self.broadphase = broadphase
+        self.hash_params = None  # (размер ячейки, число ячеек) текущей настройки хеша
+        self.broadphase_version = None  # Версия реестра при последней настройке
+        self.step_times = {}  # {широкая фаза: [суммарное время шагов, число шагов]}
+        # Потоки решателя: при threads > 1 пространство создается с threaded=True.
+        # pymunk использует не больше двух потоков и не поддерживает их в Windows;
+        # второй поток окупается не на каждой сцене, поэтому по умолчанию он выключен
+        self.threads = min(threads, MAX_SOLVER_THREADS)
+        self.space = self.create_space()
+        # Энергосбережение: успокоившаяся сцена без ввода обновляется с частотой idle_fps
+        self.power_saving = True
+        self.idle_fps = 5
+        self.settled = False
+        self.last_sun_position = None
         # Настройки отрисовки
         self.draw_options = pymunk.pygame_util.DrawOptions(self.screen)
         self.clock = pygame.time.Clock()
         self.fps = 60
+        # Фиксированный шаг физики: substeps шагов на кадр (при 60 FPS и 3 шагах - 180 Гц)
+        self.substeps = substeps
+        self.max_catchup_frames = 3  # Сколько кадров физики можно догнать за один кадр
+        self.accumulator = 0.0
+        # Источник ввода: живой, записывающий или воспроизводящий запись
+        self.input = LiveInput()
+        self.frame_input = None  # Ввод текущего кадра
+        # Профилировщик фаз кадра (F3 - график и перцентили, F4 - выгрузка в CSV)
+        self.profiler = FrameProfiler()
+        # Сервер телеметрии и удаленного управления (включается из командной строки)
+        self.telemetry = None
+        # Свободное время кадра уходит на дополнительные итерации решателя
+        self.base_iterations = self.space.iterations
+        self.max_iterations = 40
+        # Регулятор качества: при нехватке времени кадра снижает качество ступенями.
+        # В раздельном режиме подшаги считает процесс физики, поэтому их он не трогает
+        self.quality = QualityGovernor(1.0 / self.fps, max_tier=3 if split else 4)
+        self.base_substeps = substeps
+        self.hud_lines = []  # Строки HUD последнего обновления: (поверхность, положение)
+        self.hud_age = 0  # Кадров с последнего обновления HUD
+        # Доля интерполяции между двумя последними шагами физики при отрисовке
+        self.render_alpha = 1.0
         self.running = True
         self.font = pygame.font.SysFont("Arial", 14)
         self.large_font = pygame.font.SysFont("Arial", 24, bold=True)
         # Цикл день/ночь
+        self.day_night = DayNightCycle(self.width, self.height, speed=day_speed)
         self.day_time = 0  # 0-2400, где 600 - восход, 1800 - закат
-        self.is_day = True
-        self.sky_color = (135, 206, 250)  # Начальный цвет неба
+        self.is_day = self.day_night.is_day
+        self.sky_color = self.day_night.sky_color
         self.stars = []
         self.create_stars()
-        # Создание статического пола и стен
+        # Мир: по умолчанию один экран. Большой мир (large_world) - 16 экранов в ширину
+        # и 4 в высоту, исходный экран - его левый нижний угол. Рельеф пола разбит на
+        # чанки шириной в экран, в большом мире в пространстве лежат только чанки у
+        # камеры, а тела дальше lod_margin от вида убираются из пространства
+        self.large_world = large_world
+        if large_world:
+            self.world_rect = pygame.Rect(0, -3 * self.height, 16 * self.width, 4 * self.height)
+            self.camera = Camera((self.width, self.height), self.world_rect)
+        else:
+            self.world_rect = pygame.Rect(0, 0, self.width, self.height)
+            self.camera = Camera((self.width, self.height), self.world_rect, min_zoom=1.0)
+        self.chunk_width = self.width
+        self.lod_margin = 500
+        self.chunk_margin = self.lod_margin + self.chunk_width
+        self.lod_interval = 10  # Кадров между проходами по телам
+        self.lod_age = 0
+        self.lod_key = None
+        self.lod_parked = set()  # id тел, убранных из пространства из-за удаленности от камеры
+        self.pan_anchor = None  # Положение мыши при перетаскивании вида средней кнопкой
+        # Создание стен и рельефа пола
         self.create_boundaries()
+        # Закэшированные слои: фон (небо, звезды, границы), панель инструментов и
+        # характеристики следующего объекта. Перестраиваются только при смене ключа,
+        # динамические тела рисуются поверх них.
+        self.compositor = LayerCompositor(self.screen)
+        self.background_surface = pygame.Surface((self.width, self.height)).convert()
+        self.background_key = None
+        self.toolbar_surface = None
+        self.toolbar_key = None
+        self.info_surface = None
+        self.info_key = None
         # Список цветов для объектов
         self.colors = [
             (255, 0, 0), (0, 255, 0), (0, 0, 255),
             (255, 255, 0), (255, 0, 255), (0, 255, 255),
             (128, 0, 0), (0, 128, 0), (0, 0, 128)
         ]
-        self.body_colors = {}  # {body: color}
+        self.entities = EntityStore()  # Реестр динамических объектов
+        self.body_pool = BodyPool()  # Удаленные тела и формы для повторного использования
+        # Зона удаления: тела, вылетевшие за ее пределы, удаляются из сцены
+        world = self.world_rect
+        self.kill_bounds = pygame.Rect(world.left - 500, world.top - 2000, world.width + 1000, world.height + 2500)
+        self.despawn_interval = 60  # Шагов между проверками в безголовом режиме
+        self.despawned_count = 0
+        self.renderer = BatchRenderer()
+        # Частицы: песок из массивов NumPy, бьющийся о стены, рельеф и тела
+        self.particles = ParticleSystem()
+        self.particles.set_segments(self.static_segments())
+        self.particles_per_frame = 40  # Сколько частиц за кадр насыпается при зажатой ЛКМ
+        # Снимки сцены для перемотки назад (Z) и сохраненная контрольная точка (C/X)
+        self.checkpoints = CheckpointBuffer()
+        self.checkpoint_interval = 30  # Кадров между снимками
+        self.saved_checkpoint = None
+        self.checkpoint_specs = None  # Описания объектов последнего снимка
+        self.checkpoint_version = None  # и версия реестра, для которой они собраны
+        self.frame_count = 0
+        self.scene_path = "scene.phys"  # Файл сцены для F5 (сохранить) и F9 (загрузить)
         # Перетаскивание объектов
         self.dragging_body = None
         self.drag_joint = None
@@ -220,8 +384,13 @@ class PhysicsSandbox:
         self.wind_strength = 0
         self.attraction_strength = 0
         self.global_forces_enabled = True
+        # Силовые поля: ветер и притяжение - однородные поля, управляемые W/S/A/D
+        self.force_fields = ForceFieldSystem()
+        self.wind_field = self.force_fields.add(UniformField())
+        self.attraction_field = self.force_fields.add(UniformField())
+        self.applied_forces = None  # (вкл., ветер, притяжение) на прошлом шаге
         # Настройки объектов
-        self.object_types = ["ball", "box", "polygon", "triangle"]
+        self.object_types = ["ball", "box", "polygon", "triangle", "particles"]
         self.current_object_type = 0  # Индекс в object_types
         self.object_size = 30
         self.object_mass = 45
@@ -231,69 +400,73 @@ class PhysicsSandbox:
         self.selected_body = None
         self.edit_mode = False
         # Панель инструментов
-        self.toolbar_rect = pygame.Rect(self.width - 210, 10, 200, 350)
+        self.toolbar_rect = pygame.Rect(self.width - 210, 10, 200, 400)
         self.button_rects = []
         self.create_ui()
         # Система уровней
         self.level_system = LevelSystem()  # Tasks are generated automatically
+        self.fast_bodies = set()  # Тела, уже засчитанные как превысившие порог скорости
+        # Физика в отдельном процессе: здесь остаются только копии тел для отрисовки
+        self.physics_client = PhysicsClient(substeps, broadphase, threads, large_world) if split else None
+        self.process_state = None  # Состояние тел из последнего чтения общей памяти
 
     def create_stars(self):
-        """Создает звезды для ночного неба"""
+        """Создает звезды для ночного неба и заранее рисует их на отдельном слое"""
         self.stars = []
         for _ in range(200):
             x = random.randint(0, self.width)
             y = random.randint(0, self.height // 2)
             self.stars.append((x, y))
+        self.stars_surface = pygame.Surface((self.width, self.height // 2 + 2))
+        self.stars_surface.set_colorkey((0, 0, 0))
+        for x, y in self.stars:
+            pygame.draw.circle(self.stars_surface, (255, 255, 255), (x, y), 1)
 
-    def update_day_night_cycle(self):
-        """Обновляет цикл день/ночь"""
-        self.day_time += 1
-        if self.day_time > 2400:
-            self.day_time = 0
-
-        if 600 <= self.day_time < 1800:
-            # День
-            if not self.is_day:
-                self.is_day = True
-            # Плавное изменение цвета неба от светло-голубого до темно-синего
-            t = (self.day_time - 600) / 1200
-            r = max(0, min(255, int(135 + (25 - 135) * t)))
-            g = max(0, min(255, int(206 + (102 - 206) * t)))
-            b = max(0, min(255, int(250 + (50 - 250) * t)))
-            self.sky_color = (r, g, b)
-        else:
-            # Ночь
-            if self.is_day:
-                self.is_day = False
-            # Плавное изменение цвета неба от темно-синего до черного
-            t = (self.day_time - 1800) / 600 if self.day_time >= 1800 else (self.day_time + 600) / 600
-            r = max(0, min(255, int(25 + (0 - 25) * t)))
-            g = max(0, min(255, int(102 + (0 - 102) * t)))
-            b = max(0, min(255, int(50 + (0 - 50) * t)))
-            self.sky_color = (r, g, b)
+    def update_day_night_cycle(self, ticks=1):
+        """Обновляет цикл день/ночь по заранее рассчитанным таблицам"""
+        self.day_night.advance(ticks)
+        self.day_time = self.day_night.index
+        self.is_day = self.day_night.is_day
+        self.sky_color = self.day_night.sky_color
+
+    def update_background_layer(self):
+        """Перестраивает слой фона, если изменились небо или панели интерфейса.
+
+        Возвращает True, если слой был перестроен.
+        """
+        toolbar_changed = self.update_toolbar_layer()
+        # Характеристики следующего объекта проверяются вместе с обновлением HUD
+        info_changed = self.hud_age == 0 and self.update_info_layer()
+        key = (self.day_night.bucket, self.is_day, self.quality.stars)
+        if key == self.background_key and not toolbar_changed and not info_changed:
+            return False
+        self.background_key = key
+        self.day_night.draw_sky(self.background_surface)
+        # Звезды ночью (на первой ступени снижения качества не рисуются)
+        if not self.is_day and self.quality.stars:
+            self.background_surface.blit(self.stars_surface, (0, 0))
+        self.draw_next_object_info(self.background_surface)
+        self.draw_ui(self.background_surface)
+        return True
+
+    def draw_sun_moon(self):
+        """Рисует солнце или луну, возвращает занятую область"""
+        color = (255, 255, 0) if self.is_day else (200, 200, 200)
+        return pygame.draw.circle(self.screen, color, self.day_night.sun_position, 50)
 
     def draw_background(self):
         """Рисует фон с циклом день/ночь"""
-        # Заливка неба
-        self.screen.fill(self.sky_color)
-
-        # Рисуем солнце или луну
-        sun_moon_x = self.width * (self.day_time % 2400) / 2400
-        sun_moon_y = self.height // 3 - abs(self.day_time % 1200 - 600) / 600 * (self.height // 4)
-        if 600 <= self.day_time < 1800:
-            pygame.draw.circle(self.screen, (255, 255, 0), (int(sun_moon_x), int(sun_moon_y)), 50)
-        else:
-            pygame.draw.circle(self.screen, (200, 200, 200), (int(sun_moon_x), int(sun_moon_y)), 50)
+        self.update_background_layer()
+        self.screen.blit(self.background_surface, (0, 0))
+        self.draw_sun_moon()
 
-        # Рисуем звезды ночью
-        if not self.is_day:
-            for x, y in self.stars:
-                pygame.draw.circle(self.screen, (255, 255, 255), (x, y), 1)
-
-    def draw_next_object_info(self):
-        """Отображает характеристики следующего объекта"""
-        x_offset = self.width - 200
-        y_offset = self.height - 150
+    def update_info_layer(self):
+        """Перестраивает слой характеристик следующего объекта при их изменении"""
+        key = (self.current_object_type, self.object_size, self.object_mass,
+               self.object_elasticity, self.object_friction)
+        if key == self.info_key:
+            return False
+        self.info_key = key
         info = [
             f"Следующий объект: {self.object_types[self.current_object_type]}",
             f"Размер: {self.object_size}",
@@ -301,46 +474,250 @@ class PhysicsSandbox:
             f"Упругость: {self.object_elasticity:.1f}",
             f"Трение: {self.object_friction:.1f}"
         ]
-        for line in info:
-            text = self.font.render(line, True, (0, 0, 0))
-            self.screen.blit(text, (x_offset, y_offset))
-            y_offset += 20
+        lines = [text_cache.render(self.font, line, (0, 0, 0)) for line in info]
+        width = max(text.get_width() for text in lines)
+        self.info_surface = pygame.Surface((width, 20 * len(lines)), pygame.SRCALPHA)
+        for i, text in enumerate(lines):
+            self.info_surface.blit(text, (0, i * 20))
+        return True
+
+    def draw_next_object_info(self, surface=None):
+        """Отображает характеристики следующего объекта"""
+        self.update_info_layer()
+        surface = surface or self.screen
+        return surface.blit(self.info_surface, (self.width - 200, self.height - 150))
+
+    def create_space(self):
+        """Создает пустое пространство с текущими настройками"""
+        threaded = self.threads > 1 and sys.platform != "win32"
+        space = pymunk.Space(threaded=threaded)
+        if threaded:
+            space.threads = self.threads
+        space.gravity = self.gravity
+        space.sleep_time_threshold = self.sleep_time_threshold
+        space.idle_speed_threshold = self.idle_speed_threshold
+        return space
+
+    def rebuild_space(self):
+        """Переносит тела, формы, связи и границы в новое пространство с текущими настройками.
+
+        Нужно для настроек, которые pymunk не умеет менять на ходу (возврат от
+        пространственного хеша к дереву, многопоточный решатель). Тела и формы
+        переносятся как есть, поэтому реестр объектов, selected_body и
+        dragging_body остаются верными. Шарнир перетаскивания привязан к
+        статическому телу старого пространства и пересоздается заново.
+        """
+        drag_joint = self.drag_joint
+        if drag_joint:
+            self.space.remove(drag_joint)
+        old_space = self.space
+        space = self.create_space()
+        space.gravity = old_space.gravity
+        space.iterations = old_space.iterations
+        bodies = list(old_space.bodies)
+        shapes = list(old_space.shapes)
+        constraints = list(old_space.constraints)
+        old_space.remove(*constraints, *shapes, *bodies)
+        for shape in shapes:
+            if shape.body is old_space.static_body:
+                shape.body = space.static_body
+        self.space = space
+        self.hash_params = None
+        self.broadphase_version = None
+        self.retune_broadphase()
+        space.add(*bodies, *shapes, *constraints)
+        if drag_joint:
+            self.drag_joint = pymunk.PivotJoint(
+                space.static_body, self.dragging_body, drag_joint.anchor_a, drag_joint.anchor_b
+            )
+            self.drag_joint.max_force = drag_joint.max_force
+            space.add(self.drag_joint)
+
+    def spatial_hash_params(self):
+        """Размер ячейки и число ячеек хеша по размерам и числу тел.
+
+        Ячейка - типичный (медианный) поперечник тела, число ячеек - около
+        десяти на каждую форму, как советует документация pymunk.
+        """
+        if len(self.entities):
+            dim = 2 * float(np.median(self.entities.column("bound")))
+        else:
+            dim = float(self.object_size)
+        count = max(1000, 10 * (len(self.entities) + len(self.space.static_body.shapes)))
+        return dim, count
 
-    def create_boundaries(self):
-        """Создает границы (пол и стены)"""
+    def retune_broadphase(self):
+        """Подстраивает пространственный хеш под сцену, если она заметно изменилась"""
+        if self.broadphase != "hash" or self.entities.version == self.broadphase_version:
+            return
+        self.broadphase_version = self.entities.version
+        dim, count = self.spatial_hash_params()
+        if self.hash_params:
+            old_dim, old_count = self.hash_params
+            if 0.8 < dim / old_dim < 1.25 and 0.5 < count / old_count < 2:
+                return
+        self.space.use_spatial_hash(dim, count)
+        self.hash_params = (dim, count)
+
+    def set_broadphase(self, broadphase):
+        """Переключает широкую фазу: "tree" или "hash" """
+        if broadphase == self.broadphase:
+            return
+        if self.physics_client:
+            self.physics_client.send("call", "set_broadphase", (broadphase,))
+        self.broadphase = broadphase
+        if broadphase == "tree":
+            self.rebuild_space()
+        else:
+            self.retune_broadphase()
+
+    def set_threads(self, threads):
+        """Пересоздает пространство с заданным числом потоков решателя (не больше двух)"""
+        threads = min(threads, MAX_SOLVER_THREADS)
+        if threads == self.threads:
+            return
+        if self.physics_client:
+            self.physics_client.send("call", "set_threads", (threads,))
+        self.threads = threads
+        self.rebuild_space()
+
+    def broadphase_report(self):
+        """Среднее время шага пространства (мс) для каждой использованной широкой фазы"""
+        return {name: total / steps * 1000 for name, (total, steps) in self.step_times.items() if steps}
+
+    def terrain_height(self, x):
+        """Высота пола в точке x: ровный под исходным экраном, дальше холмы"""
+        ramp = min(1.0, max(0.0, (x - self.width) / self.width))
+        hills = 90 * (1 - math.cos(x / 350)) + 40 * (1 - math.cos(x / 130 + 1.0))
+        return self.height - 20 - ramp * hills
+
+    def create_boundaries(self, step=50):
+        """Создает границы мира: стены по краям и пол, разбитый на чанки рельефа.
+
+        Все чанки сразу добавляются в пространство; в основном цикле
+        update_streaming оставляет из них только ближайшие к камере.
+        """
         thickness = 20
-        # Пол
-        floor = pymunk.Segment(
-            self.space.static_body,
-            (0, self.height - thickness),
-            (self.width, self.height - thickness),
-            thickness
-        )
-        # Левая стена
-        left_wall = pymunk.Segment(
-            self.space.static_body,
-            (0, 0),
-            (0, self.height),
-            thickness
-        )
-        # Правая стена
-        right_wall = pymunk.Segment(
-            self.space.static_body,
-            (self.width, 0),
-            (self.width, self.height),
-            thickness
-        )
-        for wall in [floor, left_wall, right_wall]:
+        world = self.world_rect
+        static_body = self.space.static_body
+        # Левая и правая стены
+        self.walls = [
+            pymunk.Segment(static_body, (world.left, world.top), (world.left, world.bottom), thickness),
+            pymunk.Segment(static_body, (world.right, world.top), (world.right, world.bottom), thickness),
+        ]
+        for wall in self.walls:
             wall.elasticity = 0.8
             wall.friction = 1.0
             self.space.add(wall)
+        # Пол: ломаная с шагом step, ровные участки - одним отрезком
+        self.terrain_chunks = []
+        for left in range(world.left, world.right, self.chunk_width):
+            right = min(left + self.chunk_width, world.right)
+            points = [(x, self.terrain_height(x)) for x in range(left, right + 1, step)]
+            points = [point for i, point in enumerate(points)
+                      if i in (0, len(points) - 1) or not points[i - 1][1] == point[1] == points[i + 1][1]]
+            shapes = []
+            for a, b in zip(points, points[1:]):
+                shape = pymunk.Segment(static_body, a, b, thickness)
+                shape.elasticity = 0.8
+                shape.friction = 1.0
+                shapes.append(shape)
+            chunk = TerrainChunk(left, right, shapes)
+            self.terrain_chunks.append(chunk)
+            self.load_chunk(chunk)
+
+    def load_chunk(self, chunk):
+        """Добавляет отрезки чанка в пространство"""
+        for shape in chunk.shapes:
+            # Пространство могло быть пересоздано, пока чанк лежал вне его
+            shape.body = self.space.static_body
+        self.space.add(*chunk.shapes)
+        chunk.loaded = True
+
+    def unload_chunk(self, chunk):
+        """Убирает отрезки чанка из пространства (лежавшие на нем тела просыпаются)"""
+        self.space.remove(*chunk.shapes)
+        chunk.loaded = False
+
+    def update_streaming(self):
+        """Подгружает чанки рельефа у камеры и замораживает тела вдали от нее.
+
+        Чанки держатся в пространстве с запасом chunk_margin от вида, тела
+        симулируются в пределах lod_margin. Запас чанков больше, поэтому под
+        симулируемыми телами рельеф всегда есть. Проход по телам идет раз в
+        lod_interval кадров и сразу после сдвига камеры, смены набора тел или
+        выгрузки чанка (убранный отрезок будит лежавшие на нем тела).
+        В мире в один экран ничего не подгружается и не замораживается.
+        """
+        if not self.large_world:
+            return
+        left, top, right, bottom = self.camera.view_rect()
+        chunks_changed = False
+        for chunk in self.terrain_chunks:
+            wanted = chunk.right >= left - self.chunk_margin and chunk.left <= right + self.chunk_margin
+            if wanted != chunk.loaded:
+                if wanted:
+                    self.load_chunk(chunk)
+                else:
+                    self.unload_chunk(chunk)
+                chunks_changed = True
+        self.lod_age += 1
+        key = (self.camera.version, self.entities.version)
+        if chunks_changed or key != self.lod_key or self.lod_age >= self.lod_interval:
+            self.lod_key = key
+            self.lod_age = 0
+            self.update_body_lod(self.camera.view_rect(self.lod_margin))
+
+    def update_body_lod(self, region):
+        """Убирает из пространства тела вне области region и возвращает вернувшиеся в нее.
+
+        Замороженное тело сохраняет положение и скорость и продолжает движение,
+        когда камера подходит к нему. Принудительный сон pymunk (body.sleep)
+        здесь не годится: тело, заснувшее в касании с бодрствующими соседями,
+        роняет Chipmunk.
+        """
+        parked = self.lod_parked
+        entities = self.entities.entities
+        if not entities:
+            parked.clear()
+            return
+        positions = self.renderer.current_positions(self.entities)
+        if positions is None:
+            positions = np.array([tuple(body.position) for body in self.entities.bodies()], dtype=float)
+        left, top, right, bottom = region
+        x, y = positions[:, 0], positions[:, 1]
+        far = (x < left) | (x > right) | (y < top) | (y > bottom)
+        leaving = []
+        for row in np.flatnonzero(far).tolist():
+            entity = entities[row]
+            if entity.id not in parked and entity.body is not self.dragging_body:
+                leaving.append(entity)
+        far = far.tolist()
+        returning = [entity for entity in map(self.entities.by_id.get, parked) if entity and not far[entity.row]]
+        if leaving:
+            self.space.remove(*[item for entity in leaving for item in (entity.body, entity.shape)])
+        if returning:
+            self.space.add(*[item for entity in returning for item in (entity.body, entity.shape)])
+        # id удаленных из реестра тел тоже выпадают из набора
+        self.lod_parked = {entity.id for entity in map(self.entities.by_id.get, parked)
+                           if entity and far[entity.row]} | {entity.id for entity in leaving}
+
+    def in_space(self, entities):
+        """Записи, чьи тела сейчас лежат в пространстве (не заморожены вдали от камеры)"""
+        if not self.lod_parked:
+            return entities
+        return [entity for entity in entities if entity.id not in self.lod_parked]
+
+    def static_segments(self):
+        """Все статические отрезки мира: стены и рельеф всех чанков, в пространстве и вне его"""
+        return self.walls + [shape for chunk in self.terrain_chunks for shape in chunk.shapes]
 
     def create_ui(self):
         """Создает элементы интерфейса"""
         button_height = 30
         button_width = 180
         # Кнопки для выбора типа объекта
-        types = ["Шар (1)", "Куб (2)", "Полигон (3)", "Треугольник (4)"]
+        types = ["Шар (1)", "Куб (2)", "Полигон (3)", "Треугольник (4)", "Частицы (5)"]
         for i, text in enumerate(types):
             rect = pygame.Rect(
                 self.width - button_width - 20,
@@ -359,186 +736,527 @@ class PhysicsSandbox:
         for i, (text, param) in enumerate(params):
             rect = pygame.Rect(
                 self.width - button_width - 20,
-                200 + i * (button_height + 10),
+                250 + i * (button_height + 10),
                 button_width,
                 button_height
             )
             self.button_rects.append((param, None, rect, text))
 
-    def add_ball(self, pos, radius=None, mass=None, elasticity=None, friction=None):
-        """Добавляет круглый объект"""
-        radius = radius or self.object_size
-        mass = mass or self.object_mass
-        elasticity = elasticity or self.object_elasticity
-        friction = friction or self.object_friction
-        moment = pymunk.moment_for_circle(mass, 0, radius)
-        body = pymunk.Body(mass, moment)
+    def build_object(self, kind, pos, size=None, vertices=None, mass=None, elasticity=None, friction=None):
+        """Создает тело и форму объекта, не добавляя их в пространство.
+
+        Если в пуле есть тело и форма того же типа, они переиспользуются.
+        Возвращает (тело, форма, вершины); у шара вершин нет (None).
+        """
+        size = size if size is not None else self.object_size
+        mass = mass if mass is not None else self.object_mass
+        elasticity = elasticity if elasticity is not None else self.object_elasticity
+        friction = friction if friction is not None else self.object_friction
+        if kind == KIND_BALL:
+            moment = pymunk.moment_for_circle(mass, 0, size)
+        elif kind == KIND_BOX:
+            half = size / 2
+            vertices = [(-half, -half), (half, -half), (half, half), (-half, half)]
+            moment = pymunk.moment_for_box(mass, (size, size))
+        elif kind == KIND_TRIANGLE:
+            vertices = [(0, -size), (size, size), (-size, size)]
+            moment = pymunk.moment_for_poly(mass, vertices)
+        else:
+            if vertices is None:
+                vertices = []
+                for _ in range(5):
+                    angle = random.uniform(0, 6.28)
+                    radius = random.uniform(size * 0.5, size)
+                    vertices.append((radius * math.cos(angle), radius * math.sin(angle)))
+            moment = None
+        pooled = self.body_pool.acquire(kind)
+        if pooled:
+            body, shape = pooled
+            body.mass = mass
+            body.moment = 1
+            body.angle = 0
+            body.velocity = (0, 0)
+            body.angular_velocity = 0
+            body.force = (0, 0)
+            body.torque = 0
+            if kind == KIND_BALL:
+                shape.unsafe_set_radius(size)
+            else:
+                shape.unsafe_set_vertices(vertices)
+        else:
+            body = pymunk.Body(mass, 1)
+            shape = pymunk.Circle(body, size) if kind == KIND_BALL else pymunk.Poly(body, vertices)
+        if moment is None:
+            # Момент многоугольника считаем по выпуклой оболочке: у случайного обхода он бывает отрицательным
+            vertices = [tuple(v) for v in shape.get_vertices()]
+            moment = pymunk.moment_for_poly(mass, vertices)
+        body.moment = moment
         body.position = pos
-        shape = pymunk.Circle(body, radius)
         shape.elasticity = elasticity
         shape.friction = friction
-        self.space.add(body, shape)
+        return body, shape, vertices
+
+    def build_from_spec(self, kind, pos, radius, vertices, mass, elasticity, friction):
+        """Создает тело и форму по сохраненному описанию объекта (радиус шара или вершины)"""
+        if vertices is not None:
+            vertices = [tuple(vertex) for vertex in np.asarray(vertices, dtype=float).tolist()]
+        return self.build_object(
+            kind if kind == KIND_BALL else KIND_POLYGON, pos, size=radius,
+            vertices=vertices, mass=mass, elasticity=elasticity, friction=friction
+        )
+
+    def add_object(self, kind, pos, **params):
+        """Добавляет объект типа kind в пространство"""
+        body, shape, vertices = self.build_object(kind, pos, **params)
         color = random.choice(self.colors)
-        self.body_colors[body] = color
+        entity = self.entities.add(body, shape, kind, color, vertices)
+        if self.physics_client:
+            self.physics_client.spawn([entity])
+        else:
+            self.space.add(body, shape)
         # Обновляем задание по созданию объектов
-        self.level_system.update_task("Create objects")
+        self.on_object_created(kind)
         return body
 
+    def add_ball(self, pos, radius=None, mass=None, elasticity=None, friction=None):
+        """Добавляет круглый объект"""
+        return self.add_object(KIND_BALL, pos, size=radius, mass=mass, elasticity=elasticity, friction=friction)
+
     def add_box(self, pos, size=None, mass=None, elasticity=None, friction=None):
         """Добавляет квадратный объект"""
-        size = size or self.object_size
-        mass = mass or self.object_mass
-        elasticity = elasticity or self.object_elasticity
-        friction = friction or self.object_friction
-        moment = pymunk.moment_for_box(mass, (size, size))
-        body = pymunk.Body(mass, moment)
-        body.position = pos
-        shape = pymunk.Poly.create_box(body, (size, size))
-        shape.elasticity = elasticity
-        shape.friction = friction
-        self.space.add(body, shape)
-        color = random.choice(self.colors)
-        self.body_colors[body] = color
-        # Обновляем задание по созданию объектов
-        self.level_system.update_task("Create objects")
-        return body
+        return self.add_object(KIND_BOX, pos, size=size, mass=mass, elasticity=elasticity, friction=friction)
 
     def add_polygon(self, pos, vertices=None, mass=None, elasticity=None, friction=None):
         """Добавляет полигональный объект"""
-        mass = mass or self.object_mass
-        elasticity = elasticity or self.object_elasticity
-        friction = friction or self.object_friction
-        if vertices is None:
-            vertices = []
-            for _ in range(5):
-                angle = random.uniform(0, 6.28)
-                radius = random.uniform(self.object_size * 0.5, self.object_size)
-                vertices.append((radius * math.cos(angle), radius * math.sin(angle)))
-        moment = pymunk.moment_for_poly(mass, vertices)
-        body = pymunk.Body(mass, moment)
-        body.position = pos
-        shape = pymunk.Poly(body, vertices)
-        shape.elasticity = elasticity
-        shape.friction = friction
-        self.space.add(body, shape)
-        color = random.choice(self.colors)
-        self.body_colors[body] = color
-        # Обновляем задание по созданию объектов
-        self.level_system.update_task("Create objects")
-        return body
+        return self.add_object(KIND_POLYGON, pos, vertices=vertices, mass=mass,
+                               elasticity=elasticity, friction=friction)
 
     def add_triangle(self, pos, size=None, mass=None, elasticity=None, friction=None):
         """Добавляет треугольный объект"""
-        size = size or self.object_size
-        mass = mass or self.object_mass
-        elasticity = elasticity or self.object_elasticity
-        friction = friction or self.object_friction
-        vertices = [(0, -size), (size, size), (-size, size)]
-        moment = pymunk.moment_for_poly(mass, vertices)
-        body = pymunk.Body(mass, moment)
-        body.position = pos
-        shape = pymunk.Poly(body, vertices)
-        shape.elasticity = elasticity
-        shape.friction = friction
-        self.space.add(body, shape)
-        color = random.choice(self.colors)
-        self.body_colors[body] = color
-        # Обновляем задание по созданию объектов
-        self.level_system.update_task("Create objects")
-        return body
+        return self.add_object(KIND_TRIANGLE, pos, size=size, mass=mass, elasticity=elasticity, friction=friction)
+
+    def spawn_bulk(self, kind, positions, **params):
+        """Создает объекты типа kind во всех положениях positions.
+
+        Все тела и формы добавляются в пространство одним вызовом, а сборщик
+        мусора на время создания отключается, чтобы не было пауз. Положения
+        удобно получать через grid_positions и random_positions.
+        Возвращает список тел.
+        """
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            objects = [self.build_object(kind, pos, **params) for pos in positions]
+            if not objects:
+                return []
+            colors = random.choices(self.colors, k=len(objects))
+            entities = [self.entities.add(body, shape, kind, color, vertices)
+                        for (body, shape, vertices), color in zip(objects, colors)]
+            if self.physics_client:
+                self.physics_client.spawn(entities)
+            else:
+                self.space.add(*(item for body, shape, _ in objects for item in (body, shape)))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self.level_system.emit(EVENT_OBJECT_CREATED, len(objects))
+        self.level_system.emit(EVENT_SHAPE_USED, type=kind)
+        return [body for body, _, _ in objects]
+
+    def on_object_created(self, kind):
+        """Сообщает системе уровней о новом объекте типа kind"""
+        self.level_system.emit(EVENT_OBJECT_CREATED)
+        self.level_system.emit(EVENT_SHAPE_USED, type=kind)
+
+    def update_sleep_state(self):
+        """Отбирает бодрствующие тела и отмечает, успокоилась ли сцена"""
+        if self.lod_parked:
+            bodies = [entity.body for entity in self.in_space(self.entities.entities)]
+        else:
+            bodies = self.entities.bodies()
+        awake_bodies = [body for body in bodies if not body.is_sleeping]
+        self.settled = not awake_bodies and self.dragging_body is None and not self.particles.moving
+        return awake_bodies
+
+    def wake_all(self):
+        """Будит все тела, например после появления нового силового поля"""
+        for body in self.entities.bodies():
+            body.activate()
+
+    def update_speed_tasks(self, bodies=None):
+        """Проверяет скорости тел за один проход.
+
+        Событие посылается, когда тело пересекает порог скорости снизу вверх,
+        поэтому каждое тело проверяется не чаще раза за кадр. bodies - тела для
+        проверки (по умолчанию все); уснувшие тела можно не передавать.
+        """
+        if not self.level_system.wants(EVENT_SPEED_REACHED):
+            return
+        if bodies is None:
+            bodies = self.entities.bodies()
+        if not bodies:
+            self.fast_bodies = set()
+            return
+        velocities = np.array([body.velocity for body in bodies], dtype=float)
+        fast = np.flatnonzero(np.hypot(velocities[:, 0], velocities[:, 1]) > SPEED_TASK_THRESHOLD)
+        fast_bodies = {bodies[i] for i in fast.tolist()}
+        crossed = len(fast_bodies - self.fast_bodies)
+        self.fast_bodies = fast_bodies
+        if crossed:
+            self.level_system.emit(EVENT_SPEED_REACHED, crossed)
 
     def apply_global_forces(self):
-        """Применяет ветер и притяжение ко всем объектам"""
+        """Применяет ветер, притяжение и остальные силовые поля ко всем объектам.
+
+        Поля действуют только на бодрствующие тела, поэтому при смене ветра,
+        притяжения или их включения все тела будятся.
+        """
+        wind = (self.wind_strength * 100, 0)
+        attraction = (0, self.attraction_strength * 100)
+        forces = (self.global_forces_enabled, wind, attraction)
+        if forces != self.applied_forces:
+            self.applied_forces = forces
+            self.wake_all()
         if not self.global_forces_enabled:
             return
-        for body in self.space.bodies:
-            if body.body_type == pymunk.Body.DYNAMIC:
-                body.apply_force_at_local_point((self.wind_strength * 100, 0), (0, 0))
-                body.apply_force_at_local_point((0, self.attraction_strength * 100), (0, 0))
+        self.wind_field.force = wind
+        self.attraction_field.force = attraction
+        self.force_fields.apply(self.entities)
+
+    def add_field_at(self, field_class, pos):
+        """Ставит поле field_class в точку pos; повторное нажатие у того же места убирает его"""
+        for field in self.force_fields.fields:
+            if isinstance(field, PointAttractor) and math.dist(field.center, pos) < 30:
+                self.force_fields.remove(field)
+                if self.physics_client:
+                    self.physics_client.send("call", "add_field_at", (field_class, pos))
+                return None
+        if self.physics_client:
+            self.physics_client.send("call", "add_field_at", (field_class, pos))
+        self.wake_all()
+        return self.force_fields.add(field_class(pos))
+
+    def draw_force_fields(self):
+        """Отмечает центры точечных полей кольцом, возвращает занятые области"""
+        rects = []
+        for field in self.force_fields.fields:
+            if isinstance(field, PointAttractor):
+                color = (255, 128, 0) if isinstance(field, VortexField) else (160, 0, 255)
+                center = self.camera.world_to_screen(field.center)
+                radius = max(1, int(field.radius * self.camera.zoom))
+                rects.append(pygame.draw.circle(self.screen, color, center, radius, 1))
+        return rects
+
+    @property
+    def physics_dt(self):
+        """Длительность одного шага физики"""
+        return 1.0 / (self.fps * self.substeps)
+
+    def store_previous_transforms(self):
+        """Запоминает положения и углы тел перед шагом физики"""
+        self.renderer.capture_previous(self.entities)
+
+    def advance_physics(self, frame_time):
+        """Продвигает физику на прошедшее время фиксированными шагами.
+
+        Время кадра копится в аккумуляторе и расходуется шагами physics_dt.
+        Число догоняющих шагов ограничено, остаток сверх лимита отбрасывается,
+        чтобы медленный кадр не вызывал лавину шагов в следующем.
+        Возвращает число выполненных шагов.
+        """
+        dt = self.physics_dt
+        self.accumulator += frame_time
+        steps = min(int(self.accumulator / dt), self.substeps * self.max_catchup_frames)
+        for i in range(steps):
+            if i == steps - 1:
+                self.store_previous_transforms()
+                self.profiler.mark("step")
+            self.step_physics(dt)
+        if steps:
+            self.step_particles(steps * dt)
+            self.profiler.mark("particles")
+        # Остаток всегда меньше шага, так что render_alpha лежит в [0, 1)
+        self.accumulator = max(self.accumulator - steps * dt, 0.0) % dt
+        self.render_alpha = self.accumulator / dt
+        return steps
+
+    def sync_physics_process(self):
+        """Обменивается данными с процессом физики вместо шага физики в этом процессе"""
+        client = self.physics_client
+        client.set_forces(self.wind_strength, self.attraction_strength, self.global_forces_enabled)
+        for event in client.poll_events():
+            if event[0] == "despawned":
+                by_id = self.entities.by_id
+                self.despawn([by_id[entity_id] for entity_id in event[1] if entity_id in by_id])
+        self.process_state = client.read(self.entities)
+        self.render_alpha = 1.0
+        selected = self.entities.get(self.selected_body) if self.selected_body else None
+        if selected:
+            client.sync_body(selected)
+        crossed = client.speed_crossings(SPEED_TASK_THRESHOLD)
+        if crossed and self.level_system.wants(EVENT_SPEED_REACHED):
+            self.level_system.emit(EVENT_SPEED_REACHED, crossed)
+
+    def apply_quality_tier(self):
+        """Применяет текущую ступень качества к отрисовке и физике"""
+        self.renderer.outlines = self.quality.outlines
+        if not self.physics_client:
+            self.substeps = max(1, self.base_substeps - self.quality.substep_reduction)
+
+    def tune_solver_iterations(self, work_time):
+        """Отдает свободное время кадра решателю вместо ожидания в clock.tick.
+
+        Пока качество снижено, свободное время сначала идет на его
+        восстановление, и лишние итерации не добавляются.
+        """
+        budget = 1.0 / self.fps
+        if work_time < budget * 0.5 and self.quality.tier == 0:
+            self.space.iterations = min(self.max_iterations, self.space.iterations + 2)
+        elif work_time > budget * 0.8:
+            self.space.iterations = max(self.base_iterations, self.space.iterations - 2)
+
+    def step_physics(self, dt):
+        """Один шаг физики: глобальные силы и шаг пространства"""
+        self.apply_global_forces()
+        self.profiler.mark("forces")
+        self.retune_broadphase()
+        start = time.perf_counter()
+        self.space.step(dt)
+        stats = self.step_times.setdefault(self.broadphase, [0.0, 0])
+        stats[0] += time.perf_counter() - start
+        stats[1] += 1
+        self.profiler.mark("step")
+
+    def simulate(self, steps, render_every=0, frame_callback=None):
+        """Прогоняет симуляцию так быстро, как позволяет процессор.
+
+        Шаги не привязаны к clock.tick, поэтому сцена считается быстрее
+        реального времени. При render_every > 0 сцена отрисовывается каждые
+        N шагов, а frame_callback(step) вызывается после каждой отрисовки.
+        Возвращает затраченное время в секундах.
+        """
+        dt = self.physics_dt
+        start = time.perf_counter()
+        for step in range(1, steps + 1):
+            self.step_physics(dt)
+            self.step_particles(dt)
+            if step % self.despawn_interval == 0:
+                self.despawn_out_of_bounds()
+            if render_every and step % render_every == 0:
+                pygame.event.pump()  # Чтобы окно не "зависало" вне безголового режима
+                self.draw_world()
+                pygame.display.flip()
+                if frame_callback:
+                    frame_callback(step)
+        return time.perf_counter() - start
+
+    @property
+    def particle_radius(self):
+        """Радиус частицы при текущем размере объекта"""
+        return max(2.0, self.object_size / 10)
+
+    def add_particles(self, positions):
+        """Создает частицы с текущими настройками объекта в точках мира positions.
+
+        Масса частицы - сотая доля массы объекта, упругость и трение те же.
+        Возвращает число созданных частиц.
+        """
+        rng = np.random.default_rng(random.getrandbits(32))
+        return self.particles.spawn(np.asarray(positions, dtype=float), self.particle_radius,
+                                    self.object_mass / 100, self.object_elasticity, self.object_friction,
+                                    random.choice(self.colors), rng)
+
+    def pour_particles(self, pos):
+        """Насыпает порцию частиц в круг радиуса object_size вокруг точки мира pos.
+
+        За кадр насыпается примерно столько частиц, сколько занимают половину
+        круга, но не больше particles_per_frame.
+        """
+        spread = self.object_size
+        count = min(self.particles_per_frame, max(1, int(0.45 * (spread / self.particle_radius) ** 2)))
+        angle = [random.uniform(0, 2 * math.pi) for _ in range(count)]
+        distance = [spread * math.sqrt(random.random()) for _ in range(count)]
+        positions = np.column_stack((pos[0] + np.multiply(distance, np.cos(angle)),
+                                     pos[1] + np.multiply(distance, np.sin(angle))))
+        return self.add_particles(positions)
+
+    def spawn_particles(self, count, region=None):
+        """Укладывает count частиц сеткой без перекрытий в прямоугольник region мира.
+
+        По умолчанию - верх исходного экрана левее панели инструментов.
+        """
+        left, top, width, height = region or (50, 50, self.width - 300, self.height // 2 - 50)
+        spacing = 2 * self.particle_radius
+        columns = max(1, int(width // spacing))
+        return self.add_particles(grid_positions(count, (left + spacing / 2, top + spacing / 2), spacing, columns))
+
+    def step_particles(self, dt):
+        """Шаг частиц: гравитация, столкновения между собой, с границами и телами.
+
+        В раздельном режиме тела живут в процессе физики, и частицы
+        сталкиваются только со статическими границами мира.
+        """
+        particles = self.particles
+        if not particles.count or dt <= 0:
+            return
+        rows = None
+        if not self.physics_client:
+            if self.lod_parked:
+                rows = np.array([entity.row for entity in self.in_space(self.entities.entities)], dtype=np.intp)
+            else:
+                rows = np.arange(len(self.entities))
+        particles.step(dt, self.space.gravity, self.entities, rows)
+        particles.remove_outside(self.kill_bounds)
+
+    def spawn_random_objects(self, count):
+        """Разбрасывает случайные объекты по верхней части экрана"""
+        region = (50, 50, self.width - 300, self.height // 2 - 50)
+        kinds = random.choices(range(len(KIND_NAMES)), k=count)
+        for kind in range(len(KIND_NAMES)):
+            self.spawn_bulk(kind, random_positions(kinds.count(kind), region))
+
+    def pick_body(self, point):
+        """Динамическое тело под точкой point или None"""
+        if self.physics_client:
+            return self.physics_client.pick(point, self.entities)
+        query = self.space.point_query_nearest(point, 0, pymunk.ShapeFilter())
+        if query and query.shape.body.body_type == pymunk.Body.DYNAMIC:
+            return query.shape.body
+        return None
+
+    def start_drag(self, body, point):
+        """Начинает тянуть тело body за точку point"""
+        self.dragging_body = body
+        if self.physics_client:
+            return
+        self.drag_joint = pymunk.PivotJoint(
+            self.space.static_body,
+            self.dragging_body,
+            (0, 0),
+            self.dragging_body.world_to_local(point)
+        )
+        self.drag_joint.max_force = 50000
+        self.space.add(self.drag_joint)
+
+    def move_drag(self, point):
+        """Переносит точку захвата перетаскиваемого тела"""
+        if self.physics_client:
+            self.physics_client.send("drag", self.dragging_body.entity_id, tuple(point))
+        elif self.drag_joint:
+            self.drag_joint.anchor_b = self.dragging_body.world_to_local(point)
+
+    def stop_drag(self):
+        """Отпускает перетаскиваемое тело"""
+        if self.physics_client:
+            self.physics_client.send("release")
+        elif self.drag_joint:
+            self.space.remove(self.drag_joint)
+        self.drag_joint = None
+        self.dragging_body = None
 
     def handle_dragging(self):
-        """Обрабатывает перетаскивание объектов мышью"""
-        mouse_pos = pygame.mouse.get_pos()
-        mouse_pymunk = pymunk.pygame_util.get_mouse_pos(mouse_pos)
-        if pygame.mouse.get_pressed()[0]:  # ЛКМ зажата
+        """Обрабатывает перетаскивание объектов мышью, а в режиме частиц - их насыпание"""
+        mouse_pymunk = self.camera.screen_to_world(self.frame_input.mouse_pos)
+        if self.object_types[self.current_object_type] == "particles":
+            if self.dragging_body:
+                self.stop_drag()
+            if self.frame_input.mouse_buttons[0] and not self.toolbar_rect.collidepoint(self.frame_input.mouse_pos):
+                self.pour_particles(mouse_pymunk)
+            return
+        if self.frame_input.mouse_buttons[0]:  # ЛКМ зажата
             if not self.dragging_body:
                 # Находим тело под курсором
-                query = self.space.point_query_nearest(
-                    mouse_pymunk, 0, pymunk.ShapeFilter()
-                )
-                if query and query.shape.body.body_type == pymunk.Body.DYNAMIC:
-                    self.dragging_body = query.shape.body
-                    self.drag_joint = pymunk.PivotJoint(
-                        self.space.static_body,
-                        self.dragging_body,
-                        (0, 0),
-                        self.dragging_body.world_to_local(mouse_pymunk)
-                    )
-                    self.drag_joint.max_force = 50000
-                    self.space.add(self.drag_joint)
-        else:
-            if self.dragging_body:
-                self.space.remove(self.drag_joint)
-                self.drag_joint = None
-                self.dragging_body = None
-        if self.drag_joint:
-            self.drag_joint.anchor_b = self.dragging_body.world_to_local(mouse_pymunk)
+                body = self.pick_body(mouse_pymunk)
+                if body:
+                    self.start_drag(body, mouse_pymunk)
+        elif self.dragging_body:
+            self.stop_drag()
+        if self.dragging_body:
+            self.move_drag(mouse_pymunk)
 
     def draw_physics_info(self):
-        """Отображает физические параметры объектов в левом углу"""
+        """Отображает физические параметры объектов в левом углу, возвращает занятые области.
+
+        Текст перерисовывается раз в quality.hud_interval кадров, в остальных
+        кадрах выводятся строки прошлого обновления.
+        """
+        self.hud_age += 1
+        if self.hud_age >= self.quality.hud_interval or not self.hud_lines:
+            self.hud_age = 0
+            self.hud_lines = self.render_hud_lines()
+        return [self.screen.blit(text, pos) for text, pos in self.hud_lines]
+
+    def render_hud_lines(self):
+        """Строки HUD: параметры выбранного объекта и счетчики внизу слева"""
+        lines = []
         # Информация о выбранном объекте
-        if self.selected_body:
-            body = self.selected_body
+        entity = self.entities.get(self.selected_body) if self.selected_body else None
+        if entity:
+            body = entity.body
             velocity = body.velocity
-            shape = next(iter(body.shapes)) if body.shapes else None
             info = [
-                f"Тип: {self.get_shape_type(body)}",
-                f"Масса: {body.mass:.1f}",
+                f"Тип: {KIND_NAMES[entity.kind]}",
+                f"Масса: {entity.mass:.1f}",
                 f"Скорость: ({velocity.x:.1f}, {velocity.y:.1f})",
                 f"Позиция: ({body.position.x:.1f}, {body.position.y:.1f})",
+                f"Упругость: {entity.elasticity:.1f}",
+                f"Трение: {entity.friction:.1f}"
             ]
-            if shape:
-                info.extend([
-                    f"Упругость: {shape.elasticity:.1f}",
-                    f"Трение: {shape.friction:.1f}"
-                ])
             y_offset = 10
             for line in info:
-                text = self.font.render(line, True, (0, 0, 0))
-                self.screen.blit(text, (10, y_offset))
+                lines.append((text_cache.render(self.font, line, (0, 0, 0)), (10, y_offset)))
                 y_offset += 20
+        # Счетчики отсечения и удаления, время шага для каждой широкой фазы
+        color = (0, 0, 0) if self.is_day else (255, 255, 255)
+        counters = (f"Тел: {len(self.entities)}  вне экрана: {self.renderer.culled_count}  "
+                    f"заморожено вдали: {len(self.lod_parked)}  удалено: {self.despawned_count}  "
+                    f"частиц: {len(self.particles)}  масштаб: {self.camera.zoom:.2f}")
+        if self.physics_client:
+            counters += f"  процесс физики: {self.physics_client.rate:.0f} шаг/с"
+        else:
+            counters += (f"  снимки (Z/C/X): {len(self.checkpoints)}, "
+                         f"{self.checkpoints.used_bytes / 2 ** 20:.1f} из {self.checkpoints.max_bytes / 2 ** 20:.0f} МиБ")
+        timings = "  ".join(f"{name}: {ms:.2f} мс" for name, ms in sorted(self.broadphase_report().items()))
+        broadphase = (f"Широкая фаза (H): {self.broadphase}  {timings}  потоки решателя (M): {self.threads}/{MAX_SOLVER_THREADS}  "
+                      f"качество: {self.quality.tier} ({self.quality.name})")
+        lines.append((text_cache.render(self.font, counters, color), (10, self.height - 30)))
+        lines.append((text_cache.render(self.font, broadphase, color), (10, self.height - 50)))
+        return lines
 
     def get_shape_type(self, body):
         """Возвращает тип формы тела"""
-        if not body.shapes:
-            return "Unknown"
-        shape = next(iter(body.shapes))  # Получаем первую форму из множества
-        if isinstance(shape, pymunk.Circle):
-            return "Ball"
-        elif isinstance(shape, pymunk.Poly):
-            if len(shape.get_vertices()) == 3:
-                return "Triangle"
-            elif len(shape.get_vertices()) == 4:
-                return "Box"
-            else:
-                return "Polygon"
-        return "Unknown"
+        entity = self.entities.get(body)
+        return KIND_NAMES[entity.kind] if entity else "Unknown"
 
-    def draw_ui(self):
-        """Отрисовывает элементы интерфейса"""
+    def update_toolbar_layer(self):
+        """Перестраивает слой панели инструментов при смене выбранного типа объекта"""
+        if self.current_object_type == self.toolbar_key:
+            return False
+        self.toolbar_key = self.current_object_type
+        self.toolbar_surface = pygame.Surface(self.toolbar_rect.size)
+        origin = self.toolbar_rect.topleft
         # Панель инструментов
-        pygame.draw.rect(self.screen, (200, 200, 200), self.toolbar_rect)
-        pygame.draw.rect(self.screen, (100, 100, 100), self.toolbar_rect, 2)
+        panel = self.toolbar_surface.get_rect()
+        pygame.draw.rect(self.toolbar_surface, (200, 200, 200), panel)
+        pygame.draw.rect(self.toolbar_surface, (100, 100, 100), panel, 2)
         # Заголовок
-        title = self.large_font.render("Инструменты", True, (0, 0, 0))
-        self.screen.blit(title, (self.toolbar_rect.x + 10, self.toolbar_rect.y + 10))
+        title = text_cache.render(self.large_font, "Инструменты", (0, 0, 0))
+        self.toolbar_surface.blit(title, (10, 10))
         # Кнопки
         for btn_type, btn_id, rect, text in self.button_rects:
+            local_rect = rect.move(-origin[0], -origin[1])
             color = (150, 150, 255) if (btn_type == "type" and btn_id == self.current_object_type) else (200, 200, 200)
-            pygame.draw.rect(self.screen, color, rect)
-            pygame.draw.rect(self.screen, (100, 100, 100), rect, 2)
-            text_surf = self.font.render(text, True, (0, 0, 0))
-            self.screen.blit(text_surf, (rect.x + 10, rect.y + 8))
+            pygame.draw.rect(self.toolbar_surface, color, local_rect)
+            pygame.draw.rect(self.toolbar_surface, (100, 100, 100), local_rect, 2)
+            text_surf = text_cache.render(self.font, text, (0, 0, 0))
+            self.toolbar_surface.blit(text_surf, (local_rect.x + 10, local_rect.y + 8))
+        return True
+
+    def draw_ui(self, surface=None):
+        """Отрисовывает элементы интерфейса"""
+        self.update_toolbar_layer()
+        surface = surface or self.screen
+        return surface.blit(self.toolbar_surface, self.toolbar_rect)
 
     def handle_ui_click(self, pos):
         """Обрабатывает клики по интерфейсу"""
@@ -548,39 +1266,290 @@ class PhysicsSandbox:
                     self.current_object_type = btn_id
                 elif btn_type == "size":
                     self.object_size = max(10, min(100, self.object_size + (
-                        10 if pygame.key.get_mods() & KMOD_SHIFT else 5)))
+                        10 if self.frame_input.mods & KMOD_SHIFT else 5)))
                 elif btn_type == "mass":
                     self.object_mass = max(1, min(100,
-                                                  self.object_mass + (5 if pygame.key.get_mods() & KMOD_SHIFT else 1)))
+                                                  self.object_mass + (5 if self.frame_input.mods & KMOD_SHIFT else 1)))
                 elif btn_type == "elasticity":
                     self.object_elasticity = max(0, min(1, self.object_elasticity + (
-                        0.2 if pygame.key.get_mods() & KMOD_SHIFT else 0.1)))
+                        0.2 if self.frame_input.mods & KMOD_SHIFT else 0.1)))
                 elif btn_type == "friction":
                     self.object_friction = max(0, min(2, self.object_friction + (
-                        0.2 if pygame.key.get_mods() & KMOD_SHIFT else 0.1)))
+                        0.2 if self.frame_input.mods & KMOD_SHIFT else 0.1)))
+
+    def draw_bodies(self):
+        """Отрисовывает динамические объекты, возвращает занятые области"""
+        state = self.process_state if self.physics_client else None
+        return self.renderer.draw(self.screen, self.entities, self.render_alpha, self.selected_body, state,
+                                  self.camera)
+
+    def draw_particles(self):
+        """Отрисовывает частицы, возвращает занятые области"""
+        return self.particles.draw(self.screen, self.camera)
+
+    def draw_boundaries(self, surface=None):
+        """Отрисовывает стены и видимые чанки рельефа через камеру, возвращает занятые области"""
+        surface = surface or self.screen
+        camera = self.camera
+        left, _, right, _ = camera.view_rect()
+        shapes = list(self.walls)
+        for chunk in self.terrain_chunks:
+            if chunk.loaded and chunk.right >= left and chunk.left <= right:
+                shapes.extend(chunk.shapes)
+        return [
+            pygame.draw.line(surface, (0, 0, 0), camera.world_to_screen(shape.a), camera.world_to_screen(shape.b), 3)
+            for shape in shapes
+        ]
+
+    def draw_world(self):
+        """Отрисовывает фон, объекты и границы без интерфейса"""
+        self.draw_background()
+        self.draw_boundaries()
+        self.draw_bodies()
+        self.draw_particles()
+
+    def telemetry_snapshot(self):
+        """Квантованные записи телеметрии всех тел (см. quantize_telemetry)"""
+        colors = self.entities.column("color").reshape(-1, 3)
+        if self.physics_client:
+            rows, targets = self.physics_client.rows, self.physics_client.targets
+            if rows is None:
+                return quantize_telemetry(np.zeros(0), np.zeros((0, 5)), np.zeros((0, 3)))
+            known = targets >= 0
+            return quantize_telemetry(rows[known, 0], rows[known, 2:7], colors[targets[known]])
+        ids = self.entities.column("id")
+        state = np.array([(*body.position, body.angle, *body.velocity) for body in self.entities.bodies()],
+                         dtype=float).reshape(-1, 5)
+        return quantize_telemetry(ids, state, colors)
+
+    def apply_remote_commands(self):
+        """Выполняет команды клиентов телеметрии; возвращает True, если команды были"""
+        commands = self.telemetry.poll_commands()
+        spawners = {
+            "ball": self.add_ball, "box": self.add_box,
+            "polygon": self.add_polygon, "triangle": self.add_triangle,
+        }
+        for command in commands:
+            if command[0] == "spawn":
+                spawners[command[1]](command[2:])
+            elif command[0] == "clear":
+                self.clear_all_objects()
+            elif command[0] == "wind":
+                self.wind_strength = command[1]
+            elif command[0] == "attraction":
+                self.attraction_strength = command[1]
+        return bool(commands)
+
+    def despawn(self, entities):
+        """Удаляет объекты из пространства и реестра вместе со ссылками на них"""
+        bodies = {entity.body for entity in entities}
+        if self.dragging_body in bodies:
+            self.stop_drag()
+        if self.selected_body in bodies:
+            self.selected_body = None
+        objects = []
+        for entity in self.in_space(entities):
+            objects.append(entity.body)
+            objects.append(entity.shape)
+        for entity in entities:
+            self.body_pool.release(entity.kind, entity.body, entity.shape)
+        if not self.physics_client and objects:
+            self.space.remove(*objects)
+        for entity in entities:
+            self.entities.remove(entity)
+        self.fast_bodies -= bodies
+        self.despawned_count += len(entities)
+
+    def despawn_out_of_bounds(self, positions=None):
+        """Удаляет тела, вылетевшие за пределы kill_bounds, и возвращает их число.
+
+        positions - уже собранные положения тел в порядке реестра (если есть).
+        """
+        if not len(self.entities):
+            return 0
+        if positions is None:
+            positions = np.array([tuple(body.position) for body in self.entities.bodies()], dtype=float)
+        x, y = positions[:, 0], positions[:, 1]
+        bounds = self.kill_bounds
+        outside = np.flatnonzero((x < bounds.left) | (x >= bounds.right) | (y < bounds.top) | (y >= bounds.bottom))
+        if len(outside):
+            entities = self.entities.entities
+            self.despawn([entities[i] for i in outside.tolist()])
+        return len(outside)
+
+    def save_scene(self, path):
+        """Сохраняет все тела сцены в файл; возвращает его размер в байтах.
+
+        В раздельном режиме тела симулирует процесс физики, поэтому копии
+        тел сначала получают его последнее опубликованное состояние.
+        """
+        if self.physics_client:
+            self.physics_client.sync_bodies(self.entities)
+        return write_scene(path, self.entities)
+
+    def load_scene(self, path):
+        """Заменяет сцену телами из файла.
+
+        Файл отображается в память, моменты инерции считаются сразу для всех
+        тел, а тела и формы добавляются в пространство одним вызовом (сборщик
+        мусора на это время отключен, как в spawn_bulk). Возвращает число тел.
+        """
+        scene = read_scene(path)
+        self.clear_all_objects()
+        moments = scene_moments(scene).tolist()
+        offsets = scene["vertex_offset"].tolist()
+        vertices = scene["vertices"].tolist()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            entities = []
+            objects = []
+            for index, (kind, color, position, angle, velocity, spin, mass, elasticity, friction,
+                        radius, moment) in enumerate(zip(
+                    scene["kind"].tolist(), scene["color"].tolist(), scene["position"].tolist(),
+                    scene["angle"].tolist(), scene["velocity"].tolist(), scene["spin"].tolist(),
+                    scene["mass"].tolist(), scene["elasticity"].tolist(), scene["friction"].tolist(),
+                    scene["radius"].tolist(), moments)):
+                body = pymunk.Body(mass, moment)
+                body.position = position
+                body.angle = angle
+                body.velocity = velocity
+                body.angular_velocity = spin
+                if kind == KIND_BALL:
+                    shape = pymunk.Circle(body, radius)
+                    polygon = None
+                else:
+                    polygon = [tuple(vertex) for vertex in vertices[offsets[index]:offsets[index + 1]]]
+                    shape = pymunk.Poly(body, polygon)
+                shape.elasticity = elasticity
+                shape.friction = friction
+                entities.append(self.entities.add(body, shape, kind, tuple(color), polygon))
+                objects += (body, shape)
+            if self.physics_client:
+                self.physics_client.spawn(entities)
+            elif objects:
+                self.space.add(*objects)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return len(entities)
+
+    def capture_checkpoint(self):
+        """Снимает текущее состояние всех тел"""
+        entities = self.entities
+        specs_bytes = 0
+        if self.checkpoint_version != entities.version:
+            self.checkpoint_version = entities.version
+            self.checkpoint_specs = [
+                (entity.kind, entity.color, entity.radius, entity.vertices,
+                 entity.mass, entity.elasticity, entity.friction)
+                for entity in entities
+            ]
+            specs_bytes = sum(100 + (entity.vertices.nbytes if entity.vertices is not None else 0)
+                              for entity in entities)
+        ids = np.array([entity.id for entity in entities], dtype=np.int64)
+        state = np.array([(*body.position, body.angle, *body.velocity, body.angular_velocity)
+                          for body in entities.bodies()], dtype=float).reshape(-1, 6)
+        return Checkpoint(ids, state, self.checkpoint_specs, specs_bytes)
+
+    def restore_checkpoint(self, checkpoint):
+        """Возвращает сцену к снимку.
+
+        Если с момента снимка набор тел не менялся, состояние просто
+        записывается в существующие тела. Иначе пространство заменяется
+        целиком: новые тела создаются по описаниям и добавляются одним
+        вызовом, а старое пространство отбрасывается вместе с телами, без
+        поштучного удаления.
+        """
+        if self.dragging_body:
+            self.stop_drag()
+        selected = self.entities.get(self.selected_body) if self.selected_body else None
+        current_ids = np.array([entity.id for entity in self.entities], dtype=np.int64)
+        if np.array_equal(current_ids, checkpoint.ids):
+            for body, (x, y, angle, vx, vy, spin) in zip(self.entities.bodies(), checkpoint.state.tolist()):
+                body.position = (x, y)
+                body.angle = angle
+                body.velocity = (vx, vy)
+                body.angular_velocity = spin
+                body.activate()
+        else:
+            old_space = self.space
+            space = self.create_space()
+            space.iterations = old_space.iterations
+            # Выгруженные чанки рельефа не лежат в пространстве и переносятся при загрузке
+            static_shapes = [shape for shape in old_space.shapes if shape.body is old_space.static_body]
+            old_space.remove(*static_shapes)
+            for shape in static_shapes:
+                shape.body = space.static_body
+            self.space = space
+            self.hash_params = None
+            self.broadphase_version = None
+            self.entities.clear()
+            self.lod_parked.clear()
+            objects = list(static_shapes)
+            for entity_id, (kind, color, radius, vertices, mass, elasticity, friction), row in zip(
+                    checkpoint.ids.tolist(), checkpoint.specs, checkpoint.state.tolist()):
+                body, shape, vertices = self.build_from_spec(
+                    kind, (row[0], row[1]), radius, vertices, mass, elasticity, friction
+                )
+                body.angle = row[2]
+                body.velocity = (row[3], row[4])
+                body.angular_velocity = row[5]
+                self.entities.add(body, shape, kind, color, vertices, entity_id=entity_id)
+                objects += (body, shape)
+            self.retune_broadphase()
+            space.add(*objects)
+        self.fast_bodies = set()
+        self.lod_key = None  # Восстановленные тела бодрствуют - пересчитать сон удаленных
+        restored = self.entities.by_id.get(selected.id) if selected else None
+        self.selected_body = restored.body if restored else None
+
+    def rewind(self):
+        """Отматывает сцену на один снимок назад; возвращает False, если снимков нет"""
+        checkpoint = self.checkpoints.pop()
+        if checkpoint is None:
+            return False
+        self.restore_checkpoint(checkpoint)
+        return True
 
     def clear_all_objects(self):
-        """Полностью удаляет все физические объекты"""
-        # Удаляем все динамические тела
-        for body in list(self.space.bodies):
-            if body.body_type == pymunk.Body.DYNAMIC:  # Используем body_type вместо is_static
-                self.space.remove(body)
-        # Удаляем все динамические формы (на всякий случай)
-        for shape in list(self.space.shapes):
-            if shape.body and shape.body.body_type != pymunk.Body.STATIC:
-                self.space.remove(shape)
-        self.body_colors.clear()
+        """Полностью удаляет все физические объекты.
+
+        Тела и формы убираются из пространства одним вызовом и попадают в пул
+        для повторного использования.
+        """
+        if self.dragging_body:
+            self.stop_drag()
+        objects = []
+        for entity in self.in_space(self.entities.entities):
+            objects.append(entity.body)
+            objects.append(entity.shape)
+        for entity in self.entities:
+            self.body_pool.release(entity.kind, entity.body, entity.shape)
+        if self.physics_client:
+            self.physics_client.send("call", "clear_all_objects", ())
+        elif objects:
+            self.space.remove(*objects)
+        self.entities.clear()
+        self.particles.clear()
+        self.fast_bodies = set()
+        self.lod_parked.clear()
         self.selected_body = None
         self.dragging_body = None
-        if self.drag_joint:
-            self.space.remove(self.drag_joint)
-            self.drag_joint = None
-
 
     def run(self):
         """Основной цикл приложения"""
         while self.running:
-            events = pygame.event.get()
+            frame_start = time.perf_counter()
+            self.profiler.begin_frame()
+            idle = False
+            frame = self.frame_input = self.input.poll(self)
+            if self.input.replaying:
+                self.space.iterations = frame.iterations
+                if self.quality.set_tier(frame.quality):
+                    self.apply_quality_tier()
+            frame_time = frame.dt
+            events = frame.events
             for event in events:
                 if event.type == pygame.QUIT:
                     self.running = False
@@ -589,38 +1558,41 @@ class PhysicsSandbox:
                 action = self.main_menu.handle_events(events)
                 if action == "NEW GAME":
                     self.show_menu = False
+                    self.compositor.invalidate()
                 elif action == "EXIT":
                     self.running = False
                 # Отрисовка главного меню
                 self.main_menu.draw()
+                self.profiler.mark("events")
+                pygame.display.flip()
             else:
                 # Основной игровой цикл
                 for event in events:
                     # Добавление объектов по клику мыши
                     if event.type == pygame.MOUSEBUTTONDOWN:
-                        mouse_pos = pygame.mouse.get_pos()
+                        mouse_pos = frame.mouse_pos
                         if event.button == 1:  # ЛКМ
                             if self.toolbar_rect.collidepoint(mouse_pos):
                                 self.handle_ui_click(mouse_pos)
                             else:
-                                # Создание объекта
+                                # Создание объекта в точке мира под курсором
+                                world_pos = self.camera.screen_to_world(mouse_pos)
                                 obj_type = self.object_types[self.current_object_type]
                                 if obj_type == "ball":
-                                    self.add_ball(mouse_pos)
+                                    self.add_ball(world_pos)
                                 elif obj_type == "box":
-                                    self.add_box(mouse_pos)
+                                    self.add_box(world_pos)
                                 elif obj_type == "polygon":
-                                    self.add_polygon(mouse_pos)
+                                    self.add_polygon(world_pos)
                                 elif obj_type == "triangle":
-                                    self.add_triangle(mouse_pos)
+                                    self.add_triangle(world_pos)
                         elif event.button == 3:  # ПКМ
                             # Выбор объекта для просмотра параметров
-                            mouse_pymunk = pymunk.pygame_util.get_mouse_pos(mouse_pos)
-                            query = self.space.point_query_nearest(
-                                mouse_pymunk, 0, pymunk.ShapeFilter()
-                            )
-                            if query and query.shape.body.body_type == pymunk.Body.DYNAMIC:
-                                self.selected_body = query.shape.body
+                            body = self.pick_body(self.camera.screen_to_world(mouse_pos))
+                            if body:
+                                self.selected_body = body
+                        elif event.button in (4, 5):  # Колесо мыши - масштаб вокруг курсора
+                            self.camera.zoom_at(mouse_pos, 1.1 if event.button == 4 else 1 / 1.1)
                     # Обработка клавиш
                     elif event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_ESCAPE:
@@ -631,6 +1603,34 @@ class PhysicsSandbox:
                             self.clear_all_objects()
                         elif event.key == pygame.K_g:
                             self.global_forces_enabled = not self.global_forces_enabled
+                        elif event.key == pygame.K_h:
+                            # Переключение широкой фазы: дерево <-> пространственный хеш
+                            self.set_broadphase("hash" if self.broadphase == "tree" else "tree")
+                        elif event.key == pygame.K_F3:
+                            # График фаз кадра; таймеры включаются вместе с ним
+                            self.profiler.toggle_overlay()
+                        elif event.key == pygame.K_F4 and self.profiler.frames:
+                            self.profiler.export_csv("profile.csv")
+                        elif event.key == pygame.K_F5:
+                            self.save_scene(self.scene_path)
+                        elif event.key == pygame.K_F9 and os.path.exists(self.scene_path):
+                            self.load_scene(self.scene_path)
+                        elif event.key == pygame.K_c and not self.physics_client:
+                            # Сохранение контрольной точки
+                            self.saved_checkpoint = self.capture_checkpoint()
+                        elif event.key == pygame.K_x and self.saved_checkpoint:
+                            # Мгновенный возврат к контрольной точке
+                            self.restore_checkpoint(self.saved_checkpoint)
+                            self.checkpoints.clear()
+                        elif event.key == pygame.K_m:
+                            # Переключение решателя: один поток <-> два потока
+                            self.set_threads(1 if self.threads > 1 else 2)
+                        elif event.key == pygame.K_b:
+                            # Точечный аттрактор под курсором
+                            self.add_field_at(PointAttractor, self.camera.screen_to_world(frame.mouse_pos))
+                        elif event.key == pygame.K_v:
+                            # Вихрь под курсором
+                            self.add_field_at(VortexField, self.camera.screen_to_world(frame.mouse_pos))
                         elif event.key == pygame.K_1:
                             self.current_object_type = 0  # Шар
                         elif event.key == pygame.K_2:
@@ -639,6 +1639,11 @@ class PhysicsSandbox:
                             self.current_object_type = 2  # Полигон
                         elif event.key == pygame.K_4:
                             self.current_object_type = 3  # Треугольник
+                        elif event.key == pygame.K_5:
+                            self.current_object_type = 4  # Частицы
+                        elif event.key == pygame.K_HOME:
+                            # Исходный вид камеры
+                            self.camera.reset()
                         elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
                             self.object_size = min(100, self.object_size + 5)
                         elif event.key == pygame.K_MINUS:
@@ -656,75 +1661,278 @@ class PhysicsSandbox:
                         elif event.key == pygame.K_y:
                             self.object_friction = max(0, self.object_friction - 0.1)
                 # Управление ветром и притяжением
-                keys = pygame.key.get_pressed()
-                if keys[pygame.K_w]:
+                keys = frame.keys
+                steering = bool(keys)
+                if pygame.K_w in keys:
                     self.wind_strength += 0.1
-                if keys[pygame.K_s]:
+                if pygame.K_s in keys:
                     self.wind_strength -= 0.1
-                if keys[pygame.K_a]:
+                if pygame.K_a in keys:
                     self.attraction_strength -= 0.1
-                if keys[pygame.K_d]:
+                if pygame.K_d in keys:
                     self.attraction_strength += 0.1
-                # Обновление цикла день/ночь
-                self.update_day_night_cycle()
-                # Отрисовка фона
-                self.draw_background()
-                # Отрисовка объектов
-                for body, color in self.body_colors.items():
-                    border_color = (255, 255, 0) if body == self.selected_body else (0, 0, 0)
-                    for shape in body.shapes:
-                        if isinstance(shape, pymunk.Circle):
-                            pygame.draw.circle(
-                                self.screen, color,
-                                (int(body.position.x), int(body.position.y)),
-                                int(shape.radius), 0
-                            )
-                            pygame.draw.circle(
-                                self.screen, border_color,
-                                (int(body.position.x), int(body.position.y)),
-                                int(shape.radius), 2
-                            )
-                        elif isinstance(shape, pymunk.Poly):
-                            vertices = [v.rotated(body.angle) + body.position for v in shape.get_vertices()]
-                            pygame.draw.polygon(self.screen, color, vertices)
-                            pygame.draw.polygon(self.screen, border_color, vertices, 2)
-                # Отрисовка статических объектов (границ)
-                for shape in self.space.static_body.shapes:
-                    if isinstance(shape, pymunk.Segment):
-                        pygame.draw.line(
-                            self.screen, (0, 0, 0),
-                            shape.a, shape.b,
-                            3
-                        )
-                # Применение глобальных сил
-                self.apply_global_forces()
+                # Камера: стрелки и перетаскивание средней кнопкой мыши
+                pan_x = (pygame.K_RIGHT in keys) - (pygame.K_LEFT in keys)
+                pan_y = (pygame.K_DOWN in keys) - (pygame.K_UP in keys)
+                if pan_x or pan_y:
+                    self.camera.pan(pan_x * 15, pan_y * 15)
+                if frame.mouse_buttons[1]:
+                    if self.pan_anchor:
+                        self.camera.pan(self.pan_anchor[0] - frame.mouse_pos[0],
+                                        self.pan_anchor[1] - frame.mouse_pos[1])
+                    self.pan_anchor = frame.mouse_pos
+                    steering = True
+                else:
+                    self.pan_anchor = None
+                # Сцена успокоилась и ввода нет - цикл переходит на частоту idle_fps
+                idle = self.power_saving and self.settled and not events and not steering
+                # Команды удаленных клиентов (при воспроизведении записи не принимаются)
+                if self.telemetry and not self.input.replaying and self.apply_remote_commands():
+                    idle = False
+                self.profiler.mark("events")
                 # Перетаскивание объектов
                 self.handle_dragging()
-                # Отображение информации и интерфейса
-                self.draw_physics_info()
-                self.draw_next_object_info()
-                self.draw_ui()
-                # Проверка скорости для задания
-                for body in self.space.bodies:
-                    if body.body_type == pymunk.Body.DYNAMIC:
-                        velocity = math.hypot(body.velocity.x, body.velocity.y)
-                        if velocity > 100:
-                            self.level_system.update_task("Reach speed 100")
-                        # Проверка использования разных форм
-                        shape_type = self.get_shape_type(body)
-                        self.level_system.update_task("Use all shapes", {"type": shape_type})
-                # Отображение прогресса уровня и заданий по центру
-                self.level_system.draw_progress(self.screen, self.large_font, self.is_day)
-                # Обновление физики
-                dt = 1.0 / self.fps
-                self.space.step(dt)
-            # Обновление экрана
-            pygame.display.flip()
-            self.clock.tick(self.fps)
+                self.profiler.mark("dragging")
+                # Обновление физики фиксированными шагами (вместе с глобальными силами)
+                # или чтение состояния, опубликованного процессом физики.
+                # Пока зажата Z, сцена вместо шага отматывается по снимкам назад
+                if self.physics_client:
+                    self.sync_physics_process()
+                    self.profiler.mark("step")
+                    # Нулевой кадр (например, QUIT в конце записи) частицы не двигает
+                    if frame_time > 0:
+                        self.step_particles(min(frame_time, 0.25))
+                        self.profiler.mark("particles")
+                elif pygame.K_z in keys:
+                    self.rewind()
+                else:
+                    # Перед шагом: чанки рельефа у камеры и сон удаленных тел
+                    self.update_streaming()
+                    self.advance_physics(min(frame_time, 0.25))
+                    self.frame_count += 1
+                    if self.frame_count % self.checkpoint_interval == 0:
+                        self.checkpoints.push(self.capture_checkpoint())
+                self.profiler.mark("step")
+                # Обновление цикла день/ночь (в простое - с тем же темпом, что и при 60 FPS)
+                self.update_day_night_cycle(self.fps // self.idle_fps if idle else 1)
+                self.profiler.mark("background")
+                # Проверка скорости для заданий - только по бодрствующим телам
+                if not self.physics_client:
+                    self.update_speed_tasks(self.update_sleep_state())
+                self.profiler.mark("tasks")
+                if self.telemetry and self.telemetry.due():
+                    self.telemetry.publish(self.frame_count, self.telemetry_snapshot())
+                self.profiler.mark("telemetry")
+                background_changed = self.update_background_layer()
+                sun_position = self.day_night.sun_position
+                # В простое кадр перерисовывается, только если сдвинулись небо или солнце
+                if not idle or background_changed or sun_position != self.last_sun_position:
+                    self.last_sun_position = sun_position
+                    # Отрисовка фона: закэшированный слой неба, звезд, границ и панелей
+                    self.compositor.begin(self.background_surface, background_changed)
+                    self.compositor.mark(self.draw_sun_moon())
+                    self.compositor.mark_all(self.draw_boundaries())
+                    self.profiler.mark("background")
+                    # Отрисовка объектов и силовых полей
+                    self.compositor.mark_all(self.draw_bodies())
+                    self.compositor.mark_all(self.draw_particles())
+                    if not self.physics_client:
+                        self.despawn_out_of_bounds(self.renderer.current_positions(self.entities))
+                    self.profiler.mark("bodies")
+                    self.compositor.mark_all(self.draw_force_fields())
+                    self.profiler.mark("fields")
+                    # Отображение информации и интерфейса
+                    self.compositor.mark_all(self.draw_physics_info())
+                    self.profiler.mark("hud")
+                    # Отображение прогресса уровня и заданий по центру
+                    self.compositor.mark_all(
+                        self.level_system.draw_progress(self.screen, self.large_font, self.is_day)
+                    )
+                    self.profiler.mark("progress")
+                    if self.profiler.overlay:
+                        self.compositor.mark_all(self.profiler.draw(self.screen, self.font))
+                        self.profiler.mark("overlay")
+                    if not idle and not self.input.replaying:
+                        work_time = time.perf_counter() - frame_start
+                        self.tune_solver_iterations(work_time)
+                        if self.quality.update(work_time):
+                            self.apply_quality_tier()
+                    # Обновление только измененных областей экрана
+                    self.compositor.present()
+                    self.profiler.mark("present")
+                # Сцена в покое - нагрузки нет, качество восстанавливается в обычном темпе
+                if idle and not self.input.replaying and self.quality.update(0.0, self.fps // self.idle_fps):
+                    self.apply_quality_tier()
+            if not self.input.replaying:
+                self.clock.tick(self.idle_fps if idle else self.fps)
+            self.profiler.mark("wait")
+            self.profiler.end_frame()
+        self.input.close()
+        if self.physics_client:
+            self.physics_client.close()
+        if self.telemetry:
+            self.telemetry.close()
         pygame.quit()
         sys.exit()
 
 
+def parse_args(argv=None):
+    """Разбирает аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Физическая песочница")
+    parser.add_argument("--headless", action="store_true",
+                        help="симуляция без окна и без ограничения частоты кадров")
+    parser.add_argument("--steps", type=int, default=600,
+                        help="число шагов физики в безголовом режиме")
+    parser.add_argument("--spawn", type=int, default=0,
+                        help="число случайных объектов в начальной сцене")
+    parser.add_argument("--substeps", type=int, default=3,
+                        help="число шагов физики на кадр")
+    parser.add_argument("--day-speed", type=float, default=1.0,
+                        help="скорость цикла день/ночь (шагов цикла за кадр)")
+    parser.add_argument("--render-every", type=int, default=0,
+                        help="отрисовывать сцену каждые N шагов (0 - не рисовать)")
+    parser.add_argument("--frames-dir", default=None,
+                        help="каталог для сохранения отрисованных кадров")
+    parser.add_argument("--broadphase", choices=("tree", "hash"), default="tree",
+                        help="широкая фаза: дерево рамок или пространственный хеш")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="число потоков решателя: pymunk использует не больше 2, а выигрыш от "
+                             "второго зависит от сцены и машины - проверьте --bench-threads")
+    parser.add_argument("--load-scene", default=None,
+                        help="начать с сцены из файла")
+    parser.add_argument("--save-scene", default=None,
+                        help="сохранить сцену в файл после безголового прогона")
+    parser.add_argument("--checkpoint-mb", type=float, default=32,
+                        help="память под снимки для перемотки, МиБ")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="зерно random (по умолчанию случайное)")
+    parser.add_argument("--record", default=None,
+                        help="записывать зерно и ввод каждого кадра в файл")
+    parser.add_argument("--replay", default=None,
+                        help="воспроизвести записанную сессию (с --headless - без окна)")
+    parser.add_argument("--profile", action="store_true",
+                        help="включить таймеры фаз кадра с самого запуска")
+    parser.add_argument("--telemetry", type=int, default=None, metavar="PORT",
+                        help="запустить сервер телеметрии и управления на TCP-порту")
+    parser.add_argument("--telemetry-host", default="127.0.0.1", help="адрес сервера телеметрии")
+    parser.add_argument("--telemetry-rate", type=float, default=20,
+                        help="частота кадров телеметрии, Гц")
+    parser.add_argument("--quality", default="auto",
+                        choices=["auto"] + [str(tier) for tier in range(len(QualityGovernor.TIERS))],
+                        help="ступень качества: auto - подбирать по времени кадра, 0-4 - закрепить")
+    parser.add_argument("--large-world", action="store_true",
+                        help="мир 16x4 экранов с рельефом, подгрузкой чанков и заморозкой далеких тел")
+    parser.add_argument("--split", action="store_true",
+                        help="считать физику в отдельном процессе")
+    parser.add_argument("--bench-threads", action="store_true",
+                        help="сравнить время шага с одним и двумя потоками решателя (больше 2 pymunk не использует)")
+    parser.add_argument("--sweep", action="append", default=[], metavar="ПАРАМЕТР=V1,V2,...",
+                        help="перебор параметра (mass, elasticity, friction, size); можно повторять")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="stack",
+                        help="расстановка объектов для перебора")
+    parser.add_argument("--kind", choices=[name.lower() for name in KIND_NAMES], default="box",
+                        help="тип объектов для перебора")
+    parser.add_argument("--sample-every", type=int, default=10,
+                        help="шагов между замерами энергии при переборе")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов для перебора (по умолчанию - все ядра)")
+    parser.add_argument("--output", default="sweep.csv",
+                        help="файл результатов перебора: .csv или .npy")
+    return parser.parse_args(argv)
+
+
+def run_headless(args):
+    """Безголовый прогон: сцена считается быстрее реального времени"""
+    sandbox = PhysicsSandbox(headless=True, substeps=args.substeps, day_speed=args.day_speed,
+                             broadphase=args.broadphase, threads=args.threads, large_world=args.large_world)
+    if args.load_scene:
+        start = time.perf_counter()
+        count = sandbox.load_scene(args.load_scene)
+        print(f"loaded {count} bodies from {args.load_scene} in {time.perf_counter() - start:.3f} s")
+    sandbox.spawn_random_objects(args.spawn)
+
+    def save_frame(step):
+        pygame.image.save(sandbox.screen, os.path.join(args.frames_dir, f"frame_{step:06d}.png"))
+
+    if args.frames_dir:
+        os.makedirs(args.frames_dir, exist_ok=True)
+    elapsed = sandbox.simulate(
+        args.steps, args.render_every,
+        frame_callback=save_frame if args.frames_dir else None
+    )
+    rate = args.steps / elapsed if elapsed > 0 else float("inf")
+    print(f"{args.steps} steps in {elapsed:.3f} s ({rate:.0f} steps/s), "
+          f"{len(sandbox.entities)} bodies, {sandbox.despawned_count} despawned")
+    for name, ms in sandbox.broadphase_report().items():
+        print(f"{name}: {ms:.3f} ms per space step")
+    if args.save_scene:
+        size = sandbox.save_scene(args.save_scene)
+        print(f"saved {len(sandbox.entities)} bodies to {args.save_scene} ({size} bytes)")
+    pygame.quit()
+
+
+def run_thread_benchmark(args, counts=(250, 500, 1000, 2000, 4000), warmup=60):
+    """Сравнивает среднее время шага пространства с одним и двумя потоками решателя.
+
+    Для каждого числа тел строится одна и та же сетка ящиков, после разгона
+    в warmup шагов замеряются args.steps шагов.
+    """
+    print("bodies  1 thread ms  2 threads ms  speedup")
+    for count in counts:
+        timings = []
+        for threads in (1, 2):
+            sandbox = PhysicsSandbox(headless=True, substeps=args.substeps,
+                                     broadphase=args.broadphase, threads=threads)
+            # Сетка стоит на полу: верхние ряды при больших count начинаются выше экрана
+            columns = max(1, (sandbox.width - 100) // 22)
+            top = sandbox.height - 40 - (count // columns + 1) * 22
+            sandbox.spawn_bulk(KIND_BOX, grid_positions(count, (50, top), 22, columns), size=20)
+            sandbox.simulate(warmup)
+            sandbox.step_times.clear()
+            sandbox.simulate(args.steps)
+            timings.append(sandbox.broadphase_report()[args.broadphase])
+        print(f"{count:6d}  {timings[0]:11.3f}  {timings[1]:12.3f}  {timings[0] / timings[1]:7.2f}")
+    pygame.quit()
+
+
 if __name__ == "__main__":
-    sandbox = PhysicsSandbox()
-    sandbox.run()
\ No newline at end of file
+    args = parse_args()
+    if args.sweep:
+        run_sweep(args)
+    elif args.bench_threads:
+        run_thread_benchmark(args)
+    elif args.headless and not args.replay:
+        run_headless(args)
+    else:
+        # Зерно выставляется до создания песочницы: от него зависят звезды, фон меню и задания
+        if args.replay:
+            seed = ReplayInput.read_seed(args.replay)
+            if args.headless:
+                os.environ["SDL_VIDEODRIVER"] = "dummy"
+        else:
+            seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+        random.seed(seed)
+        sandbox = PhysicsSandbox(substeps=args.substeps, day_speed=args.day_speed,
+                                 broadphase=args.broadphase, threads=args.threads, split=args.split,
+                                 large_world=args.large_world)
+        sandbox.checkpoints.max_bytes = int(args.checkpoint_mb * 2 ** 20)
+        if args.load_scene:
+            sandbox.scene_path = args.load_scene
+            sandbox.load_scene(args.load_scene)
+        sandbox.profiler.enabled = args.profile
+        if args.quality != "auto":
+            sandbox.quality.enabled = False
+            sandbox.quality.set_tier(min(int(args.quality), sandbox.quality.max_tier))
+            sandbox.apply_quality_tier()
+        if args.telemetry is not None:
+            sandbox.telemetry = TelemetryServer(args.telemetry_host, args.telemetry, args.telemetry_rate)
+        if args.replay:
+            sandbox.input = ReplayInput(args.replay)
+        elif args.record:
+            sandbox.input = InputRecorder(args.record, seed)
+        try:
+            sandbox.run()
+        finally:
+            summary = sandbox.input.summary() if args.replay else None
+            if summary:
+                print(summary)
\ No newline at end of file
@@ -0,0 +1,669 @@
+"""Легкие частицы (песок, гранулы) в массивах NumPy"""
+
+import math
+
+import numpy as np
+import pygame
+
+
+def expand_ranges(starts, ends):
+    """Разворачивает диапазоны [starts[k], ends[k]) в пары массивов (номер диапазона, элемент)"""
+    counts = np.maximum(ends - starts, 0)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    items = np.arange(int(counts.sum())) + np.repeat(starts - first, counts)
+    return owner, items
+
+
+class ParticleSystem:
+    """Легкие частицы (песок, гранулы) в массивах NumPy.
+
+    Частица - элемент одномерных массивов координат, скоростей, радиуса,
+    обратной массы, упругости, трения и цвета, без тела pymunk. На каждом
+    подшаге частицы сортируются по клеткам равномерной сетки с клеткой в
+    диаметр самой крупной частицы, и массивы переставляются в этом порядке:
+    соседи лежат подряд, а на следующем подшаге порядок почти не меняется.
+    Пары для проверки набираются из своей клетки и четырех соседних
+    (половина окрестности - каждая пара попадает один раз).
+
+    Контакты разрешаются по положениям: перекрывшиеся частицы несколько раз
+    раздвигаются, а их проскальзывание друг по другу гасится трением (все
+    поправки частицы усредняются, так что плотная куча не раскачивается).
+    Затем касающимся парам поправляется скорость: отскок и трение;
+    упругость и трение пары перемножаются, как у форм pymunk. Так решаются
+    и столкновения со статическими отрезками, и с телами pymunk.
+
+    Частица, пролежавшая без движения sleep_steps шагов, засыпает: она не
+    движется и не выталкивается, а пары набираются только в клетках рядом
+    с бодрствующими частицами. Будят ее быстрый сосед, движущееся тело или
+    исчезновение тел, на которых мог лежать песок.
+    """
+
+    FIELDS = ("x", "y", "vx", "vy", "radius", "inv_mass", "elasticity", "friction", "color", "rest")
+
+    def __init__(self, capacity=60000):
+        self.capacity = capacity
+        self.count = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.inv_mass = np.zeros(capacity)
+        self.elasticity = np.zeros(capacity)
+        self.friction = np.zeros(capacity)
+        self.color = np.zeros(capacity, dtype=np.uint32)  # 0xAARRGGBB
+        self.rest = np.zeros(capacity, dtype=np.int32)  # Шагов подряд без движения
+        self.radii = set()  # Радиусы, встречающиеся среди частиц
+        self.max_radius = 0.0
+        # Сетка последнего подшага: левый верхний угол, клетка, число столбцов и строк, ключи клеток
+        self.grid = None
+        # Статические отрезки: концы, толщина, упругость и трение
+        self.segment_ax = self.segment_ay = self.segment_bx = self.segment_by = np.zeros(0)
+        self.segment_radius = self.segment_elasticity = self.segment_friction = np.zeros(0)
+        # Геометрия тел pymunk по строкам реестра: у многоугольников - нормали и
+        # смещения ребер в локальных координатах (лишние ребра со смещением inf)
+        self.body_version = None
+        self.body_circle = np.zeros(0, dtype=bool)
+        self.body_offset = np.zeros((0, 2))
+        self.body_radius = self.body_bound = np.zeros(0)
+        self.body_normals = np.zeros((0, 1, 2))
+        self.body_edges = np.zeros((0, 1))
+        self.body_inv_mass = self.body_inv_moment = np.zeros(0)
+        self.body_elasticity = self.body_friction = np.zeros(0)
+        self.body_count = 0  # Сколько тел было в пространстве на прошлом шаге
+        # Интегрирование: подшаг не длиннее max_dt и такой, чтобы частица
+        # сдвигалась за него не больше чем на диаметр и не проскакивала соседей
+        self.max_dt = 1.0 / 60
+        self.max_substeps = 3
+        self.iterations = 2  # Проходов выталкивания за подшаг (скорости поправляются один раз)
+        self.relaxation = 1.0  # Доля взаимного перекрытия частиц, снимаемая за проход
+        self.stacking = 0.25  # Во сколько раз легче нижней частицы пары считается верхняя
+        self.margin = 1.0  # Запас расстояния, с которым пары частиц отбираются на подшаг
+        self.slop = 0.5  # Частицы ближе этого зазора считаются касающимися (для отскока и трения)
+        self.bounce_threshold = 30.0  # Медленнее этого частицы не отскакивают, а оседают
+        self.rest_speed = 5.0  # Медленнее этого частица считается покоящейся
+        self.sleep_steps = 30  # Шагов покоя до засыпания частицы
+        self.wake_speed = 60.0  # Сосед быстрее этого будит спящую частицу
+        self.moving = False
+        # Отрисовка: холст с полями pad вокруг экрана и поверхность поверх его памяти
+        self.canvas = None
+        self.canvas_surface = None
+        self.canvas_pad = 0
+        self.canvas_dirty = None
+        self.stencils = {}
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, positions, radius, mass, elasticity, friction, color, rng):
+        """Создает неподвижные частицы в точках positions (N, 2), пока хватает емкости.
+
+        Оттенок каждой частицы случайно темнее color, как у зерен песка.
+        rng - генератор numpy.random. Возвращает число созданных частиц.
+        """
+        count = min(len(positions), self.capacity - self.count)
+        if count <= 0:
+            return 0
+        new = slice(self.count, self.count + count)
+        self.x[new] = positions[:count, 0]
+        self.y[new] = positions[:count, 1]
+        self.vx[new] = 0
+        self.vy[new] = 0
+        self.radius[new] = radius
+        self.inv_mass[new] = 1.0 / mass
+        self.elasticity[new] = elasticity
+        self.friction[new] = friction
+        self.rest[new] = 0
+        rgb = (np.array(color, dtype=float) * rng.uniform(0.7, 1.0, (count, 1))).astype(np.uint32)
+        self.color[new] = 0xFF000000 | rgb[:, 0] << 16 | rgb[:, 1] << 8 | rgb[:, 2]
+        self.count += count
+        self.radii.add(radius)
+        self.max_radius = max(self.max_radius, radius)
+        self.moving = True
+        return count
+
+    def clear(self):
+        """Удаляет все частицы"""
+        self.count = 0
+        self.radii = set()
+        self.max_radius = 0.0
+        self.moving = False
+
+    def reorder(self, index):
+        """Оставляет частицы index в заданном порядке (перестановка или отбор)"""
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            array[:len(index)] = array[:self.count].take(index)
+        self.count = len(index)
+
+    def remove_outside(self, bounds):
+        """Удаляет частицы за пределами прямоугольника bounds и возвращает их число"""
+        x, y = self.x[:self.count], self.y[:self.count]
+        inside = np.flatnonzero((x >= bounds.left) & (x <= bounds.right) & (y >= bounds.top) & (y <= bounds.bottom))
+        removed = self.count - len(inside)
+        if removed:
+            self.reorder(inside)
+        return removed
+
+    def set_segments(self, shapes):
+        """Запоминает статические отрезки pymunk, о которые ударяются частицы"""
+        self.segment_ax = np.array([shape.a[0] for shape in shapes], dtype=float)
+        self.segment_ay = np.array([shape.a[1] for shape in shapes], dtype=float)
+        self.segment_bx = np.array([shape.b[0] for shape in shapes], dtype=float)
+        self.segment_by = np.array([shape.b[1] for shape in shapes], dtype=float)
+        self.segment_radius = np.array([shape.radius for shape in shapes], dtype=float)
+        self.segment_elasticity = np.array([shape.elasticity for shape in shapes], dtype=float)
+        self.segment_friction = np.array([shape.friction for shape in shapes], dtype=float)
+
+    def sync_bodies(self, store):
+        """Перестраивает геометрию тел, если набор объектов изменился"""
+        if store.version == self.body_version:
+            return
+        self.body_version = store.version
+        entities = store.entities
+        count = len(entities)
+        self.body_circle = np.array([entity.vertices is None for entity in entities], dtype=bool)
+        self.body_offset = np.array([entity.offset for entity in entities], dtype=float).reshape(-1, 2)
+        self.body_radius = store.column("radius")
+        self.body_bound = store.column("bound")
+        self.body_inv_mass = 1.0 / store.column("mass")
+        self.body_inv_moment = np.array([1.0 / entity.body.moment for entity in entities], dtype=float)
+        self.body_elasticity = store.column("elasticity")
+        self.body_friction = store.column("friction")
+        polygons = [entity for entity in entities if entity.vertices is not None]
+        edges = max([len(entity.vertices) for entity in polygons], default=1)
+        self.body_normals = np.zeros((count, edges, 2))
+        self.body_edges = np.full((count, edges), np.inf)
+        for entity in polygons:
+            vertices = entity.vertices
+            edge = np.roll(vertices, -1, axis=0) - vertices
+            normals = np.column_stack((edge[:, 1], -edge[:, 0]))
+            normals /= np.maximum(np.hypot(normals[:, 0], normals[:, 1]), 1e-9)[:, None]
+            # Нормали наружу независимо от направления обхода вершин
+            outward = ((vertices - vertices.mean(axis=0)) * normals).sum(axis=1)
+            normals[outward < 0] *= -1
+            self.body_normals[entity.row, :len(vertices)] = normals
+            self.body_edges[entity.row, :len(vertices)] = (normals * vertices).sum(axis=1)
+
+    def step(self, dt, gravity, store=None, rows=None):
+        """Продвигает частицы на время dt подшагами.
+
+        На подшаге бодрствующие частицы сдвигаются по своей скорости, затем
+        iterations раз выталкиваются друг из друга, из отрезков и тел, после
+        чего касающимся парам поправляется скорость: отскок и трение. store
+        и rows - реестр объектов и строки тел, лежащих в пространстве:
+        суммарные импульсы частиц передаются этим телам в конце шага.
+        При dt <= 0 ничего не происходит.
+        """
+        if not self.count:
+            self.moving = False
+            return
+        if dt <= 0:
+            return
+        bodies = None
+        present = 0
+        if store is not None and rows is not None and len(rows):
+            self.sync_bodies(store)
+            bodies = [store.entities[row].body for row in rows.tolist()]
+            state = np.array([(*body.position, body.angle, *body.velocity, body.angular_velocity)
+                              for body in bodies], dtype=float).reshape(-1, 6)
+            impulses = np.zeros((len(bodies), 3))
+            present = len(bodies)
+        # Тела исчезли (удалены или выгружены): лежавший на них песок должен упасть
+        if present < self.body_count:
+            self.rest[:self.count] = 0
+            self.moving = True
+        self.body_count = present
+        if not bodies and not self.moving:
+            return
+        vx, vy = self.vx[:self.count], self.vy[:self.count]
+        speed = math.sqrt(float(np.max(vx * vx + vy * vy)))
+        substeps = max(math.ceil(dt / self.max_dt), math.ceil(speed * dt / (2 * self.max_radius)))
+        substeps = min(max(substeps, 1), self.max_substeps)
+        h = dt / substeps
+        length = math.hypot(gravity[0], gravity[1])
+        down = (gravity[0] / length, gravity[1] / length) if length else (0.0, 1.0)
+        for _ in range(substeps):
+            count = self.count
+            awake = self.rest[:count] < self.sleep_steps
+            self.vx[:count] += gravity[0] * h * awake
+            self.vy[:count] += gravity[1] * h * awake
+            self.x[:count] += self.vx[:count] * h
+            self.y[:count] += self.vy[:count] * h
+            self.build_grid()
+            touching = self.body_pairs(state, rows) if bodies else None
+            awake = self.rest[:count] < self.sleep_steps
+            before_x, before_y = self.vx[:count].copy(), self.vy[:count].copy()
+            start_x, start_y = self.x[:count] - before_x * h, self.y[:count] - before_y * h
+            pairs = self.particle_pairs(awake, down)
+            segments = self.segment_pairs(awake)
+            for _ in range(self.iterations):
+                particle_contacts = self.separate_particles(pairs, start_x, start_y)
+                segment_contacts = self.separate_segments(segments, start_x, start_y)
+                if touching:
+                    body_contacts = self.separate_bodies(touching)
+            self.resolve_particles(pairs, particle_contacts, before_x, before_y)
+            self.resolve_segments(segment_contacts, before_x, before_y)
+            if touching:
+                self.resolve_bodies(body_contacts, before_x, before_y, state, impulses)
+            self.limit_blocked(start_x, start_y, before_x, before_y, h)
+            self.wake_touched((pairs[0], pairs[1], particle_contacts[2]), before_x, before_y)
+        if bodies:
+            self.apply_body_impulses(bodies, rows, impulses)
+        # Покой определяется по фактическому сдвигу за последний подшаг
+        moved_x, moved_y = self.x[:count] - start_x, self.y[:count] - start_y
+        still = moved_x * moved_x + moved_y * moved_y < (self.rest_speed * h) ** 2
+        rest = self.rest[:count]
+        rest[:] = np.where(still, np.minimum(rest + 1, self.sleep_steps), 0)
+        asleep = rest >= self.sleep_steps
+        self.vx[:count][asleep] = 0
+        self.vy[:count][asleep] = 0
+        self.moving = not asleep.all()
+
+    def build_grid(self):
+        """Раскладывает частицы по клеткам сетки и переставляет массивы по номеру клетки"""
+        count = self.count
+        x, y = self.x[:count], self.y[:count]
+        cell = 2 * self.max_radius
+        # Пустая строка и столбец по краям: соседние ключи клеток не переходят через край сетки
+        left, top = x.min() - cell, y.min() - cell
+        column = ((x - left) / cell).astype(np.intp)
+        row = ((y - top) / cell).astype(np.intp)
+        columns, rows = int(column.max()) + 2, int(row.max()) + 2
+        keys = column * rows + row
+        if np.any(keys[1:] < keys[:-1]):
+            order = np.argsort(keys, kind="stable")
+            self.reorder(order)
+            keys = keys.take(order)
+        self.grid = (left, top, cell, columns, rows, keys)
+
+    def candidates(self, left, top, right, bottom):
+        """Пары (номер прямоугольника, частица) для прямоугольников мира по клеткам сетки"""
+        grid_left, grid_top, cell, columns, rows, keys = self.grid
+        left = np.floor((left - grid_left) / cell).astype(np.intp)
+        right = np.floor((right - grid_left) / cell).astype(np.intp)
+        top = np.floor((top - grid_top) / cell).astype(np.intp)
+        bottom = np.floor((bottom - grid_top) / cell).astype(np.intp)
+        boxes = np.flatnonzero((right >= 0) & (left < columns) & (bottom >= 0) & (top < rows))
+        left = np.maximum(left.take(boxes), 0)
+        right = np.minimum(right.take(boxes), columns - 1)
+        top = np.maximum(top.take(boxes), 0)
+        bottom = np.minimum(bottom.take(boxes), rows - 1)
+        box, column = expand_ranges(left, right + 1)
+        first = np.searchsorted(keys, column * rows + top.take(box), "left")
+        last = np.searchsorted(keys, column * rows + bottom.take(box), "right")
+        owner, particle = expand_ranges(first, last)
+        return boxes.take(box.take(owner)), particle
+
+    @staticmethod
+    def find_cells(cells, table, keys):
+        """Номера клеток с ключами keys среди занятых cells и признак, что клетка занята"""
+        if table is not None:
+            index = table.take(keys)
+            return np.maximum(index, 0), index >= 0
+        index = np.minimum(np.searchsorted(cells, keys), len(cells) - 1)
+        return index, cells.take(index) == keys
+
+    def particle_pairs(self, awake, down):
+        """Пары близких частиц подшага: (i, j, i и j подряд, сумма радиусов, доли i и j, упругость, трение).
+
+        Пары набираются только из клеток с бодрствующими частицами awake и
+        их соседей. Доли - какую часть общей поправки пары получает каждая
+        частица: нижняя вдоль гравитации down частица считается тяжелее в
+        1 / stacking раз, поэтому куча держит форму за несколько итераций,
+        а спящая частица не сдвигается совсем.
+        """
+        count = self.count
+        _, _, _, columns, rows, keys = self.grid
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        cells = keys.take(starts)
+        ends = np.append(starts[1:], count)
+        # Номера занятых клеток по ключу: плотной таблицей, если сетка не слишком разрежена
+        table = None
+        if columns * rows <= 8 * count:
+            table = np.full(columns * rows, -1, dtype=np.intp)
+            table[cells] = np.arange(len(cells))
+        if awake.all():
+            busy = np.arange(len(cells))
+        else:
+            # Клетки бодрствующих частиц (ключи отсортированы) и все их соседи
+            busy = np.searchsorted(cells, keys.take(np.flatnonzero(awake)))
+            busy = busy.take(np.flatnonzero(np.diff(busy, prepend=-1)))
+            near = np.zeros(len(cells), dtype=bool)
+            for offset in (-rows - 1, -rows, -rows + 1, -1, 0, 1, rows - 1, rows, rows + 1):
+                index, found = self.find_cells(cells, table, cells.take(busy) + offset)
+                near[index.take(np.flatnonzero(found))] = True
+            busy = np.flatnonzero(near)
+        owner, source = expand_ranges(starts.take(busy), ends.take(busy))
+        # Своя клетка: пары (i, j) с j > i
+        first, second = expand_ranges(source + 1, ends.take(busy).take(owner))
+        pairs_i, pairs_j = [source.take(first)], [second]
+        # Соседние клетки: (0, +1), (+1, -1), (+1, 0), (+1, +1)
+        for offset in (1, rows - 1, rows, rows + 1):
+            index, found = self.find_cells(cells, table, cells.take(busy) + offset)
+            cell_start = np.where(found, starts.take(index), 0).take(owner)
+            cell_end = np.where(found, ends.take(index), 0).take(owner)
+            first, second = expand_ranges(cell_start, cell_end)
+            pairs_i.append(source.take(first))
+            pairs_j.append(second)
+        i = np.concatenate(pairs_i)
+        j = np.concatenate(pairs_j)
+        # За итерации частицы сдвигаются мало: пары дальше margin от касания отбрасываются сразу,
+        # как и пары двух спящих частиц
+        x, y = self.x[:count], self.y[:count]
+        dx, dy = x.take(j) - x.take(i), y.take(j) - y.take(i)
+        awake_i, awake_j = awake.take(i), awake.take(j)
+        if len(self.radii) == 1:
+            reach = 2 * self.max_radius
+            near = np.flatnonzero((dx * dx + dy * dy < (reach + self.margin) ** 2) & (awake_i | awake_j))
+            i, j = i.take(near), j.take(near)
+        else:
+            reach = self.radius.take(i) + self.radius.take(j)
+            near = np.flatnonzero((dx * dx + dy * dy < (reach + self.margin) ** 2) & (awake_i | awake_j))
+            i, j, reach = i.take(near), j.take(near), reach.take(near)
+        lower = dx.take(near) * down[0] + dy.take(near) * down[1] > 0  # j ниже i
+        weight_i = self.inv_mass.take(i) * awake_i.take(near) * np.where(lower, 1.0, self.stacking)
+        weight_j = self.inv_mass.take(j) * awake_j.take(near) * np.where(lower, self.stacking, 1.0)
+        total = weight_i + weight_j
+        return (i, j, np.concatenate((i, j)), reach, weight_i / total, weight_j / total,
+                self.elasticity.take(i) * self.elasticity.take(j), self.friction.take(i) * self.friction.take(j))
+
+    def separate_particles(self, pairs, start_x, start_y):
+        """Выталкивает перекрывшиеся частицы друг из друга, возвращает нормали и признак касания пар.
+
+        Вместе с выталкиванием гасится проскальзывание пары вдоль касательной
+        с начала подшага (положения в начале - start_x, start_y), но не
+        больше чем на трение пары, умноженное на выталкивание: без этого
+        давление кучи выдавливает частицы вверх вдоль стен и друг друга.
+        Поправки частицы от всех ее перекрытий усредняются. Пары уже
+        отобраны по близости, поэтому касание отмечается для всех пар
+        признаком touching, а не отдельным отбором.
+        """
+        i, j, ends, reach, part_i, part_j, _, friction = pairs
+        count = self.count
+        x, y = self.x[:count], self.y[:count]
+        dx, dy = x.take(j) - x.take(i), y.take(j) - y.take(i)
+        distance = np.maximum(np.sqrt(dx * dx + dy * dy), 1e-9)
+        nx, ny = dx / distance, dy / distance
+        depth = reach - distance
+        push = np.maximum(depth, 0.0) * self.relaxation
+        slide_x, slide_y = x - start_x, y - start_y
+        along = (slide_y.take(j) - slide_y.take(i)) * nx - (slide_x.take(j) - slide_x.take(i)) * ny
+        hold = np.clip(along, -friction * push, friction * push)
+        push_x, push_y = nx * push + ny * hold, ny * push - nx * hold
+        overlapping = (depth > 0).astype(float)
+        share = 1.0 / np.maximum(np.bincount(ends, np.concatenate((overlapping, overlapping)), count), 1)
+        x += np.bincount(ends, np.concatenate((-push_x * part_i, push_x * part_j)), count) * share
+        y += np.bincount(ends, np.concatenate((-push_y * part_i, push_y * part_j)), count) * share
+        return nx, ny, (depth > -self.slop).astype(float)
+
+    def limit_blocked(self, start_x, start_y, before_x, before_y, h):
+        """Срезает скорость, которую выталкивание не дало превратить в сдвиг.
+
+        Частица в куче, прижатая гравитацией, иначе копит скорость вниз из
+        подшага в подшаг. Компонента, сменившая знак (отскок), не трогается.
+        """
+        count = self.count
+        for velocity, before, moved in ((self.vx[:count], before_x, (self.x[:count] - start_x) / h),
+                                        (self.vy[:count], before_y, (self.y[:count] - start_y) / h)):
+            limited = np.clip(velocity, np.minimum(moved, 0.0), np.maximum(moved, 0.0))
+            np.copyto(velocity, limited, where=velocity * before > 0)
+
+    def wake_touched(self, contacts, before_x, before_y):
+        """Будит частицы, которых коснулся сосед быстрее wake_speed"""
+        i, j, touching = contacts
+        fast = before_x * before_x + before_y * before_y > self.wake_speed ** 2
+        touched = touching > 0
+        self.rest[i.take(np.flatnonzero(touched & fast.take(j)))] = 0
+        self.rest[j.take(np.flatnonzero(touched & fast.take(i)))] = 0
+
+    def velocity_change(self, before_x, before_y, after_x, after_y, nx, ny, elasticity, friction):
+        """Поправка относительной скорости контакта (dx, dy): отскок и трение.
+
+        before - относительная скорость в начале подшага, after - текущая.
+        Сближающаяся пара останавливается, а при ударе быстрее
+        bounce_threshold отскакивает со скоростью -elasticity * before;
+        контакт только отталкивает и не притягивает. Касательная скорость
+        гасится не больше чем на friction * прирост нормальной (закон Кулона).
+        """
+        normal_before = before_x * nx + before_y * ny
+        normal_after = after_x * nx + after_y * ny
+        target = np.where(normal_before < -self.bounce_threshold, -elasticity * normal_before, 0.0)
+        change = np.maximum(target - normal_after, 0.0)
+        tx, ty = after_x - normal_after * nx, after_y - normal_after * ny
+        tangent = np.hypot(tx, ty)
+        slowdown = np.minimum(friction * change, tangent) / np.maximum(tangent, 1e-9)
+        return nx * change - tx * slowdown, ny * change - ty * slowdown
+
+    def resolve_particles(self, pairs, contacts, before_x, before_y):
+        """Отскок и трение между касающимися частицами"""
+        i, j, ends, _, part_i, part_j, elasticity, friction = pairs
+        nx, ny, touching = contacts
+        if not len(i):
+            return
+        count = self.count
+        vx, vy = self.vx[:count], self.vy[:count]
+        dx, dy = self.velocity_change(before_x.take(j) - before_x.take(i), before_y.take(j) - before_y.take(i),
+                                      vx.take(j) - vx.take(i), vy.take(j) - vy.take(i),
+                                      nx, ny, elasticity, friction)
+        part_i, part_j = touching * part_i, touching * part_j
+        share = 1.0 / np.maximum(np.bincount(ends, np.concatenate((touching, touching)), count), 1)
+        vx += np.bincount(ends, np.concatenate((-dx * part_i, dx * part_j)), count) * share
+        vy += np.bincount(ends, np.concatenate((-dy * part_i, dy * part_j)), count) * share
+
+    def segment_pairs(self, awake):
+        """Пары (отрезок, бодрствующая частица) подшага, которые могут соприкоснуться"""
+        ax, ay, bx, by = self.segment_ax, self.segment_ay, self.segment_bx, self.segment_by
+        reach = self.segment_radius + self.max_radius + self.margin
+        segment, particle = self.candidates(np.minimum(ax, bx) - reach, np.minimum(ay, by) - reach,
+                                            np.maximum(ax, bx) + reach, np.maximum(ay, by) + reach)
+        picked = np.flatnonzero(awake.take(particle))
+        segment, particle = segment.take(picked), particle.take(picked)
+        return segment, particle, self.segment_radius.take(segment) + self.radius.take(particle)
+
+    def separate_segments(self, pairs, start_x, start_y):
+        """Выталкивает частицы из статических отрезков, возвращает касания (частица, отрезок, нормаль)"""
+        segment, particle, reach = pairs
+        ax, ay = self.segment_ax.take(segment), self.segment_ay.take(segment)
+        ex, ey = self.segment_bx.take(segment) - ax, self.segment_by.take(segment) - ay
+        px, py = self.x.take(particle), self.y.take(particle)
+        t = np.clip(((px - ax) * ex + (py - ay) * ey) / np.maximum(ex * ex + ey * ey, 1e-9), 0, 1)
+        dx, dy = px - ax - ex * t, py - ay - ey * t
+        distance = np.hypot(dx, dy)
+        hit = np.flatnonzero((distance < reach + self.slop) & (distance > 1e-9))
+        segment, particle, distance = segment.take(hit), particle.take(hit), distance.take(hit)
+        nx, ny = dx.take(hit) / distance, dy.take(hit) / distance
+        # Проскальзывание вдоль отрезка гасится, как в separate_particles
+        depth = np.maximum(reach.take(hit) - distance, 0.0)
+        along = (self.y.take(particle) - start_y.take(particle)) * nx - (self.x.take(particle) - start_x.take(particle)) * ny
+        limit = self.friction.take(particle) * self.segment_friction.take(segment) * depth
+        hold = np.clip(along, -limit, limit)
+        self.push_out(particle, nx * depth + ny * hold, ny * depth - nx * hold, depth > 0)
+        return particle, segment, nx, ny
+
+    def push_out(self, particle, push_x, push_y, overlapping):
+        """Сдвигает частицы particle на (push_x, push_y); поправки перекрытий overlapping одной частицы усредняются"""
+        count = self.count
+        share = 1.0 / np.maximum(np.bincount(particle, overlapping.astype(float), count), 1)
+        self.x[:count] += np.bincount(particle, push_x, count) * share
+        self.y[:count] += np.bincount(particle, push_y, count) * share
+
+    def resolve_segments(self, contacts, before_x, before_y):
+        """Отскок и трение частиц о неподвижные отрезки"""
+        particle, segment, nx, ny = contacts
+        if not len(particle):
+            return
+        count = self.count
+        dx, dy = self.velocity_change(before_x.take(particle), before_y.take(particle),
+                                      self.vx.take(particle), self.vy.take(particle), nx, ny,
+                                      self.elasticity.take(particle) * self.segment_elasticity.take(segment),
+                                      self.friction.take(particle) * self.segment_friction.take(segment))
+        share = 1.0 / np.maximum(np.bincount(particle, minlength=count), 1).take(particle)
+        self.vx[:count] += np.bincount(particle, dx * share, count)
+        self.vy[:count] += np.bincount(particle, dy * share, count)
+
+    def body_pairs(self, state, rows):
+        """Пары (тело, частица) подшага рядом с телами строк реестра rows.
+
+        state - (x, y, угол, vx, vy, угловая скорость) этих тел; за время
+        шага частиц тела не сдвигаются. Спящие частицы рядом с движущимся
+        телом будятся, рядом с покоящимся - в пары не попадают.
+        """
+        center_x, center_y = state[:, 0], state[:, 1]
+        bound = self.body_bound.take(rows)
+        reach = bound + self.max_radius + self.margin
+        body, particle = self.candidates(center_x - reach, center_y - reach, center_x + reach, center_y + reach)
+        moving = np.hypot(state[:, 3], state[:, 4]) + np.abs(state[:, 5]) * bound > self.rest_speed
+        self.rest[particle.take(np.flatnonzero(moving.take(body)))] = 0
+        picked = np.flatnonzero(self.rest.take(particle) < self.sleep_steps)
+        body, particle = body.take(picked), particle.take(picked)
+        if not len(particle):
+            return None
+        angle = state[:, 2].take(body)
+        return body, particle, rows.take(body), center_x.take(body), center_y.take(body), np.cos(angle), np.sin(angle)
+
+    def separate_bodies(self, pairs):
+        """Выталкивает частицы из тел pymunk, возвращает касания (тело, частица, строка, нормаль)"""
+        body, particle, row, center_x, center_y, cos, sin = pairs
+        dx = self.x.take(particle) - center_x
+        dy = self.y.take(particle) - center_y
+        radius = self.radius.take(particle)
+        nx, ny, depth = np.empty(len(dx)), np.empty(len(dx)), np.empty(len(dx))
+        # Круги: расстояние до центра со смещением
+        circle = self.body_circle.take(row)
+        if circle.any():
+            picked = np.flatnonzero(circle)
+            offset = self.body_offset.take(row.take(picked), axis=0)
+            c, s = cos.take(picked), sin.take(picked)
+            ox = dx.take(picked) - (offset[:, 0] * c - offset[:, 1] * s)
+            oy = dy.take(picked) - (offset[:, 0] * s + offset[:, 1] * c)
+            distance = np.maximum(np.hypot(ox, oy), 1e-9)
+            nx[picked], ny[picked] = ox / distance, oy / distance
+            depth[picked] = self.body_radius.take(row.take(picked)) + radius.take(picked) - distance
+        # Многоугольники: ребро с наибольшим расстоянием до центра частицы в координатах тела
+        if not circle.all():
+            picked = np.flatnonzero(~circle)
+            c, s = cos.take(picked), sin.take(picked)
+            px, py = dx.take(picked), dy.take(picked)
+            local_x, local_y = px * c + py * s, py * c - px * s
+            normals = self.body_normals.take(row.take(picked), axis=0)
+            separation = (normals[:, :, 0] * local_x[:, None] + normals[:, :, 1] * local_y[:, None]
+                          - self.body_edges.take(row.take(picked), axis=0))
+            edge = separation.argmax(axis=1)[:, None]
+            normal_x = np.take_along_axis(normals[:, :, 0], edge, axis=1)[:, 0]
+            normal_y = np.take_along_axis(normals[:, :, 1], edge, axis=1)[:, 0]
+            nx[picked], ny[picked] = normal_x * c - normal_y * s, normal_x * s + normal_y * c
+            depth[picked] = radius.take(picked) - np.take_along_axis(separation, edge, axis=1)[:, 0]
+        hit = np.flatnonzero(depth > -self.slop)
+        body, particle, row = body.take(hit), particle.take(hit), row.take(hit)
+        nx, ny, depth = nx.take(hit), ny.take(hit), depth.take(hit)
+        self.push_out(particle, nx * np.maximum(depth, 0.0), ny * np.maximum(depth, 0.0), depth > 0)
+        return body, particle, row, nx, ny
+
+    def resolve_bodies(self, contacts, before_x, before_y, state, impulses):
+        """Отскок и трение частиц о тела; обратные импульсы копятся в impulses (px, py, момент)"""
+        body, particle, row, nx, ny = contacts
+        if not len(particle):
+            return
+        count = self.count
+        # Скорость точки тела в месте касания: v + w x r
+        radius = self.radius.take(particle)
+        arm_x = self.x.take(particle) - nx * radius - state[:, 0].take(body)
+        arm_y = self.y.take(particle) - ny * radius - state[:, 1].take(body)
+        spin = state[:, 5].take(body)
+        point_x = state[:, 3].take(body) - spin * arm_y
+        point_y = state[:, 4].take(body) + spin * arm_x
+        dx, dy = self.velocity_change(before_x.take(particle) - point_x, before_y.take(particle) - point_y,
+                                      self.vx.take(particle) - point_x, self.vy.take(particle) - point_y, nx, ny,
+                                      self.elasticity.take(particle) * self.body_elasticity.take(row),
+                                      self.friction.take(particle) * self.body_friction.take(row))
+        share = 1.0 / np.maximum(np.bincount(particle, minlength=count), 1).take(particle)
+        dx, dy = dx * share, dy * share
+        self.vx[:count] += np.bincount(particle, dx, count)
+        self.vy[:count] += np.bincount(particle, dy, count)
+        # Тело получает обратный импульс
+        mass = 1.0 / self.inv_mass.take(particle)
+        push_x, push_y = dx * mass, dy * mass
+        bodies = len(impulses)
+        impulses[:, 0] -= np.bincount(body, push_x, bodies)
+        impulses[:, 1] -= np.bincount(body, push_y, bodies)
+        impulses[:, 2] -= np.bincount(body, arm_x * push_y - arm_y * push_x, bodies)
+
+    def apply_body_impulses(self, bodies, rows, impulses):
+        """Передает телам накопленные импульсы частиц.
+
+        Спящее тело будится, только если импульс разгоняет его быстрее
+        rest_speed: иначе песок, лежащий на ящике, не давал бы сцене уснуть.
+        """
+        inv_mass = self.body_inv_mass.take(rows)
+        delta_x, delta_y = impulses[:, 0] * inv_mass, impulses[:, 1] * inv_mass
+        delta_spin = impulses[:, 2] * self.body_inv_moment.take(rows)
+        strength = np.hypot(delta_x, delta_y) + np.abs(delta_spin) * self.body_bound.take(rows)
+        for index in np.flatnonzero(strength > 1e-6).tolist():
+            body = bodies[index]
+            if body.is_sleeping:
+                if strength[index] < self.rest_speed:
+                    continue
+                body.activate()
+            body.velocity += (float(delta_x[index]), float(delta_y[index]))
+            body.angular_velocity += float(delta_spin[index])
+
+    def stencil(self, radius, stride):
+        """Смещения пикселей круга радиуса radius в плоском холсте с шириной строки stride"""
+        key = (radius, stride)
+        offsets = self.stencils.get(key)
+        if offsets is None:
+            y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+            inside = x * x + y * y <= radius * radius + radius
+            offsets = self.stencils[key] = (y[inside] * stride + x[inside]).astype(np.intp)
+        return offsets
+
+    def draw(self, screen, camera):
+        """Рисует частицы через камеру, возвращает список занятых областей.
+
+        Рисовать десятки тысяч кругов по одному слишком долго, поэтому
+        частицы штампуются кругами-трафаретами в холст NumPy 0xAARRGGBB
+        одной операцией на каждый радиус, а холст выводится на экран одним
+        blit через поверхность, разделяющую с ним память.
+        """
+        width, height = screen.get_size()
+        zoom = camera.zoom
+        pad = 2 * max(1, round(self.max_radius * zoom)) + 1
+        if self.canvas is None or pad > self.canvas_pad or self.canvas.shape != (height + 2 * pad, width + 2 * pad):
+            self.canvas_pad = pad = max(pad, 8)
+            self.canvas = np.zeros((height + 2 * pad, width + 2 * pad), dtype=np.uint32)
+            self.canvas_surface = pygame.image.frombuffer(self.canvas, (width + 2 * pad, height + 2 * pad), "BGRA")
+            self.canvas_dirty = None
+        pad = self.canvas_pad
+        if self.canvas_dirty:
+            left, top, right, bottom = self.canvas_dirty
+            self.canvas[top:bottom, left:right] = 0
+            self.canvas_dirty = None
+        count = self.count
+        if not count:
+            return []
+        x = ((self.x[:count] - camera.x) * zoom).astype(np.intp)
+        y = ((self.y[:count] - camera.y) * zoom).astype(np.intp)
+        flat = self.canvas.reshape(-1)
+        stride = width + 2 * pad
+        left, top, right, bottom = width, height, 0, 0
+        for radius in sorted(self.radii):
+            pixels = max(1, round(radius * zoom))
+            visible = np.flatnonzero((self.radius[:count] == radius) & (x > -pixels) & (x < width + pixels) &
+                                     (y > -pixels) & (y < height + pixels))
+            if not len(visible):
+                continue
+            sx, sy = x.take(visible), y.take(visible)
+            offsets = self.stencil(pixels, stride)
+            flat[((sy + pad) * stride + sx + pad)[:, None] + offsets] = self.color.take(visible)[:, None]
+            left = min(left, int(sx.min()) - pixels)
+            top = min(top, int(sy.min()) - pixels)
+            right = max(right, int(sx.max()) + pixels + 1)
+            bottom = max(bottom, int(sy.max()) + pixels + 1)
+        if left >= right:
+            return []
+        self.canvas_dirty = (left + pad, top + pad, right + pad, bottom + pad)
+        area = pygame.Rect(left, top, right - left, bottom - top).clip(screen.get_rect())
+        screen.blit(self.canvas_surface, area, area.move(pad, pad))
+        return [area]
@@ -0,0 +1,298 @@
+"""Физика в отдельном процессе: разделяемый буфер состояния тел, клиент и процесс физики"""
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pygame
+
+from entities import KIND_BALL
+
+
+class SharedTransforms:
+    """Двойной буфер состояния тел в разделяемой памяти.
+
+    Процесс физики пишет строки (id, тип, x, y, угол, vx, vy) в задний буфер и
+    затем делает его передним. Процесс отрисовки закрепляет передний буфер и
+    читает его без копирования; пока буфер закреплен, писатель его не трогает
+    и пропускает публикацию. В заголовке лежат номер переднего буфера, номер
+    закрепленного буфера, номер шага физики и число строк в каждом буфере.
+    """
+
+    COLUMNS = ("id", "kind", "x", "y", "angle", "vx", "vy")
+    HEADER = 5
+
+    def __init__(self, capacity=20000, name=None):
+        self.capacity = capacity
+        self.owner = name is None
+        size = 8 * (self.HEADER + 2 * capacity * len(self.COLUMNS))
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=self.memory.buf)
+        self.buffers = np.ndarray((2, capacity, len(self.COLUMNS)), dtype=np.float64,
+                                  buffer=self.memory.buf, offset=8 * self.HEADER)
+        if self.owner:
+            self.header[:] = (0, -1, 0, 0, 0)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def step(self):
+        """Номер шага физики последней публикации"""
+        return int(self.header[2])
+
+    def writable(self):
+        """Свободен ли задний буфер для записи"""
+        return self.header[1] != 1 - self.header[0]
+
+    def publish(self, step, rows):
+        """Записывает строки в задний буфер и делает его передним"""
+        back = 1 - int(self.header[0])
+        if self.header[1] == back:
+            return False
+        count = min(len(rows), self.capacity)
+        self.buffers[back, :count] = rows[:count]
+        self.header[3 + back] = count
+        self.header[2] = step
+        self.header[0] = back
+        return True
+
+    def acquire(self):
+        """Закрепляет передний буфер за читателем и возвращает его строки (без копии)"""
+        while True:
+            front = int(self.header[0])
+            self.header[1] = front
+            if self.header[0] == front:
+                return self.buffers[front, :self.header[3 + front]]
+
+    def close(self):
+        """Отпускает разделяемую память; создатель блока также удаляет его"""
+        self.header = self.buffers = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class PhysicsClient:
+    """Сторона отрисовки при физике в отдельном процессе.
+
+    Процесс physics_worker владеет пространством pymunk и шагает его в своем
+    темпе, публикуя состояние тел в SharedTransforms. Сюда приходят только
+    положения, а создание, перетаскивание, силы и очистка уходят командами
+    в очередь commands; удаленные за пределами сцены тела приходят в events.
+    """
+
+    def __init__(self, substeps=3, broadphase="tree", threads=1, large_world=False, capacity=20000):
+        context = multiprocessing.get_context("spawn")
+        self.transforms = SharedTransforms(capacity)
+        self.commands = context.Queue()
+        self.events = context.Queue()
+        self.process = context.Process(
+            target=physics_worker, daemon=True,
+            args=(self.transforms.name, capacity, self.commands, self.events, substeps, broadphase, threads,
+                  large_world)
+        )
+        self.process.start()
+        self.forces = None  # Последние отправленные (ветер, притяжение, вкл.)
+        # Состояние тел в порядке реестра и таблица id -> строка реестра
+        self.state = None
+        self.lookup = None
+        self.version = None
+        # Строки последнего чтения и строки реестра, которым они соответствуют
+        self.rows = None
+        self.targets = None
+        self.fast_ids = set()
+        # Темп процесса физики (шагов в секунду)
+        self.rate = 0.0
+        self.rate_step = 0
+        self.rate_time = time.perf_counter()
+
+    def send(self, *command):
+        """Ставит команду в очередь процесса физики"""
+        self.commands.put(command)
+
+    def spawn(self, entities):
+        """Просит процесс физики создать тела для новых записей реестра"""
+        records = []
+        for entity in entities:
+            x, y = entity.body.position
+            if entity.kind == KIND_BALL:
+                shape = (entity.radius, None)
+            else:
+                shape = (None, entity.vertices.tolist())
+            records.append((entity.id, entity.kind, x, y, *shape,
+                            entity.mass, entity.elasticity, entity.friction))
+        self.send("spawn", records)
+
+    def set_forces(self, wind, attraction, enabled):
+        """Отправляет глобальные силы, если они изменились"""
+        forces = (wind, attraction, enabled)
+        if forces != self.forces:
+            self.forces = forces
+            self.send("forces", *forces)
+
+    def poll_events(self):
+        """Забирает все события процесса физики"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def read(self, store):
+        """Возвращает состояние (N, 3) тел реестра по последней публикации.
+
+        Строки переднего буфера читаются прямо из разделяемой памяти и
+        раскладываются по строкам реестра через таблицу id. Тела, которых еще
+        нет в публикации, остаются в своем начальном положении.
+        """
+        if self.version != store.version:
+            self.version = store.version
+            self.lookup = np.full(store.next_id, -1, dtype=np.intp)
+            self.lookup[[entity.id for entity in store]] = [entity.row for entity in store]
+            self.state = np.array([(*body.position, body.angle) for body in store.bodies()],
+                                  dtype=float).reshape(-1, 3)
+        rows = self.transforms.acquire()
+        ids = rows[:, 0].astype(np.intp)
+        targets = np.full(len(ids), -1, dtype=np.intp)
+        known = ids < len(self.lookup)
+        targets[known] = self.lookup[ids[known]]
+        mask = targets >= 0
+        self.state[targets[mask]] = rows[mask, 2:5]
+        self.rows, self.targets = rows, targets
+        now = time.perf_counter()
+        if now - self.rate_time >= 1.0:
+            step = self.transforms.step
+            self.rate = (step - self.rate_step) / (now - self.rate_time)
+            self.rate_step, self.rate_time = step, now
+        return self.state
+
+    def sync_body(self, entity):
+        """Переносит положение и скорость опубликованного тела в его копию на стороне отрисовки"""
+        found = np.flatnonzero(self.targets == entity.row) if self.targets is not None else ()
+        if len(found):
+            _, _, x, y, angle, vx, vy = self.rows[found[0]].tolist()
+            entity.body.position = (x, y)
+            entity.body.angle = angle
+            entity.body.velocity = (vx, vy)
+
+    def sync_bodies(self, store):
+        """Переносит последнюю публикацию во все копии тел на стороне отрисовки.
+
+        Угловая скорость не публикуется, поэтому у копий остается прежней.
+        """
+        self.read(store)
+        entities = store.entities
+        known = self.targets >= 0
+        for row, (x, y, angle, vx, vy) in zip(self.targets[known].tolist(), self.rows[known, 2:7].tolist()):
+            body = entities[row].body
+            body.position = (x, y)
+            body.angle = angle
+            body.velocity = (vx, vy)
+
+    def speed_crossings(self, threshold):
+        """Число тел, превысивших порог скорости threshold с прошлого чтения"""
+        if self.rows is None:
+            return 0
+        speed = np.hypot(self.rows[:, 5], self.rows[:, 6])
+        fast_ids = set(self.rows[speed > threshold, 0].astype(int).tolist())
+        crossed = len(fast_ids - self.fast_ids)
+        self.fast_ids = fast_ids
+        return crossed
+
+    def pick(self, pos, store):
+        """Ближайшее к точке тело, в описанную окружность которого она попадает"""
+        if self.state is None or not len(store) or len(self.state) != len(store):
+            return None
+        distance = np.hypot(self.state[:, 0] - pos[0], self.state[:, 1] - pos[1])
+        inside = np.flatnonzero(distance <= store.column("bound"))
+        if not len(inside):
+            return None
+        return store.entities[inside[np.argmin(distance[inside])]].body
+
+    def close(self):
+        """Останавливает процесс физики и освобождает разделяемую память"""
+        self.send("stop")
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.rows = self.targets = None
+        self.transforms.close()
+
+
+def physics_worker(memory_name, capacity, commands, events, substeps, broadphase, threads, large_world):
+    """Процесс физики: выполняет команды, шагает пространство в реальном времени
+    и публикует состояние тел в разделяемую память"""
+    from main import PhysicsSandbox  # main импортирует этот модуль
+    sandbox = PhysicsSandbox(headless=True, substeps=substeps, broadphase=broadphase, threads=threads,
+                             large_world=large_world)
+    transforms = SharedTransforms(capacity, name=memory_name)
+    entities = sandbox.entities
+    dt = sandbox.physics_dt
+    columns_version = None
+    deadline = time.perf_counter()
+    step = 0
+    running = True
+    while running:
+        while True:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+            name = command[0]
+            if name == "stop":
+                running = False
+                break
+            elif name == "spawn":
+                objects = []
+                for entity_id, kind, x, y, radius, vertices, mass, elasticity, friction in command[1]:
+                    body, shape, vertices = sandbox.build_from_spec(
+                        kind, (x, y), radius, vertices, mass, elasticity, friction
+                    )
+                    entities.add(body, shape, kind, None, vertices, entity_id=entity_id)
+                    objects += (body, shape)
+                sandbox.space.add(*objects)
+            elif name == "drag":
+                entity = entities.by_id.get(command[1])
+                if entity and sandbox.dragging_body is not entity.body:
+                    if sandbox.dragging_body:
+                        sandbox.stop_drag()
+                    sandbox.start_drag(entity.body, command[2])
+                if sandbox.dragging_body:
+                    sandbox.move_drag(command[2])
+            elif name == "release":
+                if sandbox.dragging_body:
+                    sandbox.stop_drag()
+            elif name == "forces":
+                sandbox.wind_strength, sandbox.attraction_strength, sandbox.global_forces_enabled = command[1:]
+            elif name == "call":
+                getattr(sandbox, command[1])(*command[2])
+        if not running:
+            break
+        sandbox.step_physics(dt)
+        step += 1
+        if step % sandbox.despawn_interval == 0:
+            before = set(entities.by_id)
+            if sandbox.despawn_out_of_bounds():
+                events.put(("despawned", list(before - set(entities.by_id))))
+        # Состояние собирается, только если читатель не держит задний буфер
+        if transforms.writable():
+            if columns_version != entities.version:
+                columns_version = entities.version
+                ids = np.array([(entity.id, entity.kind) for entity in entities], dtype=float).reshape(-1, 2)
+            state = np.array([(*body.position, body.angle, *body.velocity) for body in entities.bodies()],
+                             dtype=float).reshape(-1, 5)
+            transforms.publish(step, np.hstack((ids, state)))
+        # Шаги идут в реальном времени; при сильном отставании расписание сбрасывается
+        deadline += dt
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -dt * sandbox.substeps * sandbox.max_catchup_frames:
+            deadline = time.perf_counter()
+    transforms.close()
+    pygame.quit()
@@ -0,0 +1,129 @@
+"""Покадровый профилировщик фаз основного цикла"""
+
+import csv
+import time
+
+import numpy as np
+import pygame
+
+from rendering import text_cache
+
+
+class FrameProfiler:
+    """Покадровый профилировщик фаз основного цикла.
+
+    mark(phase) засчитывает фазе время, прошедшее с предыдущей отметки, так
+    что одна фаза может набираться из нескольких кусков кадра. Кадры лежат
+    в кольцевом буфере на capacity кадров. Выключенный профилировщик
+    сводится к проверке флага в каждой отметке.
+    """
+
+    PHASES = ("events", "dragging", "forces", "step", "particles", "background", "tasks", "telemetry",
+              "bodies", "fields", "hud", "progress", "overlay", "present", "wait")
+    COLORS = ((230, 25, 75), (245, 130, 48), (255, 225, 25), (60, 180, 75), (255, 250, 200), (70, 240, 240),
+              (0, 130, 200), (0, 128, 128), (145, 30, 180), (240, 50, 230), (210, 245, 60),
+              (250, 190, 190), (170, 110, 40), (128, 128, 128), (40, 40, 40))
+    GRAPH_SIZE = (300, 100)  # Ширина (кадров) и высота графика в пикселях
+    GRAPH_MS = 33.3  # Время кадра, соответствующее высоте графика
+
+    def __init__(self, capacity=600, enabled=False):
+        self.enabled = enabled
+        self.overlay = False
+        self.capacity = capacity
+        self.slots = {phase: i for i, phase in enumerate(self.PHASES)}
+        self.history = np.zeros((capacity, len(self.PHASES)), dtype=np.float32)
+        self.frames = 0  # Сколько кадров записано всего
+        self.current = [0.0] * len(self.PHASES)
+        self.last = 0.0
+        # Таблица перцентилей пересчитывается не каждый кадр
+        self.stats = None
+        self.stats_frame = -1
+        self.stats_interval = 30
+        self.palette = np.array(self.COLORS + ((0, 0, 0),), dtype=np.uint8)
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            # Таймеры включаются посреди кадра - отсчет идет с этого момента
+            self.enabled = True
+            self.begin_frame()
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.current = [0.0] * len(self.PHASES)
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """Засчитывает фазе время с предыдущей отметки"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[self.slots[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.history[self.frames % self.capacity] = self.current
+        self.frames += 1
+
+    def recent(self):
+        """Записанные кадры от старых к новым, в миллисекундах"""
+        if self.frames <= self.capacity:
+            return self.history[:self.frames] * 1000
+        return np.roll(self.history, -(self.frames % self.capacity), axis=0) * 1000
+
+    def percentiles(self):
+        """p50, p95 и p99 каждой фазы: массив (3, число фаз)"""
+        history = self.recent()
+        if not len(history):
+            return np.zeros((3, len(self.PHASES)))
+        return np.percentile(history, (50, 95, 99), axis=0)
+
+    def export_csv(self, path):
+        """Сохраняет историю кадров в CSV: номер кадра, фазы и сумма (мс)"""
+        history = self.recent()
+        first = self.frames - len(history)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("frame",) + self.PHASES + ("total",))
+            for i, row in enumerate(history.tolist()):
+                writer.writerow([first + i] + [f"{value:.4f}" for value in row] + [f"{sum(row):.4f}"])
+        return len(history)
+
+    def render_graph(self):
+        """Столбчатый график времени последних кадров: фазы друг над другом, без ожидания"""
+        width, height = self.GRAPH_SIZE
+        history = self.recent()[-width:, :-1]
+        pixels = np.full((width, height), len(self.COLORS), dtype=np.intp)
+        if len(history):
+            bounds = np.cumsum(history, axis=1) * (height / self.GRAPH_MS)
+            levels = np.arange(height)[::-1] + 0.5  # Высота пикселя над низом графика
+            phase = (bounds[:, None, :] <= levels[None, :, None]).sum(axis=2)
+            phase[phase >= history.shape[1]] = len(self.COLORS)
+            pixels[width - len(history):] = phase
+        surface = pygame.Surface((width, height))
+        pygame.surfarray.blit_array(surface, self.palette[pixels])
+        budget = height - int(height * 16.7 / self.GRAPH_MS)
+        pygame.draw.line(surface, (255, 255, 255), (0, budget), (width, budget))
+        return surface
+
+    def draw(self, screen, font, pos=(10, 130)):
+        """Рисует график и таблицу перцентилей, возвращает занятые области"""
+        if self.stats is None or self.frames - self.stats_frame >= self.stats_interval:
+            self.stats = self.percentiles()
+            self.stats_frame = self.frames
+        x, y = pos
+        rects = [screen.blit(self.render_graph(), (x, y))]
+        y += self.GRAPH_SIZE[1] + 4
+        header = text_cache.render(font, "фаза       p50    p95    p99 мс (F4 - CSV)", (255, 255, 255))
+        rects.append(screen.fill((0, 0, 0), (x, y, self.GRAPH_SIZE[0], 16 * (len(self.PHASES) + 1))))
+        screen.blit(header, (x + 4, y))
+        for i, phase in enumerate(self.PHASES):
+            row_y = y + 16 * (i + 1)
+            pygame.draw.rect(screen, self.COLORS[i], (x + 4, row_y + 3, 10, 10))
+            p50, p95, p99 = self.stats[:, i]
+            line = f"{phase:<10} {p50:6.2f} {p95:6.2f} {p99:6.2f}"
+            screen.blit(text_cache.render(font, line, (255, 255, 255)), (x + 20, row_y))
+        return rects
@@ -0,0 +1,83 @@
+"""Регулятор качества отрисовки по времени кадра"""
+
+
+class QualityGovernor:
+    """Регулятор качества: держит время кадра в бюджете, снижая качество ступенями.
+
+    Ступени накопительные: 1 - без звезд, 2 - без контуров тел, 3 - редкое
+    обновление HUD, 4 - меньше подшагов физики. Время работы кадра
+    сглаживается; ступень снижается, если сглаженное время дольше
+    down_frames кадров подряд выше down_ratio бюджета, и возвращается, если
+    оно up_frames кадров подряд ниже up_ratio бюджета. Разрыв между
+    порогами и разная длина окон не дают качеству мигать.
+    """
+
+    TIERS = ("полное", "без звезд", "без контуров", "редкий HUD", "меньше подшагов")
+
+    def __init__(self, budget, max_tier=4, down_ratio=0.95, up_ratio=0.6, down_frames=30, up_frames=180):
+        self.budget = budget
+        self.max_tier = max_tier
+        self.down_ratio = down_ratio
+        self.up_ratio = up_ratio
+        self.down_frames = down_frames
+        self.up_frames = up_frames
+        self.smoothing = 0.1
+        self.enabled = True
+        self.tier = 0
+        self.average = None  # Сглаженное время работы кадра
+        self.over = 0  # Кадров подряд выше порога снижения
+        self.under = 0  # Кадров подряд ниже порога восстановления
+
+    @property
+    def name(self):
+        return self.TIERS[self.tier]
+
+    @property
+    def stars(self):
+        return self.tier < 1
+
+    @property
+    def outlines(self):
+        return self.tier < 2
+
+    @property
+    def hud_interval(self):
+        """Раз во сколько кадров перерисовывается текст HUD"""
+        return 1 if self.tier < 3 else 10
+
+    @property
+    def substep_reduction(self):
+        return 1 if self.tier >= 4 else 0
+
+    def update(self, work_time, frames=1):
+        """Учитывает время работы кадра; возвращает True, если ступень сменилась.
+
+        frames - сколько кадров обычной частоты заменяет этот кадр (в режиме
+        простоя цикл крутится реже, а восстановление должно идти с тем же темпом).
+        """
+        if not self.enabled:
+            return False
+        if self.average is None:
+            self.average = work_time
+        else:
+            self.average += (work_time - self.average) * self.smoothing
+        if self.average > self.budget * self.down_ratio:
+            self.over += frames
+            self.under = 0
+        elif self.average < self.budget * self.up_ratio:
+            self.under += frames
+            self.over = 0
+        else:
+            self.over = self.under = 0
+        if self.over >= self.down_frames and self.tier < self.max_tier:
+            return self.set_tier(self.tier + 1)
+        if self.under >= self.up_frames and self.tier > 0:
+            return self.set_tier(self.tier - 1)
+        return False
+
+    def set_tier(self, tier):
+        """Устанавливает ступень; возвращает True, если она сменилась"""
+        changed = tier != self.tier
+        self.tier = tier
+        self.over = self.under = 0
+        return changed
@@ -0,0 +1,334 @@
+"""Отрисовка: кэш текста, сборка кадра из слоев, небо дня и ночи и пакетная отрисовка тел"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+
+class TextCache:
+    """LRU-кэш отрисованного текста.
+
+    Ключ - (шрифт, текст, цвет). Объем кэша ограничен max_bytes: при
+    переполнении вытесняются давно не использованные строки. Возвращаемые
+    поверхности общие, изменять их на месте нельзя - только копию.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # {ключ: (поверхность, размер в байтах)}
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        """Возвращает поверхность с текстом, отрисовывая ее только при промахе"""
+        key = (font, text, tuple(color))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        surface = font.render(text, True, color)
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        if size <= self.max_bytes:
+            self.entries[key] = (surface, size)
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.used_bytes -= old_size
+        return surface
+
+    def clear(self):
+        """Очищает кэш и счетчики"""
+        self.entries.clear()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        """Доля попаданий в кэш"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+# Общий кэш текста для интерфейса, меню и системы уровней
+text_cache = TextCache()
+
+
+class BatchRenderer:
+    """Пакетная отрисовка динамических тел.
+
+    Локальные вершины всех многоугольников и центры кругов из реестра
+    объектов собраны в непрерывные массивы NumPy. За кадр положения и
+    углы тел собираются одним проходом, а все вершины поворачиваются и
+    сдвигаются одной векторной операцией.
+    """
+
+    def __init__(self):
+        self.bodies = []
+        self.version = None
+        # Многоугольники: вершины подряд, для каждой вершины - индекс тела
+        self.poly_local = np.zeros((0, 2))
+        self.poly_owner = np.zeros(0, dtype=np.intp)
+        self.poly_ranges = []  # [(начало, конец, индекс тела, цвет)]
+        # Круги: смещение центра от тела и радиус
+        self.circle_offset = np.zeros((0, 2))
+        self.circle_owner = np.zeros(0, dtype=np.intp)
+        self.circle_radius = np.zeros(0)
+        self.circle_colors = []
+        # Состояние тел до последнего шага физики (для интерполяции)
+        self.prev_state = None
+        # Состояние тел, собранное при последней отрисовке
+        self.current_state = None
+        self.culled_count = 0  # Сколько тел не рисовалось в последнем кадре (вне экрана)
+        self.outlines = True  # Рисовать ли контуры тел (выбранное тело обводится всегда)
+
+    def sync(self, store):
+        """Перестраивает массивы геометрии, если набор объектов изменился"""
+        if store.version == self.version:
+            return
+        self.version = store.version
+        self.prev_state = None
+        self.current_state = None
+        entities = store.entities
+        self.bodies = [entity.body for entity in entities]
+        polygons = [entity for entity in entities if entity.vertices is not None]
+        circles = [entity for entity in entities if entity.vertices is None]
+        counts = [len(entity.vertices) for entity in polygons]
+        if polygons:
+            self.poly_local = np.concatenate([entity.vertices for entity in polygons])
+            self.poly_owner = np.repeat([entity.row for entity in polygons], counts)
+        else:
+            self.poly_local = np.zeros((0, 2))
+            self.poly_owner = np.zeros(0, dtype=np.intp)
+        ends = np.cumsum(counts).tolist()
+        self.poly_ranges = [
+            (end - count, end, entity.row, entity.color)
+            for entity, count, end in zip(polygons, counts, ends)
+        ]
+        self.circle_offset = np.array([entity.offset for entity in circles], dtype=float).reshape(-1, 2)
+        self.circle_owner = np.array([entity.row for entity in circles], dtype=np.intp)
+        self.circle_radius = np.array([entity.radius for entity in circles], dtype=float)
+        self.circle_colors = [entity.color for entity in circles]
+
+    def gather_state(self):
+        """Собирает положения и углы всех тел в массив (N, 3) одним проходом"""
+        state = np.array([(*body.position, body.angle) for body in self.bodies], dtype=float)
+        return state.reshape(-1, 3)
+
+    def current_positions(self, store):
+        """Положения тел из последней отрисовки, если набор тел с тех пор не менялся"""
+        if self.current_state is None or store.version != self.version:
+            return None
+        return self.current_state[:, 0:2]
+
+    def capture_previous(self, store):
+        """Запоминает состояние тел перед шагом физики"""
+        self.sync(store)
+        self.prev_state = self.gather_state()
+
+    def draw(self, screen, store, alpha=1.0, selected_body=None, state=None, camera=None):
+        """Отрисовывает все тела; alpha - доля интерполяции от прошлого шага.
+
+        state - готовое состояние (N, 3) в порядке реестра, если тела не
+        нужно опрашивать (например, оно пришло из процесса физики).
+        camera - камера, через которую мир переводится в экранные координаты.
+        Возвращает список прямоугольников, занятых телами.
+        """
+        self.sync(store)
+        rects = []
+        self.culled_count = 0
+        if not self.bodies:
+            return rects
+        if state is None:
+            state = self.gather_state()
+        self.current_state = state
+        if self.prev_state is not None and alpha < 1.0:
+            state = self.prev_state + (state - self.prev_state) * alpha
+        zoom = 1.0
+        if camera is not None:
+            zoom = camera.zoom
+            state = np.column_stack(((state[:, 0] - camera.x) * zoom, (state[:, 1] - camera.y) * zoom, state[:, 2]))
+        # Поворот и масштаб камеры одной матрицей
+        cos = np.cos(state[:, 2]) * zoom
+        sin = np.sin(state[:, 2]) * zoom
+        selected_entity = store.get(selected_body) if selected_body else None
+        selected = selected_entity.row if selected_entity else -1
+        # Отсечение: тела, чья описанная окружность целиком вне экрана, не рисуются
+        bound = store.column("bound") * zoom
+        x, y = state[:, 0], state[:, 1]
+        width, height = screen.get_size()
+        visible = (x + bound >= 0) & (x - bound < width) & (y + bound >= 0) & (y - bound < height)
+        self.culled_count = len(visible) - int(np.count_nonzero(visible))
+        visible = visible.tolist()
+
+        if len(self.poly_local):
+            owner = self.poly_owner
+            lx, ly = self.poly_local[:, 0], self.poly_local[:, 1]
+            c, s = cos[owner], sin[owner]
+            world = np.empty_like(self.poly_local)
+            world[:, 0] = lx * c - ly * s + state[owner, 0]
+            world[:, 1] = lx * s + ly * c + state[owner, 1]
+            points = world.tolist()
+            for start, end, index, color in self.poly_ranges:
+                if not visible[index]:
+                    continue
+                vertices = points[start:end]
+                if self.outlines or index == selected:
+                    border_color = (255, 255, 0) if index == selected else (0, 0, 0)
+                    pygame.draw.polygon(screen, color, vertices)
+                    rects.append(pygame.draw.polygon(screen, border_color, vertices, 2))
+                else:
+                    rects.append(pygame.draw.polygon(screen, color, vertices))
+
+        if len(self.circle_owner):
+            owner = self.circle_owner
+            ox, oy = self.circle_offset[:, 0], self.circle_offset[:, 1]
+            c, s = cos[owner], sin[owner]
+            centers = np.empty_like(self.circle_offset)
+            centers[:, 0] = ox * c - oy * s + state[owner, 0]
+            centers[:, 1] = ox * s + oy * c + state[owner, 1]
+            for center, radius, index, color in zip(
+                    centers.astype(int).tolist(), np.maximum(self.circle_radius * zoom, 1).astype(int).tolist(),
+                    owner.tolist(), self.circle_colors):
+                if not visible[index]:
+                    continue
+                if self.outlines or index == selected:
+                    border_color = (255, 255, 0) if index == selected else (0, 0, 0)
+                    pygame.draw.circle(screen, color, center, radius, 0)
+                    rects.append(pygame.draw.circle(screen, border_color, center, radius, 2))
+                else:
+                    rects.append(pygame.draw.circle(screen, color, center, radius, 0))
+        return rects
+
+
+class LayerCompositor:
+    """Собирает кадр из закэшированного фона и динамических слоев.
+
+    Все, что рисуется поверх фона, отмечается через mark(). В следующем
+    кадре эти области восстанавливаются из фона, и на экран выводятся
+    только измененные прямоугольники. Если фон перестроен или изменений
+    слишком много, кадр выводится целиком через flip().
+    """
+
+    def __init__(self, screen, max_rects=200, max_area_fraction=0.5):
+        self.screen = screen
+        self.max_rects = max_rects
+        self.max_area = screen.get_width() * screen.get_height() * max_area_fraction
+        self.prev_rects = []
+        self.rects = []
+        self.full = True
+
+    def invalidate(self):
+        """Требует полной перерисовки в следующем кадре"""
+        self.full = True
+
+    def begin(self, background, background_changed=False):
+        """Начинает кадр: стирает прошлые динамические слои фоном"""
+        self.full = self.full or background_changed
+        if self.full:
+            self.screen.blit(background, (0, 0))
+        else:
+            for rect in self.prev_rects:
+                self.screen.blit(background, rect, rect)
+        self.rects = []
+
+    def mark(self, rect):
+        """Отмечает область, нарисованную поверх фона"""
+        if rect:
+            self.rects.append(rect)
+
+    def mark_all(self, rects):
+        """Отмечает несколько областей"""
+        self.rects.extend(rect for rect in rects if rect)
+
+    def present(self):
+        """Выводит кадр на экран"""
+        if not self.full:
+            dirty = self.prev_rects + self.rects
+            area = sum(rect.width * rect.height for rect in dirty)
+            if len(dirty) > self.max_rects or area > self.max_area:
+                self.full = True
+        if self.full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        self.prev_rects = self.rects
+        self.full = False
+
+
+class DayNightCycle:
+    """Цикл день/ночь на заранее рассчитанных таблицах.
+
+    Цвет неба, положение солнца/луны и признак дня посчитаны для каждого
+    момента периода 0-2400 (600 - восход, 1800 - закат). Небо разбито на
+    resolution временных интервалов, и для каждого заранее построен
+    вертикальный градиент, так что кадр сводится к выборке из таблиц.
+    """
+
+    PERIOD = 2400
+
+    def __init__(self, width, height, speed=1.0, resolution=240, gradient=True):
+        self.width = width
+        self.height = height
+        self.speed = speed
+        self.resolution = resolution
+        self.time = 0.0
+
+        times = np.arange(self.PERIOD + 1, dtype=float)
+        self.is_day_table = (times >= 600) & (times < 1800)
+        # День: от светло-голубого до темно-синего, ночь: от темно-синего до черного
+        day_t = (times - 600) / 1200
+        night_t = np.where(times >= 1800, (times - 1800) / 600, (times + 600) / 600)
+        day_colors = np.array([135, 206, 250]) + np.outer(day_t, np.array([25, 102, 50]) - [135, 206, 250])
+        night_colors = np.array([25, 102, 50]) + np.outer(night_t, np.array([0, 0, 0]) - [25, 102, 50])
+        colors = np.where(self.is_day_table[:, None], day_colors, night_colors)
+        self.sky_table = np.clip(np.trunc(colors), 0, 255).astype(np.uint8)
+        # Солнце/луна: проход по небу за период, высшая точка в полдень и полночь
+        self.sun_x_table = (width * (times % self.PERIOD) / self.PERIOD).astype(int)
+        self.sun_y_table = (height // 3 - np.abs(times % 1200 - 600) / 600 * (height // 4)).astype(int)
+
+        # Интервалы неба: цвет берется по началу интервала
+        self.bucket_table = (times * resolution // (self.PERIOD + 1)).astype(int)
+        bucket_starts = np.searchsorted(self.bucket_table, np.arange(resolution))
+        bucket_colors = self.sky_table[bucket_starts].astype(float)
+        # Градиент: к зениту небо темнее, у горизонта - основной цвет
+        shade = np.linspace(0.6, 1.0, height) if gradient else np.ones(height)
+        columns = (bucket_colors[:, None, :] * shade[None, :, None]).astype(np.uint8)
+        self.sky_columns = [pygame.surfarray.make_surface(column[None, :, :]) for column in columns]
+        self.bucket_colors = [tuple(int(c) for c in color) for color in bucket_colors]
+
+    @property
+    def index(self):
+        """Текущий момент цикла как индекс в таблицах"""
+        return int(self.time)
+
+    @property
+    def bucket(self):
+        """Номер текущего интервала неба"""
+        return self.bucket_table[self.index]
+
+    @property
+    def is_day(self):
+        return bool(self.is_day_table[self.index])
+
+    @property
+    def sky_color(self):
+        """Цвет неба у горизонта в текущем интервале"""
+        return self.bucket_colors[self.bucket]
+
+    @property
+    def sun_position(self):
+        index = self.index
+        return int(self.sun_x_table[index]), int(self.sun_y_table[index])
+
+    def advance(self, ticks=1):
+        """Продвигает цикл на ticks шагов со скоростью speed"""
+        self.time = (self.time + ticks * self.speed) % (self.PERIOD + 1)
+
+    def draw_sky(self, surface):
+        """Заполняет поверхность градиентом неба текущего интервала"""
+        pygame.transform.scale(self.sky_columns[self.bucket], surface.get_size(), surface)
@@ -0,0 +1,167 @@
+"""Запись ввода в файл и его воспроизведение"""
+
+import struct
+import time
+
+import numpy as np
+import pygame
+
+
+# Формат записи ввода
+RECORD_MAGIC = b"PHYREC"
+RECORD_VERSION = 3
+RECORD_HEADER = struct.Struct("<6sHQ")
+RECORD_FRAME = struct.Struct("<fhhBHHBBH")
+RECORD_EVENT = struct.Struct("<IihhH")
+# Клавиши, состояние которых опрашивается каждый кадр (а не приходит событием)
+TRACKED_KEYS = (pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d, pygame.K_z,
+                pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN)
+
+
+class InputFrame:
+    """Ввод одного кадра: длительность кадра, события, мышь, зажатые клавиши и модификаторы.
+
+    iterations - число итераций решателя, quality - ступень качества в начале
+    кадра: они подбираются по реальному времени кадра, поэтому при
+    воспроизведении берутся из записи.
+    """
+
+    __slots__ = ("dt", "events", "mouse_pos", "mouse_buttons", "keys", "mods", "iterations", "quality")
+
+    def __init__(self, dt, events, mouse_pos, mouse_buttons, keys, mods, iterations=0, quality=0):
+        self.dt = dt
+        self.events = events
+        self.mouse_pos = mouse_pos
+        self.mouse_buttons = mouse_buttons
+        self.keys = keys
+        self.mods = mods
+        self.iterations = iterations
+        self.quality = quality
+
+
+def encode_frame(frame):
+    """Упаковывает кадр ввода в байты записи: мышь, кнопки и клавиши битовыми масками,
+    затем события (тип, клавиша или кнопка, координаты, модификаторы)"""
+    buttons = sum(1 << i for i, pressed in enumerate(frame.mouse_buttons) if pressed)
+    keys = sum(1 << i for i, key in enumerate(TRACKED_KEYS) if key in frame.keys)
+    parts = [RECORD_FRAME.pack(frame.dt, *frame.mouse_pos, buttons, keys, frame.mods,
+                               frame.iterations, frame.quality, len(frame.events))]
+    for event in frame.events:
+        code = getattr(event, "key", getattr(event, "button", 0))
+        x, y = getattr(event, "pos", (0, 0))
+        parts.append(RECORD_EVENT.pack(event.type, code, int(x), int(y), getattr(event, "mod", 0)))
+    return b"".join(parts)
+
+
+def decode_frame(data, offset):
+    """Распаковывает кадр записи, начинающийся с offset; возвращает кадр и смещение следующего"""
+    dt, x, y, buttons, keys, mods, iterations, quality, count = RECORD_FRAME.unpack_from(data, offset)
+    offset += RECORD_FRAME.size
+    events = []
+    for _ in range(count):
+        event_type, code, event_x, event_y, event_mod = RECORD_EVENT.unpack_from(data, offset)
+        offset += RECORD_EVENT.size
+        events.append(pygame.event.Event(event_type, key=code, button=code, pos=(event_x, event_y),
+                                         mod=event_mod, unicode=""))
+    frame = InputFrame(
+        dt, events, (x, y), tuple(bool(buttons & (1 << i)) for i in range(3)),
+        {key for i, key in enumerate(TRACKED_KEYS) if keys & (1 << i)}, mods, iterations, quality
+    )
+    return frame, offset
+
+
+class LiveInput:
+    """Ввод с клавиатуры и мыши в реальном времени"""
+
+    replaying = False
+
+    def __init__(self):
+        self.last_frame_time = None
+
+    def poll(self, sandbox):
+        """Собирает ввод очередного кадра"""
+        now = time.perf_counter()
+        dt = now - self.last_frame_time if self.last_frame_time else 1.0 / sandbox.fps
+        self.last_frame_time = now
+        pressed = pygame.key.get_pressed()
+        return InputFrame(
+            dt, pygame.event.get(), pygame.mouse.get_pos(), pygame.mouse.get_pressed()[:3],
+            {key for key in TRACKED_KEYS if pressed[key]}, pygame.key.get_mods(), sandbox.space.iterations,
+            sandbox.quality.tier
+        )
+
+    def close(self):
+        pass
+
+
+class InputRecorder(LiveInput):
+    """Живой ввод, который попутно записывается в файл для воспроизведения.
+
+    Формат: заголовок (RECORD_MAGIC, версия, зерно random), затем кадры в
+    упаковке encode_frame - длительность, мышь, кнопки и клавиши,
+    модификаторы, итерации решателя, ступень качества, число событий и сами события.
+    """
+
+    def __init__(self, path, seed):
+        super().__init__()
+        self.file = open(path, "wb")
+        self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, seed))
+
+    def poll(self, sandbox):
+        frame = super().poll(sandbox)
+        self.file.write(encode_frame(frame))
+        return frame
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayInput:
+    """Воспроизводит записанный ввод кадр за кадром без ожидания реального времени.
+
+    Когда запись кончается, отдает событие QUIT. summary() сводит время
+    кадров воспроизведения, чтобы сравнивать версии на одинаковых сессиях.
+    """
+
+    replaying = True
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = file.read()
+        magic, version, self.seed = RECORD_HEADER.unpack_from(self.data)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError(f"{path}: это не запись ввода поддерживаемой версии")
+        self.offset = RECORD_HEADER.size
+        self.frame_times = []
+        self.last_poll = None
+
+    @staticmethod
+    def read_seed(path):
+        """Зерно random из заголовка записи (его нужно выставить до создания песочницы)"""
+        with open(path, "rb") as file:
+            magic, version, seed = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+        return seed
+
+    def poll(self, sandbox):
+        now = time.perf_counter()
+        if self.last_poll is not None:
+            self.frame_times.append(now - self.last_poll)
+        self.last_poll = now
+        pygame.event.pump()
+        if self.offset >= len(self.data):
+            return InputFrame(0.0, [pygame.event.Event(pygame.QUIT)], (0, 0), (False, False, False),
+                              set(), 0, sandbox.space.iterations, sandbox.quality.tier)
+        frame, self.offset = decode_frame(self.data, self.offset)
+        return frame
+
+    def close(self):
+        pass
+
+    def summary(self):
+        """Строка со временем кадров воспроизведения или None, если кадров не было"""
+        times = np.array(self.frame_times) * 1000
+        if not len(times):
+            return None
+        return (f"replayed {len(times)} frames in {times.sum() / 1000:.3f} s: "
+                f"mean {times.mean():.2f} ms, p50 {np.percentile(times, 50):.2f} ms, "
+                f"p95 {np.percentile(times, 95):.2f} ms, max {times.max():.2f} ms")
@@ -0,0 +1,105 @@
+"""Двоичный столбцовый формат файла сцены"""
+
+import numpy as np
+
+
+# Двоичный формат сцены: заголовок и столбцы, каждый выровнен на 8 байт.
+# vertex_offset хранит count + 1 смещений в общем массиве вершин многоугольников
+SCENE_MAGIC = b"PHYSCENE"
+SCENE_VERSION = 1
+SCENE_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("count", "<u4"),
+                         ("vertex_count", "<u4"), ("reserved", "<u4")])
+SCENE_COLUMNS = (
+    ("kind", "u1", ()),
+    ("color", "u1", (3,)),
+    ("position", "<f4", (2,)),
+    ("angle", "<f4", ()),
+    ("velocity", "<f4", (2,)),
+    ("spin", "<f4", ()),
+    ("mass", "<f4", ()),
+    ("elasticity", "<f4", ()),
+    ("friction", "<f4", ()),
+    ("radius", "<f4", ()),
+)
+
+
+def scene_layout(count, vertex_count):
+    """Смещения столбцов файла сцены: [(имя, тип, форма, смещение)] и полный размер"""
+    layout = []
+    offset = SCENE_HEADER.itemsize
+    columns = SCENE_COLUMNS + (("vertex_offset", "<u4", ()), ("vertices", "<f4", (2,)))
+    for name, dtype, shape in columns:
+        rows = count + 1 if name == "vertex_offset" else vertex_count if name == "vertices" else count
+        shape = (rows,) + shape
+        layout.append((name, np.dtype(dtype), shape, offset))
+        offset += -(-np.dtype(dtype).itemsize * int(np.prod(shape)) // 8) * 8
+    return layout, offset
+
+
+def write_scene(path, store):
+    """Сохраняет тела реестра в двоичный столбцовый файл"""
+    bodies = store.bodies()
+    count = len(bodies)
+    state = np.array([(*body.position, body.angle, *body.velocity, body.angular_velocity)
+                      for body in bodies], dtype=float).reshape(-1, 6)
+    polygons = [entity.vertices for entity in store if entity.vertices is not None]
+    sizes = [0 if entity.vertices is None else len(entity.vertices) for entity in store]
+    columns = {
+        "kind": [entity.kind for entity in store],
+        "color": [entity.color for entity in store],
+        "position": state[:, 0:2],
+        "angle": state[:, 2],
+        "velocity": state[:, 3:5],
+        "spin": state[:, 5],
+        "mass": [entity.mass for entity in store],
+        "elasticity": [entity.elasticity for entity in store],
+        "friction": [entity.friction for entity in store],
+        "radius": [entity.radius for entity in store],
+        "vertex_offset": np.concatenate(([0], np.cumsum(sizes))),
+        "vertices": np.concatenate(polygons) if polygons else np.zeros((0, 2)),
+    }
+    layout, size = scene_layout(count, len(columns["vertices"]))
+    data = np.zeros(size, dtype=np.uint8)
+    header = np.array([(SCENE_MAGIC, SCENE_VERSION, count, len(columns["vertices"]), 0)], dtype=SCENE_HEADER)
+    data[:SCENE_HEADER.itemsize] = header.view(np.uint8)
+    for name, dtype, shape, offset in layout:
+        column = np.asarray(columns[name], dtype=dtype).reshape(shape)
+        data[offset:offset + column.nbytes] = column.reshape(-1).view(np.uint8)
+    data.tofile(path)
+    return size
+
+
+def read_scene(path):
+    """Отображает файл сцены в память и возвращает его столбцы без копирования"""
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = data[:SCENE_HEADER.itemsize].view(SCENE_HEADER)[0]
+    if header["magic"] != SCENE_MAGIC:
+        raise ValueError(f"{path}: это не файл сцены")
+    if header["version"] != SCENE_VERSION:
+        raise ValueError(f"{path}: неподдерживаемая версия сцены {header['version']}")
+    layout, size = scene_layout(int(header["count"]), int(header["vertex_count"]))
+    if len(data) < size:
+        raise ValueError(f"{path}: файл сцены обрезан")
+    return {name: data[offset:offset + dtype.itemsize * int(np.prod(shape))].view(dtype).reshape(shape)
+            for name, dtype, shape, offset in layout}
+
+
+def scene_moments(scene):
+    """Моменты инерции всех тел сцены (формулы pymunk, посчитанные массивами)"""
+    mass = scene["mass"].astype(float)
+    moments = 0.5 * mass * scene["radius"].astype(float) ** 2
+    offsets = scene["vertex_offset"].astype(np.intp)
+    polygons = np.flatnonzero(offsets[1:] > offsets[:-1])
+    if len(polygons):
+        vertices = scene["vertices"].astype(float)
+        # Следующая вершина в том же многоугольнике (с замыканием на первую)
+        following = np.arange(1, len(vertices) + 1)
+        following[offsets[polygons + 1] - 1] = offsets[polygons]
+        v1, v2 = vertices, vertices[following]
+        a = v2[:, 0] * v1[:, 1] - v2[:, 1] * v1[:, 0]
+        b = (v1 * v1).sum(axis=1) + (v1 * v2).sum(axis=1) + (v2 * v2).sum(axis=1)
+        starts = offsets[polygons]
+        sum1 = np.add.reduceat(a * b, starts)
+        sum2 = np.add.reduceat(a, starts)
+        moments[polygons] = mass[polygons] * sum1 / (6.0 * sum2)
+    return moments
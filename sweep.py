@@ -0,0 +1,135 @@
+"""Перебор параметров песочницы на пуле процессов"""
+
+import csv
+import itertools
+import multiprocessing
+import random
+import time
+
+import numpy as np
+import pygame
+
+from entities import KIND_NAMES, grid_positions, random_positions
+
+
+# Параметры перебора и соответствующие им настройки песочницы
+SWEEP_PARAMETERS = {
+    "mass": "object_mass",
+    "elasticity": "object_elasticity",
+    "friction": "object_friction",
+    "size": "object_size",
+}
+SCENARIOS = ("stack", "grid", "rain")
+
+
+def scenario_positions(scenario, count, size, width, height, seed=0):
+    """Положения объектов сценария: башня по центру, сетка или случайный "дождь" сверху"""
+    floor = height - 20
+    if scenario == "stack":
+        return [(width / 2, floor - size * (i + 0.5)) for i in range(count)]
+    if scenario == "grid":
+        spacing = size * 1.5
+        columns = max(1, int((width - 100) // spacing))
+        return grid_positions(count, (50 + size, floor - spacing * (count // columns + 1)), spacing, columns)
+    state = random.getstate()
+    random.seed(seed)
+    positions = random_positions(count, (50, 50, width - 100, height // 2 - 50))
+    random.setstate(state)
+    return positions
+
+
+def run_experiment(task):
+    """Прогоняет одну комбинацию параметров в отдельной безголовой песочнице.
+
+    task = (номер, {параметр: значение}, сценарий, тип объектов, число объектов,
+    число шагов, шагов между замерами). Возвращает номер, все параметры
+    песочницы (перебираемые и по умолчанию), шаг успокоения (первый замер, после которого все тела медленнее порога
+    засыпания; -1, если сцена не успокоилась), максимальную скорость и ряд
+    кинетической энергии по замерам.
+    """
+    from main import PhysicsSandbox  # main импортирует этот модуль
+    index, params, scenario, kind, count, steps, sample_every = task
+    random.seed(index)
+    sandbox = PhysicsSandbox(headless=True)
+    for name, value in params.items():
+        setattr(sandbox, SWEEP_PARAMETERS[name], value)
+    params = {name: getattr(sandbox, attribute) for name, attribute in SWEEP_PARAMETERS.items()}
+    positions = scenario_positions(scenario, count, sandbox.object_size, sandbox.width, sandbox.height, seed=index)
+    sandbox.spawn_bulk(kind, positions)
+    energy = []
+    top_speeds = []
+    for _ in range(steps // sample_every):
+        sandbox.simulate(sample_every)
+        state = np.array([(*body.velocity, body.angular_velocity, body.moment) for body in sandbox.entities.bodies()],
+                         dtype=float).reshape(-1, 4)
+        masses = sandbox.entities.column("mass")
+        speed = np.hypot(state[:, 0], state[:, 1])
+        energy.append(float(0.5 * (masses * speed ** 2 + state[:, 3] * state[:, 2] ** 2).sum()))
+        top_speeds.append(float(speed.max()) if len(speed) else 0.0)
+    pygame.quit()
+    moving = [i for i, speed in enumerate(top_speeds) if speed >= sandbox.idle_speed_threshold]
+    if not moving:
+        settle_step = sample_every
+    elif moving[-1] + 1 < len(top_speeds):
+        settle_step = (moving[-1] + 2) * sample_every
+    else:
+        settle_step = -1
+    return index, params, settle_step, max(top_speeds, default=0.0), energy
+
+
+def parse_sweep(specs):
+    """Разбирает ["mass=10,45", ...] в список комбинаций {параметр: значение}"""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in SWEEP_PARAMETERS or not values:
+            raise ValueError(f"неизвестный параметр перебора: {spec}")
+        grid[name] = [float(value) for value in values.split(",")]
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_sweep(args):
+    """Перебирает сетку параметров на пуле процессов и пишет результаты по мере готовности.
+
+    Каждая строка результата - параметры, шаг успокоения, максимальная
+    скорость, итоговая энергия и весь ряд энергии (energy_0 ... energy_K).
+    Файл .npy заранее размечается на все комбинации и заполняется через
+    memmap, .csv дописывается построчно.
+    """
+    combinations = parse_sweep(args.sweep)
+    kind = [name.lower() for name in KIND_NAMES].index(args.kind)
+    samples = args.steps // args.sample_every
+    count = args.spawn or 20
+    columns = (list(SWEEP_PARAMETERS) + ["settle_step", "max_speed", "final_energy"]
+               + [f"energy_{i}" for i in range(samples)])
+    tasks = [(index, params, args.scenario, kind, count, args.steps, args.sample_every)
+             for index, params in enumerate(combinations)]
+    if args.output.endswith(".npy"):
+        table = np.lib.format.open_memmap(args.output, mode="w+", dtype=np.float64,
+                                          shape=(len(tasks), len(columns)))
+        table[:] = np.nan
+        output = None
+    else:
+        table = None
+        output = open(args.output, "w", newline="")
+        writer = csv.writer(output)
+        writer.writerow(columns)
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.workers) as pool:
+            for done, (index, params, settle_step, max_speed, energy) in enumerate(
+                    pool.imap_unordered(run_experiment, tasks), 1):
+                row = ([params[name] for name in SWEEP_PARAMETERS]
+                       + [settle_step, max_speed, energy[-1] if energy else 0.0] + energy)
+                if table is not None:
+                    table[index] = row
+                    table.flush()
+                else:
+                    writer.writerow(row)
+                    output.flush()
+                print(f"[{done}/{len(tasks)}] {params}: settle step {settle_step}, max speed {max_speed:.1f}")
+    finally:
+        if output:
+            output.close()
+    print(f"{len(tasks)} experiments in {time.perf_counter() - start:.1f} s -> {args.output}")
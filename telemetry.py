@@ -0,0 +1,229 @@
+"""Телеметрия и удаленное управление по TCP"""
+
+import asyncio
+import json
+import math
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# Поток телеметрии: заголовок кадра, записи изменившихся тел и id удаленных тел.
+# Положение квантуется до 0.1 px, угол (приведенный к [-pi, pi)) - до 1e-4 рад,
+# скорость - до 1 px/s; изменения меньше кванта не передаются.
+TELEMETRY_MAGIC = b"PHTL"
+TELEMETRY_HEADER = struct.Struct("<4sIII")  # Метка, номер кадра, изменено, удалено
+TELEMETRY_RECORD = np.dtype([
+    ("id", "<u4"), ("x", "<i4"), ("y", "<i4"), ("angle", "<i2"),
+    ("vx", "<i2"), ("vy", "<i2"), ("color", "u1", (3,)),
+])
+TELEMETRY_POSITION_SCALE = 10
+TELEMETRY_ANGLE_SCALE = 10000
+TELEMETRY_KINDS = ("ball", "box", "polygon", "triangle")
+
+
+def quantize_telemetry(ids, state, colors):
+    """Квантует состояние тел в записи телеметрии, упорядоченные по id.
+
+    state - массив (N, 5): x, y, угол, vx, vy; colors - массив (N, 3).
+    """
+    records = np.zeros(len(ids), dtype=TELEMETRY_RECORD)
+    records["id"] = ids
+    records["x"] = np.round(state[:, 0] * TELEMETRY_POSITION_SCALE)
+    records["y"] = np.round(state[:, 1] * TELEMETRY_POSITION_SCALE)
+    angle = (state[:, 2] + math.pi) % (2 * math.pi) - math.pi
+    records["angle"] = np.round(angle * TELEMETRY_ANGLE_SCALE)
+    records["vx"] = np.clip(np.round(state[:, 3]), -32768, 32767)
+    records["vy"] = np.clip(np.round(state[:, 4]), -32768, 32767)
+    records["color"] = colors
+    records.sort(order="id")
+    return records
+
+
+def encode_telemetry(number, records, previous):
+    """Кадр телеметрии: записи, изменившиеся относительно previous, и id пропавших тел"""
+    if previous is None or not len(previous):
+        changed, removed = records, np.zeros(0, dtype="<u4")
+    else:
+        index = np.minimum(np.searchsorted(previous["id"], records["id"]), len(previous) - 1)
+        same = (previous["id"][index] == records["id"]) & (previous[index] == records)
+        changed = records[~same]
+        removed = previous["id"][~np.isin(previous["id"], records["id"], assume_unique=True)]
+    header = TELEMETRY_HEADER.pack(TELEMETRY_MAGIC, number & 0xFFFFFFFF, len(changed), len(removed))
+    return header + changed.tobytes() + removed.astype("<u4").tobytes()
+
+
+def parse_command(line):
+    """Разбирает строку-команду клиента (JSON) в кортеж для основного цикла.
+
+    {"cmd": "spawn", "kind": "ball", "x": 100, "y": 50}
+    {"cmd": "clear"}
+    {"cmd": "wind", "value": 0.5}
+    {"cmd": "attraction", "value": -1.0}
+    При ошибке выбрасывает ValueError.
+    """
+    try:
+        message = json.loads(line)
+        name = message["cmd"]
+        if name == "spawn":
+            kind = message["kind"]
+            if kind not in TELEMETRY_KINDS:
+                raise ValueError(f"неизвестный тип объекта: {kind!r}")
+            return ("spawn", kind, float(message["x"]), float(message["y"]))
+        if name == "clear":
+            return ("clear",)
+        if name in ("wind", "attraction"):
+            value = float(message["value"])
+            if not math.isfinite(value):
+                raise ValueError("значение силы должно быть конечным")
+            return (name, value)
+    except (KeyError, TypeError, AttributeError) as error:
+        raise ValueError(f"неверная команда: {line!r}") from error
+    raise ValueError(f"неизвестная команда: {name!r}")
+
+
+class TelemetryClient:
+    """Подключенный клиент телеметрии.
+
+    Ожидает отправки не больше одного снимка: новый снимок заменяет
+    неотправленный, поэтому медленный клиент пропускает кадры, а не копит
+    их. Дельта считается при отправке относительно того, что клиент
+    действительно получил, так что пропуски ее не портят.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.handler = None  # Задача, обслуживающая соединение
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.sent = None  # Записи, отправленные клиенту последними
+        self.dropped = 0  # Снимков заменено до отправки
+
+    def offer(self, snapshot):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = snapshot
+        self.ready.set()
+
+
+class TelemetryServer:
+    """Сервер телеметрии и управления на asyncio в фоновом потоке.
+
+    Клиенты подключаются по TCP. Сервер шлет им кадры TELEMETRY_HEADER с
+    квантованными состояниями изменившихся тел и принимает команды строками
+    JSON (см. parse_command). Основной цикл отдает снимки через publish и
+    забирает команды из ограниченной потокобезопасной очереди commands,
+    ни в том, ни в другом случае не дожидаясь сети.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, rate=20, max_commands=256, start_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.interval = 1.0 / rate
+        self.commands = queue.Queue(max_commands)
+        self.clients = set()
+        self.loop = None
+        self.stopping = None
+        self.next_publish = 0.0
+        self.rejected = 0  # Команд отброшено: неверные или очередь переполнена
+        self.error = None
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self.thread.start()
+        if not started.wait(start_timeout):
+            raise TimeoutError(f"сервер телеметрии не запустился за {start_timeout} с")
+        if self.error:
+            raise self.error
+
+    def _run(self, started):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve(started))
+        except Exception as error:
+            # Ошибка до запуска сервера поднимается заново в конструкторе
+            self.error = error
+        finally:
+            # Конструктор ждет этого события при любом исходе
+            started.set()
+            self.loop.close()
+
+    async def _serve(self, started):
+        self.stopping = self.loop.create_future()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        started.set()
+        async with server:
+            await self.stopping
+        # Закрытие соединений завершает их обработчики штатно: чтение получает конец потока
+        handlers = [client.handler for client in self.clients]
+        for client in self.clients:
+            client.writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    async def _handle(self, reader, writer):
+        client = TelemetryClient(writer)
+        client.handler = asyncio.current_task()
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._send(client))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self.commands.put_nowait(parse_command(line))
+                except (ValueError, queue.Full):
+                    self.rejected += 1
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            writer.close()
+
+    async def _send(self, client):
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                number, records = client.pending
+                client.pending = None
+                client.writer.write(encode_telemetry(number, records, client.sent))
+                client.sent = records
+                await client.writer.drain()
+        except ConnectionError:
+            client.writer.close()
+
+    def _offer(self, snapshot):
+        for client in self.clients:
+            client.offer(snapshot)
+
+    def due(self):
+        """Пора ли снимать новый кадр: есть клиенты и прошел интервал"""
+        now = time.perf_counter()
+        if not self.clients or now < self.next_publish:
+            return False
+        self.next_publish = now + self.interval
+        return True
+
+    def publish(self, number, records):
+        """Передает снимок всем клиентам (вызывается из основного потока)"""
+        self.loop.call_soon_threadsafe(self._offer, (number, records))
+
+    def poll_commands(self):
+        """Забирает все накопившиеся команды"""
+        commands = []
+        while True:
+            try:
+                commands.append(self.commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    def close(self):
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopping.set_result, None)
+        self.thread.join(timeout=2)
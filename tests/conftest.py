@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Тесты не открывают окон: SDL рисует в память
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def repo_dir(monkeypatch):
+    """Рабочий каталог - корень репозитория: шрифты меню грузятся по относительным путям"""
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def sandbox(repo_dir):
+    """Безголовая песочница"""
+    import pygame
+    from main import PhysicsSandbox
+    sandbox = PhysicsSandbox(headless=True)
+    yield sandbox
+    pygame.quit()
@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+import pytest
+
+import benchmark
+from main import PhysicsSandbox
+
+
+def test_summarize():
+    stats = benchmark.summarize(np.array([1.0, 2.0, 3.0, 10.0]))
+    assert stats["mean_ms"] == 4.0 and stats["p50_ms"] == 2.5 and stats["max_ms"] == 10.0
+
+
+def result(startup, step):
+    return {"startup": {"mean_ms": startup},
+            "scenarios": {"mixed_100": {"phases": {"step": {"mean_ms": step}, "ui": {"mean_ms": 0.01}}}}}
+
+
+def test_compare_flags_only_large_regressions(capsys):
+    baseline = result(100.0, 1.0)
+    assert benchmark.compare(result(105.0, 1.05), baseline, 0.1) == []
+    assert benchmark.compare(result(150.0, 2.0), baseline, 0.1) == ["startup", "mixed_100.step"]
+    # Рост на доли микросекунды в крошечной фазе регрессией не считается
+    tiny = result(100.0, 1.0)
+    tiny["scenarios"]["mixed_100"]["phases"]["ui"]["mean_ms"] = 0.03
+    assert benchmark.compare(tiny, baseline, 0.1) == []
+    assert "REGRESSION" in capsys.readouterr().out
+
+
+def test_compare_skips_scenarios_missing_from_baseline():
+    assert benchmark.compare(result(100.0, 1.0), {"scenarios": {}}, 0.1) == []
+
+
+def test_scenario_frames_go_through_advance_physics(repo_dir, monkeypatch):
+    calls = []
+    advance = PhysicsSandbox.advance_physics
+
+    def spy(self, frame_time):
+        calls.append(frame_time)
+        return advance(self, frame_time)
+
+    monkeypatch.setattr(PhysicsSandbox, "advance_physics", spy)
+    stats = benchmark.run_scenario("mixed_100", frames=3, warmup=2)
+    assert len(calls) == 5 and all(frame_time == pytest.approx(1 / 60) for frame_time in calls)
+    assert stats["frames"] == 3 and stats["bodies"] == 100
+    assert set(stats["phases"]) == set(benchmark.PHASES) | {"total"}
+    assert stats["phases"]["step"]["mean_ms"] > 0
+    assert all(np.isfinite(phase["mean_ms"]) for phase in stats["phases"].values())
+
+
+def test_particles_phase_times_only_the_particle_step(repo_dir, monkeypatch):
+    # Подгрузка рельефа идет своей фазой и не попадает в замер частиц
+    monkeypatch.setattr(PhysicsSandbox, "update_streaming", lambda self: time.sleep(0.005))
+    stats = benchmark.run_scenario("mixed_100", frames=3, warmup=0)
+    assert stats["phases"]["streaming"]["mean_ms"] >= 5
+    assert stats["phases"]["particles"]["mean_ms"] < 5
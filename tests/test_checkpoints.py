@@ -0,0 +1,65 @@
+import numpy as np
+
+from checkpoints import Checkpoint, CheckpointBuffer
+
+
+def make_checkpoint(count, marker=0.0, specs=None):
+    ids = np.arange(count, dtype=np.int64)
+    state = np.full((count, 6), marker)
+    return Checkpoint(ids, state, specs if specs is not None else [None] * count)
+
+
+def test_checkpoint_counts_new_specs_only_once():
+    shared = make_checkpoint(10)
+    fresh = Checkpoint(shared.ids, shared.state, shared.specs, specs_bytes=500)
+    assert shared.nbytes == 10 * 8 + 10 * 6 * 8 + 10 * 8
+    assert fresh.nbytes == shared.nbytes + 500
+
+
+def test_push_evicts_oldest_when_over_budget():
+    size = make_checkpoint(10).nbytes
+    buffer = CheckpointBuffer(max_bytes=3 * size)
+    for marker in range(5):
+        buffer.push(make_checkpoint(10, marker))
+    assert len(buffer) == 3
+    assert buffer.used_bytes == 3 * size
+    assert [buffer.pop().state[0, 0] for _ in range(3)] == [4, 3, 2]
+    assert buffer.pop() is None
+    assert buffer.used_bytes == 0
+
+
+def test_oversized_checkpoint_is_kept_alone():
+    buffer = CheckpointBuffer(max_bytes=100)
+    buffer.push(make_checkpoint(1))
+    buffer.push(make_checkpoint(50, 1.0))
+    assert len(buffer) == 1
+    assert buffer.pop().state[0, 0] == 1.0
+
+
+def test_sandbox_rewind_restores_positions(sandbox):
+    sandbox.add_ball((300, 300))
+    body = sandbox.entities.entities[0].body
+    sandbox.checkpoints.push(sandbox.capture_checkpoint())
+    for _ in range(30):
+        sandbox.step_physics(sandbox.physics_dt)
+    assert body.position.y > 300
+    assert sandbox.rewind()
+    assert tuple(body.position) == (300, 300)
+    assert not sandbox.rewind()
+
+
+def test_sandbox_restore_rebuilds_space_with_saved_materials(sandbox):
+    sandbox.add_box((300, 300), size=15, elasticity=0, friction=0)
+    sandbox.add_ball((500, 300), radius=8, elasticity=0.2, friction=0.1)
+    sandbox.checkpoints.push(sandbox.capture_checkpoint())
+    old_space = sandbox.space
+    sandbox.add_ball((700, 300))
+    sandbox.object_elasticity, sandbox.object_friction = 0.9, 1.5
+    assert sandbox.rewind()
+    # Набор тел изменился - пространство пересоздано по описаниям из снимка
+    assert sandbox.space is not old_space and len(sandbox.entities) == 2
+    box, ball = sandbox.entities.entities
+    assert (box.shape.elasticity, box.shape.friction) == (0, 0)
+    assert (ball.shape.elasticity, ball.shape.friction) == (0.2, 0.1)
+    assert ball.shape.radius == 8 and tuple(box.body.position) == (300, 300)
+    assert all(entity.body.space is sandbox.space for entity in sandbox.entities)
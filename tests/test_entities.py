@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+import pymunk
+import pytest
+
+from entities import KIND_BALL, KIND_BOX, BodyPool, EntityStore, grid_positions, random_positions
+
+
+def make_box(mass=2.0, size=10):
+    body = pymunk.Body(mass, 1)
+    half = size / 2
+    shape = pymunk.Poly(body, [(-half, -half), (half, -half), (half, half), (-half, half)])
+    shape.elasticity = 0.3
+    shape.friction = 0.6
+    return body, shape
+
+
+def make_ball(radius=5, offset=(0, 0)):
+    body = pymunk.Body(1, 1)
+    return body, pymunk.Circle(body, radius, offset)
+
+
+def test_add_assigns_ids_rows_and_body_lookup():
+    store = EntityStore()
+    body, shape = make_box()
+    entity = store.add(body, shape, KIND_BOX, (1, 2, 3))
+    other = store.add(*make_ball(), KIND_BALL, (4, 5, 6))
+    assert (entity.id, entity.row, other.id, other.row) == (0, 0, 1, 1)
+    assert body.entity_id == 0
+    assert store.get(body) is entity
+    assert store.get(pymunk.Body(1, 1)) is None
+    assert (entity.mass, entity.elasticity, entity.friction) == (2.0, 0.3, 0.6)
+
+
+def test_remove_moves_last_entity_into_hole():
+    store = EntityStore()
+    entities = [store.add(*make_ball(), KIND_BALL, (0, 0, 0)) for _ in range(4)]
+    version = store.version
+    store.remove(entities[1])
+    assert [entity.id for entity in store] == [0, 3, 2]
+    assert entities[3].row == 1 and entities[1].row == -1
+    assert 1 not in store.by_id
+    assert store.version == version + 1
+    # Удаление последней записи ничего не переставляет
+    store.remove(entities[2])
+    assert [entity.row for entity in store] == [0, 1]
+
+
+def test_explicit_ids_keep_next_id_ahead():
+    store = EntityStore()
+    store.add(*make_ball(), KIND_BALL, (0, 0, 0), entity_id=10)
+    assert store.add(*make_ball(), KIND_BALL, (0, 0, 0)).id == 11
+
+
+def test_columns_and_bodies_are_cached_until_store_changes():
+    store = EntityStore()
+    store.add(*make_box(mass=2.0), KIND_BOX, (0, 0, 0))
+    store.add(*make_box(mass=5.0), KIND_BOX, (0, 0, 0))
+    masses = store.column("mass")
+    np.testing.assert_array_equal(masses, [2.0, 5.0])
+    assert store.column("mass") is masses
+    bodies = store.bodies()
+    assert store.bodies() is bodies
+    store.add(*make_box(mass=7.0), KIND_BOX, (0, 0, 0))
+    np.testing.assert_array_equal(store.column("mass"), [2.0, 5.0, 7.0])
+    assert len(store.bodies()) == 3
+    store.clear()
+    assert len(store) == 0 and len(store.column("mass")) == 0
+
+
+def test_geometry_bounds():
+    store = EntityStore()
+    box = store.add(*make_box(size=10), KIND_BOX, (0, 0, 0))
+    ball = store.add(*make_ball(radius=5, offset=(3, 4)), KIND_BALL, (0, 0, 0))
+    assert box.radius == pytest.approx(math.hypot(5, 5))
+    assert box.bound == pytest.approx(box.radius)
+    assert ball.vertices is None
+    assert ball.bound == pytest.approx(5 + 5)
+
+
+def test_body_pool_returns_released_pairs_by_kind():
+    pool = BodyPool(max_per_kind=2)
+    assert pool.acquire(KIND_BALL) is None
+    pairs = [make_ball() for _ in range(3)]
+    for body, shape in pairs:
+        pool.release(KIND_BALL, body, shape)
+    # Сверх лимита на тип пары отбрасываются
+    assert len(pool) == 2
+    assert pool.acquire(KIND_BOX) is None
+    assert pool.acquire(KIND_BALL) == pairs[1]
+    assert pool.acquire(KIND_BALL) == pairs[0]
+    assert pool.acquire(KIND_BALL) is None
+    pool.release(KIND_BOX, *make_box())
+    pool.clear()
+    assert len(pool) == 0
+
+
+def test_grid_positions_fill_rows_left_to_right():
+    assert grid_positions(5, (10, 20), 5, 2) == [(10, 20), (15, 20), (10, 25), (15, 25), (10, 30)]
+    assert grid_positions(0, (0, 0), 1, 3) == []
+
+
+def test_random_positions_stay_inside_region():
+    positions = random_positions(200, (10, 20, 30, 40))
+    assert len(positions) == 200
+    assert all(10 <= x <= 40 and 20 <= y <= 60 for x, y in positions)
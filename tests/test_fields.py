@@ -0,0 +1,102 @@
+import numpy as np
+import pymunk
+import pytest
+
+from entities import KIND_BALL, EntityStore
+from fields import DragField, ForceField, ForceFieldSystem, PointAttractor, UniformField, VortexField
+
+
+def add_ball(space, store, pos, mass=1.0):
+    body = pymunk.Body(mass, 1)
+    body.position = pos
+    shape = pymunk.Circle(body, 5)
+    space.add(body, shape)
+    store.add(body, shape, KIND_BALL, (0, 0, 0))
+    return body
+
+
+def test_force_field_is_abstract():
+    with pytest.raises(TypeError):
+        ForceField()
+
+
+def test_uniform_field_acts_only_inside_region():
+    field = UniformField((10, -5), region=(0, 0, 100, 100))
+    positions = np.array([[50.0, 50.0], [150.0, 50.0]])
+    forces = field.forces(positions, np.zeros((2, 2)), np.ones(2))
+    np.testing.assert_array_equal(forces, [[10, -5], [0, 0]])
+    assert not UniformField((0, 0)).is_active()
+
+
+def test_attractor_pulls_towards_center_and_vortex_turns_it():
+    positions = np.array([[100.0, 0.0], [0.0, 300.0]])
+    masses = np.array([1.0, 2.0])
+    attractor = PointAttractor((0, 0), strength=1000, radius=100)
+    forces = attractor.forces(positions, np.zeros((2, 2)), masses)
+    # Ускорение strength / (1 + (d / radius)^2), направленное к центру
+    np.testing.assert_allclose(forces, [[-500, 0], [0, -2 * 100]])
+    repelled = PointAttractor((0, 0), strength=-1000, radius=100).forces(positions, np.zeros((2, 2)), masses)
+    np.testing.assert_allclose(repelled, -forces)
+    swirl = VortexField((0, 0), strength=1000, radius=100).forces(positions, np.zeros((2, 2)), masses)
+    np.testing.assert_allclose((swirl * forces).sum(axis=1), 0, atol=1e-9)
+    np.testing.assert_allclose(np.hypot(*swirl.T), np.hypot(*forces.T))
+
+
+def test_drag_opposes_velocity_in_proportion_to_mass():
+    velocities = np.array([[10.0, 0.0], [0.0, -4.0]])
+    forces = DragField(0.5).forces(np.zeros((2, 2)), velocities, np.array([1.0, 3.0]))
+    np.testing.assert_allclose(forces, [[-5, 0], [0, 6]])
+
+
+def test_apply_sets_forces_on_awake_bodies_and_keeps_gravity():
+    space = pymunk.Space()
+    space.gravity = (0, 900)
+    space.sleep_time_threshold = 0.5
+    store = EntityStore()
+    awake = add_ball(space, store, (50, 50), mass=2.0)
+    asleep = add_ball(space, store, (500, 50))
+    asleep.sleep()
+    system = ForceFieldSystem()
+    system.add(UniformField((30, 0)))
+    system.add(PointAttractor((50, 150), strength=100, radius=100))
+    system.apply(store)
+    assert tuple(awake.force) == pytest.approx((30, 2 * 100 / 2))
+    assert asleep.is_sleeping and tuple(asleep.force) == (0, 0)
+    assert tuple(space.gravity) == (0, 900)
+
+
+def test_apply_without_active_fields_leaves_bodies_alone():
+    space = pymunk.Space()
+    store = EntityStore()
+    body = add_ball(space, store, (0, 0))
+    system = ForceFieldSystem()
+    field = system.add(UniformField((5, 5)))
+    field.enabled = False
+    system.apply(store)
+    assert tuple(body.force) == (0, 0)
+    system.remove(field)
+    assert not system.fields
+
+
+def test_sandbox_wind_does_not_touch_gravity(sandbox):
+    sandbox.add_ball((300, 300))
+    sandbox.wind_strength = 2.0
+    sandbox.global_forces_enabled = True
+    sandbox.step_physics(sandbox.physics_dt)
+    assert tuple(sandbox.space.gravity) == tuple(sandbox.gravity)
+    body = sandbox.entities.entities[0].body
+    assert body.velocity.x > 0
+
+
+def test_wind_wakes_a_settled_scene(sandbox):
+    for x in range(200, 700, 100):
+        sandbox.add_box((x, sandbox.height - 60), mass=1)
+    for _ in range(int(3 / sandbox.physics_dt)):
+        sandbox.step_physics(sandbox.physics_dt)
+    bodies = sandbox.entities.bodies()
+    assert all(body.is_sleeping for body in bodies)
+    start = [body.position.x for body in bodies]
+    sandbox.wind_strength = 50
+    for _ in range(30):
+        sandbox.step_physics(sandbox.physics_dt)
+    assert all(body.position.x > x + 1 for body, x in zip(bodies, start))
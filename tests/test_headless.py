@@ -0,0 +1,32 @@
+import random
+
+import pytest
+
+from main import parse_args, run_headless
+from scene import read_scene
+
+
+def test_simulate_steps_free_fall_without_rendering(sandbox):
+    sandbox.add_ball((300, 100))
+    body = sandbox.entities.entities[0].body
+    frames = []
+    sandbox.simulate(60, render_every=20, frame_callback=frames.append)
+    assert frames == [20, 40, 60]
+    dt, g = sandbox.physics_dt, sandbox.gravity[1]
+    # Chipmunk сдвигает тела в начале шага, скоростью с прошлого шага
+    assert body.velocity.y == pytest.approx(g * dt * 60)
+    assert body.position.y == pytest.approx(100 + g * dt * dt * 60 * 59 / 2)
+    assert body.position.x == pytest.approx(300)
+
+
+def test_run_headless_simulates_and_saves_scene(repo_dir, tmp_path, capsys):
+    path = str(tmp_path / "scene.bin")
+    random.seed(0)
+    run_headless(parse_args(["--headless", "--steps", "300", "--spawn", "6", "--save-scene", path]))
+    output = capsys.readouterr().out
+    assert "300 steps in" in output and "6 bodies" in output
+    scene = read_scene(path)
+    assert len(scene["kind"]) == 6
+    # Объекты появляются в верхней половине экрана и за 300 шагов падают ниже
+    assert (scene["position"][:, 1] > 300).all()
+    assert (scene["velocity"][:, 1] > 0).any()
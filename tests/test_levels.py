@@ -0,0 +1,62 @@
+import random
+
+from main import EVENT_OBJECT_CREATED, EVENT_SHAPE_USED, EVENT_SPEED_REACHED, LevelSystem
+
+
+def make_levels(*tasks):
+    levels = LevelSystem()
+    levels.tasks = [dict(task, current=0) for task in tasks]
+    levels.index_tasks()
+    return levels
+
+
+def test_events_reach_only_subscribed_tasks():
+    levels = make_levels({"name": "Create objects", "event": EVENT_OBJECT_CREATED, "target": 5, "reward": 50})
+    assert levels.wants(EVENT_OBJECT_CREATED)
+    assert not levels.wants(EVENT_SPEED_REACHED)
+    levels.emit(EVENT_SPEED_REACHED, 3)
+    levels.emit(EVENT_OBJECT_CREATED, 2)
+    assert levels.tasks[0]["current"] == 2
+
+
+def test_update_task_finds_task_by_name():
+    levels = make_levels({"name": "Reach speed 100", "event": EVENT_SPEED_REACHED, "target": 5, "reward": 100})
+    levels.update_task("Reach speed 100", 3)
+    levels.update_task("Missing task")
+    assert levels.tasks_by_name["Reach speed 100"]["current"] == 3
+
+
+def test_unique_task_counts_new_values_only():
+    levels = make_levels(
+        {"name": "Use all shapes", "event": EVENT_SHAPE_USED, "target": 4, "reward": 150, "unique": "type"},
+        {"name": "Create objects", "event": EVENT_OBJECT_CREATED, "target": 99, "reward": 50},
+    )
+    for shape in ("Ball", "Ball", "Box", None, "Box", "Polygon"):
+        levels.emit(EVENT_SHAPE_USED, type=shape)
+    assert levels.tasks_by_name["Use all shapes"]["current"] == 3
+    levels.emit(EVENT_SHAPE_USED, type="Triangle")
+    assert "Use all shapes" not in levels.tasks_by_name
+    assert levels.level == 2 and levels.current_xp == 50  # 150 XP: 100 на уровень и остаток
+
+
+def test_completing_last_task_with_level_up_regenerates_tasks():
+    random.seed(0)
+    levels = make_levels({"name": "Create objects", "event": EVENT_OBJECT_CREATED, "target": 1, "reward": 100})
+    levels.emit(EVENT_OBJECT_CREATED)
+    assert levels.level == 2 and levels.current_xp == 0
+    assert len(levels.tasks) == 2
+    assert all(task["current"] == 0 for task in levels.tasks)
+    assert set(levels.tasks_by_name) == {task["name"] for task in levels.task_pool}
+
+
+def test_level_up_during_emit_skips_replaced_tasks():
+    levels = make_levels(
+        {"name": "First", "event": EVENT_OBJECT_CREATED, "target": 1, "reward": 100},
+        {"name": "Second", "event": EVENT_OBJECT_CREATED, "target": 1, "reward": 50},
+    )
+    random.seed(0)
+    levels.emit(EVENT_OBJECT_CREATED)
+    # Первое задание подняло уровень и сменило задания: второе, устаревшее, не засчитывается
+    assert levels.level == 2 and levels.current_xp == 0
+    assert [task["name"] for task in levels.completed_tasks] == ["First"]
+    assert all(task["current"] == 0 for task in levels.tasks)
@@ -0,0 +1,137 @@
+import numpy as np
+import pymunk
+
+from entities import KIND_BOX, EntityStore
+from particles import ParticleSystem, expand_ranges
+
+FLOOR = 500.0
+WALLS = (100.0, 400.0)
+RADIUS = 2.0
+
+
+def make_box_walls(space=None):
+    """Статические отрезки: пол, две стены и наклонный уступ"""
+    body = space.static_body if space else pymunk.Body(body_type=pymunk.Body.STATIC)
+    left, right = WALLS
+    segments = [pymunk.Segment(body, (left, FLOOR), (right, FLOOR), 2),
+                pymunk.Segment(body, (left, 0), (left, FLOOR), 2),
+                pymunk.Segment(body, (right, 0), (right, FLOOR), 2),
+                pymunk.Segment(body, (left, 300), (250, 380), 2)]
+    for segment in segments:
+        segment.elasticity = 0.5
+        segment.friction = 0.8
+    if space:
+        space.add(*segments)
+    return segments
+
+
+def make_system(count=400, top=100.0, seed=0):
+    particles = ParticleSystem(capacity=count)
+    particles.set_segments(make_box_walls())
+    columns = 50
+    index = np.arange(count)
+    positions = np.column_stack((WALLS[0] + 10 + (index % columns) * 2.5 * RADIUS, top + (index // columns) * 2.5 * RADIUS))
+    particles.spawn(positions, RADIUS, 0.1, 0.3, 0.5, (200, 180, 120), np.random.default_rng(seed))
+    return particles
+
+
+def segment_distance(particles, segment):
+    """Расстояния от центров частиц до отрезка"""
+    a, b = np.array(segment.a), np.array(segment.b)
+    points = np.column_stack((particles.x[:particles.count], particles.y[:particles.count]))
+    t = np.clip(((points - a) @ (b - a)) / ((b - a) @ (b - a)), 0, 1)
+    return np.hypot(*(points - (a + t[:, None] * (b - a))).T)
+
+
+def test_expand_ranges():
+    owner, items = expand_ranges(np.array([5, 0, 2]), np.array([7, 0, 5]))
+    assert owner.tolist() == [0, 0, 2, 2, 2]
+    assert items.tolist() == [5, 6, 2, 3, 4]
+    owner, items = expand_ranges(np.array([3]), np.array([1]))
+    assert not len(owner) and not len(items)
+
+
+def test_grains_settle_inside_static_geometry_without_loss():
+    particles = make_system()
+    for _ in range(240):
+        particles.step(1 / 60, (0, 900))
+    count = particles.count
+    assert count == 400
+    for name in ("x", "y", "vx", "vy"):
+        assert np.isfinite(getattr(particles, name)[:count]).all()
+    # Допуск - доля радиуса: контакты решаются по положениям за конечное число проходов
+    for segment in make_box_walls():
+        assert segment_distance(particles, segment).min() >= RADIUS + segment.radius - 0.5 * RADIUS
+    assert (particles.y[:count] < FLOOR).all()
+    assert ((particles.x[:count] > WALLS[0]) & (particles.x[:count] < WALLS[1])).all()
+    # Куча успокаивается и засыпает
+    assert np.hypot(particles.vx[:count], particles.vy[:count]).max() < particles.bounce_threshold
+
+
+def test_kinetic_energy_does_not_grow_without_gravity():
+    particles = make_system(top=150.0)
+    rng = np.random.default_rng(1)
+    count = particles.count
+    particles.vx[:count] = rng.uniform(-200, 200, count)
+    particles.vy[:count] = rng.uniform(-200, 200, count)
+
+    def energy():
+        return float((0.5 / particles.inv_mass[:count] * (particles.vx[:count] ** 2 + particles.vy[:count] ** 2)).sum())
+
+    start = energy()
+    previous = start
+    for _ in range(60):
+        particles.step(1 / 60, (0, 0))
+        current = energy()
+        # Усреднение поправок в плотной куче может на шаге добавить сотые доли процента
+        assert current <= previous * 1.01
+        previous = current
+    assert particles.count == count and previous < 0.5 * start
+
+
+def test_zero_or_negative_dt_changes_nothing():
+    particles = make_system(count=50)
+    particles.vy[:50] = 100
+    before = {name: getattr(particles, name)[:50].copy() for name in ParticleSystem.FIELDS}
+    particles.step(0.0, (0, 900))
+    particles.step(-1 / 60, (0, 900))
+    for name, values in before.items():
+        np.testing.assert_array_equal(getattr(particles, name)[:50], values)
+
+
+def test_grains_do_not_sink_into_bodies():
+    space = pymunk.Space()
+    make_box_walls(space)
+    store = EntityStore()
+    # Пространство не шагается: тело получает импульсы частиц, но остается на месте
+    body = pymunk.Body(50, pymunk.moment_for_box(50, (60, 20)))
+    body.position = (175, 250)
+    shape = pymunk.Poly.create_box(body, (60, 20))
+    shape.elasticity, shape.friction = 0.3, 0.6
+    space.add(body, shape)
+    store.add(body, shape, KIND_BOX, (0, 0, 0), np.array(shape.get_vertices()))
+    particles = make_system(count=300, top=150.0)
+    for _ in range(120):
+        particles.step(1 / 60, (0, 900), store, np.arange(1))
+    x, y = particles.x[:particles.count], particles.y[:particles.count]
+    inside = (np.abs(x - 175) < 30 - 0.5 * RADIUS) & (np.abs(y - 250) < 10 - 0.5 * RADIUS)
+    assert particles.count == 300 and not inside.any()
+
+
+def test_remove_outside_keeps_order_of_survivors():
+    import pygame
+    particles = make_system(count=10)
+    particles.x[:10] = np.arange(10) * 100
+    assert particles.remove_outside(pygame.Rect(0, 0, 450, 1000)) == 5
+    assert particles.x[:particles.count].tolist() == [0, 100, 200, 300, 400]
+
+
+def test_sandbox_step_skips_non_positive_dt(sandbox):
+    sandbox.spawn_particles(100)
+    y = sandbox.particles.y[:100].copy()
+    sandbox.step_particles(0.0)
+    np.testing.assert_array_equal(sandbox.particles.y[:100], y)
+    for _ in range(30):
+        sandbox.step_particles(1 / 60)
+    assert sandbox.particles.count == 100
+    assert (sandbox.particles.y[:100] > y).all()
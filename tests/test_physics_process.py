@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from physics_process import SharedTransforms
+
+
+@pytest.fixture
+def transforms():
+    transforms = SharedTransforms(capacity=4)
+    yield transforms
+    transforms.close()
+
+
+def rows(count, value):
+    return np.full((count, len(SharedTransforms.COLUMNS)), value, dtype=float)
+
+
+def test_reader_sees_last_publication_without_copy(transforms):
+    reader = SharedTransforms(capacity=4, name=transforms.name)
+    try:
+        assert len(reader.acquire()) == 0
+        assert transforms.publish(1, rows(2, 1.0))
+        front = reader.acquire()
+        assert reader.step == 1
+        np.testing.assert_array_equal(front, rows(2, 1.0))
+        assert np.shares_memory(front, reader.buffers)
+    finally:
+        reader.close()
+
+
+def test_writer_skips_buffer_pinned_by_reader(transforms):
+    transforms.publish(1, rows(1, 1.0))
+    pinned = transforms.acquire()
+    # Задний буфер свободен: вторая публикация проходит и становится передней
+    assert transforms.publish(2, rows(1, 2.0))
+    # Теперь задний буфер - закрепленный читателем, его трогать нельзя
+    assert not transforms.writable()
+    assert not transforms.publish(3, rows(1, 3.0))
+    np.testing.assert_array_equal(pinned, rows(1, 1.0))
+    assert transforms.step == 2
+    np.testing.assert_array_equal(transforms.acquire(), rows(1, 2.0))
+    assert transforms.writable()
+
+
+def test_publish_truncates_to_capacity(transforms):
+    transforms.publish(1, rows(6, 5.0))
+    assert len(transforms.acquire()) == 4
+
+
+def test_worker_keeps_zero_friction_of_spawned_bodies(repo_dir):
+    import time
+
+    import pygame
+
+    from main import PhysicsSandbox
+    sandbox = PhysicsSandbox(headless=True, split=True)
+    client = sandbox.physics_client
+    try:
+        floor = sandbox.height - 40
+        sandbox.add_box((300, floor), mass=1, friction=0)
+        sandbox.add_box((600, floor), mass=1)
+        # Ветер 100 Н не сдвигает ящик с обычным трением, а скользкий уезжает
+        client.set_forces(1.0, 0, True)
+        start = client.read(sandbox.entities)[:, 0].copy()
+        deadline = time.monotonic() + 10
+        moved = np.zeros(2)
+        while time.monotonic() < deadline and moved[0] < 30:
+            time.sleep(0.05)
+            moved = client.read(sandbox.entities)[:, 0] - start
+        assert moved[0] >= 30
+        assert abs(moved[1]) < 5
+    finally:
+        client.close()
+        pygame.quit()
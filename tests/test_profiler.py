@@ -0,0 +1,69 @@
+import csv
+
+import numpy as np
+import pygame
+import pytest
+
+from profiler import FrameProfiler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет perf_counter ручными часами"""
+    now = [0.0]
+    monkeypatch.setattr("profiler.time.perf_counter", lambda: now[0])
+    return now
+
+
+def record_frame(profiler, clock, durations):
+    profiler.begin_frame()
+    for phase, duration in durations:
+        clock[0] += duration
+        profiler.mark(phase)
+    profiler.end_frame()
+
+
+def test_marks_accumulate_per_phase(clock):
+    profiler = FrameProfiler(capacity=4, enabled=True)
+    record_frame(profiler, clock, [("events", 0.001), ("step", 0.004), ("events", 0.002)])
+    frame = profiler.recent()[0]
+    assert frame[profiler.slots["events"]] == pytest.approx(3.0)
+    assert frame[profiler.slots["step"]] == pytest.approx(4.0)
+    assert frame.sum() == pytest.approx(7.0)
+
+
+def test_disabled_profiler_records_nothing(clock):
+    profiler = FrameProfiler(capacity=4)
+    record_frame(profiler, clock, [("step", 0.01)])
+    assert profiler.frames == 0 and len(profiler.recent()) == 0
+    assert profiler.percentiles().shape == (3, len(FrameProfiler.PHASES))
+
+
+def test_ring_buffer_keeps_latest_frames_in_order(clock):
+    profiler = FrameProfiler(capacity=3, enabled=True)
+    for i in range(1, 6):
+        record_frame(profiler, clock, [("step", i / 1000)])
+    step = profiler.recent()[:, profiler.slots["step"]]
+    np.testing.assert_allclose(step, [3, 4, 5], rtol=1e-5)
+    np.testing.assert_allclose(profiler.percentiles()[0, profiler.slots["step"]], 4, rtol=1e-5)
+
+
+def test_export_csv_numbers_frames_from_first_kept(clock, tmp_path):
+    profiler = FrameProfiler(capacity=2, enabled=True)
+    for i in range(1, 4):
+        record_frame(profiler, clock, [("hud", i / 1000), ("wait", 0.001)])
+    path = tmp_path / "frames.csv"
+    assert profiler.export_csv(path) == 2
+    with open(path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["frame", *FrameProfiler.PHASES, "total"]
+    assert [row[0] for row in rows[1:]] == ["1", "2"]
+    assert float(rows[2][1 + profiler.slots["hud"]]) == pytest.approx(3.0)
+    assert float(rows[2][-1]) == pytest.approx(4.0)
+
+
+def test_graph_has_fixed_size(clock):
+    profiler = FrameProfiler(capacity=10, enabled=True)
+    record_frame(profiler, clock, [("step", 0.01)])
+    assert profiler.render_graph().get_size() == FrameProfiler.GRAPH_SIZE
+    pygame.quit()
@@ -0,0 +1,70 @@
+import pytest
+
+from main import parse_args
+from quality import QualityGovernor
+
+
+def make_governor():
+    governor = QualityGovernor(budget=0.010, down_frames=5, up_frames=10)
+    governor.smoothing = 1.0  # Без сглаживания: среднее равно последнему кадру
+    return governor
+
+
+def feed(governor, work_time, count):
+    return [governor.update(work_time) for _ in range(count)]
+
+
+def test_lowers_quality_after_sustained_overload():
+    governor = make_governor()
+    assert feed(governor, 0.012, 5) == [False] * 4 + [True]
+    assert governor.tier == 1 and not governor.stars and governor.outlines
+    feed(governor, 0.012, 5 * 10)
+    assert governor.tier == governor.max_tier
+    assert governor.substep_reduction == 1 and governor.hud_interval == 10
+
+
+def test_band_between_thresholds_holds_tier():
+    governor = make_governor()
+    feed(governor, 0.012, 5)
+    # Между 60% и 95% бюджета ступень не меняется ни в какую сторону
+    assert not any(feed(governor, 0.008, 100))
+    assert governor.tier == 1
+
+
+def test_single_spike_resets_recovery_window():
+    governor = make_governor()
+    feed(governor, 0.012, 5)
+    feed(governor, 0.002, 9)
+    feed(governor, 0.012, 1)
+    assert not any(feed(governor, 0.002, 9))
+    assert governor.update(0.002) and governor.tier == 0
+
+
+def test_idle_frames_count_as_several():
+    governor = make_governor()
+    feed(governor, 0.012, 5)
+    assert governor.update(0.0, frames=10) and governor.tier == 0
+
+
+def test_smoothing_ignores_short_spikes():
+    governor = QualityGovernor(budget=0.010, down_frames=3)
+    feed(governor, 0.002, 10)
+    assert not any(feed(governor, 0.050, 2))
+    assert governor.tier == 0
+
+
+def test_disabled_governor_and_set_tier():
+    governor = make_governor()
+    governor.enabled = False
+    assert not any(feed(governor, 1.0, 50))
+    assert governor.set_tier(3) and governor.name == QualityGovernor.TIERS[3]
+    assert not governor.set_tier(3)
+
+
+def test_quality_flag_accepts_only_known_tiers(capsys):
+    assert parse_args(["--quality", "3"]).quality == "3"
+    assert parse_args([]).quality == "auto"
+    for value in ("high", "5", "-1"):
+        with pytest.raises(SystemExit):
+            parse_args(["--quality", value])
+    assert "invalid choice" in capsys.readouterr().err
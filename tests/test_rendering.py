@@ -0,0 +1,228 @@
+import math
+
+import numpy as np
+import pygame
+import pymunk
+import pytest
+
+from entities import KIND_BALL, KIND_BOX, EntityStore
+from rendering import BatchRenderer, DayNightCycle, LayerCompositor, TextCache
+
+
+class FakeFont:
+    """Шрифт, который рисует строку прямоугольником 10x10 пикселей на символ"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def render(self, text, antialias, color):
+        self.calls += 1
+        surface = pygame.Surface((10 * len(text), 10), 0, 32)
+        surface.fill(color)
+        return surface
+
+
+def add_box(store, pos, size=20, angle=0.0):
+    body = pymunk.Body(1, 1)
+    body.position = pos
+    body.angle = angle
+    half = size / 2
+    vertices = [(-half, -half), (half, -half), (half, half), (-half, half)]
+    return store.add(body, pymunk.Poly(body, vertices), KIND_BOX, (255, 0, 0), vertices)
+
+
+def add_ball(store, pos, radius=10):
+    body = pymunk.Body(1, 1)
+    body.position = pos
+    return store.add(body, pymunk.Circle(body, radius), KIND_BALL, (0, 255, 0))
+
+
+@pytest.fixture
+def screen():
+    return pygame.Surface((200, 100))
+
+
+def test_draws_box_at_body_transform(screen):
+    store = EntityStore()
+    add_box(store, (50, 40))
+    rects = BatchRenderer().draw(screen, store)
+    assert len(rects) == 1
+    assert rects[0].center == pytest.approx((50, 40), abs=1)
+    assert rects[0].width == pytest.approx(21, abs=2)
+    assert screen.get_at((50, 40))[:3] == (255, 0, 0)
+
+
+def test_rotation_turns_polygon_vertices(screen):
+    store = EntityStore()
+    add_box(store, (100, 50), size=40, angle=math.pi / 4)
+    rect = BatchRenderer().draw(screen, store)[0]
+    # Повернутый на 45 градусов квадрат шире исходного в sqrt(2) раз
+    assert rect.width == pytest.approx(40 * math.sqrt(2), abs=3)
+
+
+def test_ball_center_follows_body(screen):
+    store = EntityStore()
+    add_ball(store, (150, 60), radius=10)
+    rects = BatchRenderer().draw(screen, store)
+    assert rects[0].center == pytest.approx((150, 60), abs=1)
+    assert screen.get_at((150, 60))[:3] == (0, 255, 0)
+
+
+def test_bodies_outside_screen_are_culled(screen):
+    store = EntityStore()
+    add_box(store, (50, 50))
+    add_box(store, (500, 50))
+    add_ball(store, (-100, -100))
+    renderer = BatchRenderer()
+    rects = renderer.draw(screen, store)
+    assert len(rects) == 1
+    assert renderer.culled_count == 2
+
+
+def test_interpolates_between_previous_and_current_state(screen):
+    store = EntityStore()
+    entity = add_ball(store, (40, 50))
+    renderer = BatchRenderer()
+    renderer.capture_previous(store)
+    entity.body.position = (80, 50)
+    rect = renderer.draw(screen, store, alpha=0.5)[0]
+    assert rect.center == pytest.approx((60, 50), abs=1)
+
+
+def test_current_positions_reset_when_store_changes(screen):
+    store = EntityStore()
+    add_box(store, (30, 30))
+    renderer = BatchRenderer()
+    renderer.draw(screen, store)
+    np.testing.assert_allclose(renderer.current_positions(store), [[30, 30]])
+    add_box(store, (60, 30))
+    assert renderer.current_positions(store) is None
+
+
+def test_text_cache_renders_each_key_once():
+    cache = TextCache()
+    font = FakeFont()
+    first = cache.render(font, "abc", (255, 255, 255))
+    assert cache.render(font, "abc", [255, 255, 255]) is first
+    cache.render(font, "abc", (0, 0, 0))
+    assert font.calls == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.hit_rate == pytest.approx(1 / 3)
+    assert cache.used_bytes == 2 * 30 * 10 * 4
+
+
+def test_text_cache_evicts_least_recently_used():
+    cache = TextCache(max_bytes=2 * 400)  # Две строки по 400 байт
+    font = FakeFont()
+    cache.render(font, "a", (1, 1, 1))
+    cache.render(font, "b", (1, 1, 1))
+    cache.render(font, "a", (1, 1, 1))  # "a" становится свежее "b"
+    cache.render(font, "c", (1, 1, 1))
+    assert [key[1] for key in cache.entries] == ["a", "c"]
+    assert cache.used_bytes == 800
+    cache.render(font, "b", (1, 1, 1))
+    assert font.calls == 4
+
+
+def test_text_cache_skips_surfaces_larger_than_limit():
+    cache = TextCache(max_bytes=100)
+    font = FakeFont()
+    cache.render(font, "long text", (1, 1, 1))
+    assert not cache.entries and cache.used_bytes == 0
+    cache.clear()
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+@pytest.fixture
+def display(monkeypatch):
+    """Окно в памяти и журнал вызовов вывода на экран"""
+    pygame.display.init()
+    window = pygame.display.set_mode((100, 100))
+    calls = []
+    monkeypatch.setattr(pygame.display, "flip", lambda: calls.append("flip"))
+    monkeypatch.setattr(pygame.display, "update", lambda rects: calls.append(list(rects)))
+    yield window, calls
+    pygame.display.quit()
+
+
+def test_compositor_restores_only_dirty_areas(display):
+    window, calls = display
+    background = pygame.Surface((100, 100))
+    background.fill((0, 0, 255))
+    compositor = LayerCompositor(window)
+    compositor.begin(background)
+    compositor.mark(window.fill((255, 0, 0), (10, 10, 5, 5)))
+    compositor.present()
+    assert calls == ["flip"]  # Первый кадр выводится целиком
+
+    window.fill((0, 255, 0), (50, 50, 5, 5))  # Нарисовано без отметки
+    compositor.begin(background)
+    assert window.get_at((12, 12))[:3] == (0, 0, 255)  # Отмеченная область стерта фоном
+    assert window.get_at((52, 52))[:3] == (0, 255, 0)  # Остальное не трогалось
+    compositor.mark(window.fill((255, 0, 0), (30, 30, 5, 5)))
+    compositor.present()
+    assert calls[1] == [pygame.Rect(10, 10, 5, 5), pygame.Rect(30, 30, 5, 5)]
+
+
+def test_compositor_falls_back_to_flip(display):
+    window, calls = display
+    background = pygame.Surface((100, 100))
+
+    def second_frame(rects, background_changed=False):
+        """Выводит первый кадр целиком и второй с областями rects; возвращает вывод второго"""
+        compositor = LayerCompositor(window, max_rects=3, max_area_fraction=0.5)
+        compositor.begin(background)
+        compositor.present()
+        compositor.begin(background, background_changed)
+        compositor.mark_all(rects)
+        compositor.present()
+        return calls[-1]
+
+    assert second_frame([pygame.Rect(0, 0, 10, 10)]) == [pygame.Rect(0, 0, 10, 10)]
+    assert second_frame([pygame.Rect(i, 0, 1, 1) for i in range(4)]) == "flip"  # Много областей
+    assert second_frame([pygame.Rect(0, 0, 80, 80)]) == "flip"  # Большая площадь
+    assert second_frame([], background_changed=True) == "flip"  # Фон перестроен
+
+
+def reference_sky(day_time):
+    """Цвет неба по формулам исходного цикла день/ночь, считавшего его каждый кадр"""
+    if 600 <= day_time < 1800:
+        t = (day_time - 600) / 1200
+        start, end = (135, 206, 250), (25, 102, 50)
+    else:
+        t = (day_time - 1800) / 600 if day_time >= 1800 else (day_time + 600) / 600
+        start, end = (25, 102, 50), (0, 0, 0)
+    return tuple(max(0, min(255, int(a + (b - a) * t))) for a, b in zip(start, end))
+
+
+def test_day_night_tables_match_per_frame_formulas():
+    cycle = DayNightCycle(100, 60)
+    for day_time in range(0, DayNightCycle.PERIOD + 1, 7):
+        assert tuple(cycle.sky_table[day_time]) == reference_sky(day_time)
+        assert bool(cycle.is_day_table[day_time]) == (600 <= day_time < 1800)
+
+
+def test_day_night_advance_wraps_and_uses_speed():
+    cycle = DayNightCycle(100, 60, speed=2.0)
+    cycle.advance(300)
+    assert cycle.index == 600 and cycle.is_day
+    cycle.advance(600)
+    assert cycle.index == 1800 and not cycle.is_day
+    cycle.advance(301)
+    assert cycle.index == 1
+    # Солнце выше всего в полдень
+    cycle.time = 1200
+    assert cycle.sun_position == (50, 60 // 3 - 60 // 4)
+
+
+def test_day_night_sky_gradient_ends_in_horizon_color():
+    cycle = DayNightCycle(100, 60, resolution=24)
+    cycle.time = 900
+    surface = pygame.Surface((100, 60))
+    cycle.draw_sky(surface)
+    assert surface.get_at((50, 59))[:3] == cycle.sky_color
+    # Цвет интервала - цвет неба в его начале
+    start = int(np.argmax(cycle.bucket_table == cycle.bucket))
+    assert start <= 900 and cycle.sky_color == tuple(cycle.sky_table[start])
+    top = surface.get_at((50, 0))[:3]
+    assert all(t <= b for t, b in zip(top, cycle.sky_color))
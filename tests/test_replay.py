@@ -0,0 +1,68 @@
+import pygame
+import pytest
+
+from replay import (RECORD_HEADER, RECORD_MAGIC, RECORD_VERSION, TRACKED_KEYS, InputFrame, ReplayInput,
+                    decode_frame, encode_frame)
+
+
+class FakeSandbox:
+    """Только то, что ReplayInput читает у песочницы в конце записи"""
+
+    class space:
+        iterations = 10
+
+    class quality:
+        tier = 0
+
+
+def sample_frames():
+    return [
+        InputFrame(1 / 60, [], (10, 20), (False, False, False), set(), 0, 10, 0),
+        InputFrame(0.02, [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_1, mod=1),
+                          pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=3, pos=(640, 480))],
+                   (640, 480), (True, False, True), {pygame.K_a, pygame.K_UP}, 64, 7, 2),
+    ]
+
+
+def test_frame_round_trip():
+    for frame in sample_frames():
+        data = encode_frame(frame)
+        decoded, offset = decode_frame(b"xx" + data, 2)
+        assert offset == 2 + len(data)
+        assert decoded.dt == pytest.approx(frame.dt)
+        assert (decoded.mouse_pos, decoded.mouse_buttons, decoded.keys, decoded.mods) == (
+            frame.mouse_pos, frame.mouse_buttons, frame.keys, frame.mods)
+        assert (decoded.iterations, decoded.quality) == (frame.iterations, frame.quality)
+        assert [event.type for event in decoded.events] == [event.type for event in frame.events]
+    events = decode_frame(encode_frame(sample_frames()[1]), 0)[0].events
+    assert (events[0].key, events[0].mod) == (pygame.K_1, 1)
+    assert (events[1].button, events[1].pos) == (3, (640, 480))
+
+
+def test_all_tracked_keys_fit_the_mask():
+    frame = InputFrame(0.0, [], (0, 0), (False, False, False), set(TRACKED_KEYS), 0)
+    assert decode_frame(encode_frame(frame), 0)[0].keys == set(TRACKED_KEYS)
+
+
+def test_replay_plays_frames_then_quits(tmp_path):
+    path = tmp_path / "input.rec"
+    path.write_bytes(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, 1234)
+                     + b"".join(encode_frame(frame) for frame in sample_frames()))
+    assert ReplayInput.read_seed(path) == 1234
+    pygame.display.init()
+    try:
+        replay = ReplayInput(path)
+        assert replay.summary() is None
+        frames = [replay.poll(FakeSandbox) for _ in range(3)]
+    finally:
+        pygame.quit()
+    assert [frame.mouse_pos for frame in frames[:2]] == [(10, 20), (640, 480)]
+    assert [event.type for event in frames[2].events] == [pygame.QUIT]
+    assert replay.summary().startswith("replayed 2 frames")
+
+
+def test_replay_rejects_other_files(tmp_path):
+    path = tmp_path / "input.rec"
+    path.write_bytes(RECORD_HEADER.pack(b"OTHER!", RECORD_VERSION, 0))
+    with pytest.raises(ValueError):
+        ReplayInput(path)
@@ -0,0 +1,123 @@
+import sys
+
+import numpy as np
+import pytest
+
+from entities import KIND_BALL
+
+
+def test_despawn_removes_bodies_outside_kill_bounds(sandbox):
+    sandbox.add_ball((300, 300))
+    sandbox.add_box((400, 300))
+    lost = sandbox.entities.entities[1]
+    lost.body.position = (sandbox.kill_bounds.right + 10, 300)
+    sandbox.selected_body = lost.body
+    sandbox.start_drag(lost.body, tuple(lost.body.position))
+    assert sandbox.despawn_out_of_bounds() == 1
+    assert len(sandbox.entities) == 1 and lost.body not in sandbox.space.bodies
+    assert lost.shape not in sandbox.space.shapes
+    assert sandbox.selected_body is None and sandbox.dragging_body is None
+    assert sandbox.despawned_count == 1
+    # Тело вернулось в пул и переиспользуется следующим объектом того же типа
+    sandbox.add_box((400, 300))
+    assert sandbox.entities.entities[-1].body is lost.body
+
+
+def test_despawn_accepts_gathered_positions(sandbox):
+    sandbox.add_ball((300, 300))
+    sandbox.add_ball((350, 300))
+    positions = [[300, 300], [350, sandbox.kill_bounds.bottom]]
+    assert sandbox.despawn_out_of_bounds(np.array(positions, dtype=float)) == 1
+    assert [tuple(body.position) for body in sandbox.entities.bodies()] == [(300, 300)]
+    assert sandbox.despawn_out_of_bounds() == 0
+
+
+def settle(sandbox, seconds=3.0):
+    for _ in range(int(seconds / sandbox.physics_dt)):
+        sandbox.step_physics(sandbox.physics_dt)
+
+
+def test_resting_bodies_fall_asleep_and_scene_settles(sandbox):
+    sandbox.add_box((300, sandbox.height - 60))
+    sandbox.add_box((500, sandbox.height - 60))
+    assert len(sandbox.update_sleep_state()) == 2 and not sandbox.settled
+    settle(sandbox)
+    assert sandbox.update_sleep_state() == [] and sandbox.settled
+    sandbox.wake_all()
+    assert len(sandbox.update_sleep_state()) == 2 and not sandbox.settled
+
+
+def test_dragging_or_moving_particles_keep_scene_awake(sandbox):
+    sandbox.add_box((300, sandbox.height - 60))
+    settle(sandbox)
+    body = sandbox.entities.entities[0].body
+    sandbox.start_drag(body, tuple(body.position))
+    sandbox.update_sleep_state()
+    assert not sandbox.settled
+    sandbox.stop_drag()
+    settle(sandbox)
+    sandbox.spawn_particles(10)
+    sandbox.update_sleep_state()
+    assert not sandbox.settled
+
+
+def test_speed_event_fires_once_per_crossing(sandbox):
+    from main import EVENT_SPEED_REACHED, SPEED_TASK_THRESHOLD
+    sandbox.add_ball((300, 300))
+    events = []
+    sandbox.level_system.listeners[EVENT_SPEED_REACHED] = []
+    sandbox.level_system.emit = lambda event, count=1, **data: events.append((event, count))
+    body = sandbox.entities.entities[0].body
+    body.velocity = (SPEED_TASK_THRESHOLD + 1, 0)
+    sandbox.update_speed_tasks()
+    sandbox.update_speed_tasks()
+    assert events == [(EVENT_SPEED_REACHED, 1)]
+    body.velocity = (0, 0)
+    sandbox.update_speed_tasks()
+    body.velocity = (0, -2 * SPEED_TASK_THRESHOLD)
+    sandbox.update_speed_tasks()
+    assert len(events) == 2
+
+
+def test_broadphase_switch_keeps_scene_and_drag(sandbox):
+    for x in range(100, 600, 50):
+        sandbox.add_ball((x, 300))
+    body = sandbox.entities.entities[0].body
+    sandbox.start_drag(body, tuple(body.position))
+    bodies, shapes = len(sandbox.space.bodies), len(sandbox.space.shapes)
+    sandbox.set_broadphase("hash")
+    assert sandbox.hash_params == sandbox.spatial_hash_params()
+    old_space = sandbox.space
+    sandbox.set_broadphase("tree")
+    assert sandbox.space is not old_space
+    assert (len(sandbox.space.bodies), len(sandbox.space.shapes)) == (bodies, shapes)
+    assert sandbox.drag_joint in sandbox.space.constraints
+    assert all(entity.body.space is sandbox.space for entity in sandbox.entities)
+    sandbox.move_drag((500, 200))
+    sandbox.step_physics(sandbox.physics_dt)
+
+
+def test_spatial_hash_is_retuned_only_on_large_changes(sandbox):
+    sandbox.add_ball((300, 300))
+    sandbox.set_broadphase("hash")
+    params = sandbox.hash_params
+    sandbox.add_ball((350, 300))
+    sandbox.retune_broadphase()
+    assert sandbox.hash_params == params
+    sandbox.spawn_bulk(KIND_BALL, [(100 + i, 100) for i in range(300)])
+    sandbox.retune_broadphase()
+    dim, count = sandbox.hash_params
+    assert dim == params[0] and count == 10 * (len(sandbox.entities) + len(sandbox.space.static_body.shapes))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="в Windows pymunk не собирается с потоками")
+def test_solver_threads_are_capped_at_two(sandbox):
+    from main import MAX_SOLVER_THREADS
+    sandbox.add_box((300, 300))
+    sandbox.set_threads(8)
+    assert sandbox.threads == MAX_SOLVER_THREADS == 2
+    assert sandbox.space.threaded and sandbox.space.threads == 2
+    assert len(sandbox.space.bodies) == 1
+    sandbox.step_physics(sandbox.physics_dt)
+    sandbox.set_threads(1)
+    assert not sandbox.space.threaded and len(sandbox.space.bodies) == 1
@@ -0,0 +1,37 @@
+import pytest
+
+from sweep import SCENARIOS, SWEEP_PARAMETERS, parse_sweep, run_experiment, scenario_positions
+
+
+def test_parse_sweep_builds_full_grid():
+    combinations = parse_sweep(["mass=1,2", "friction=0.1,0.5,0.9"])
+    assert len(combinations) == 6
+    assert combinations[0] == {"mass": 1.0, "friction": 0.1}
+    assert combinations[-1] == {"mass": 2.0, "friction": 0.9}
+    assert parse_sweep([]) == [{}]
+
+
+@pytest.mark.parametrize("spec", ["gravity=1,2", "mass=", "mass"])
+def test_parse_sweep_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_sweep([spec])
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_scenario_positions_fit_the_scene(scenario):
+    positions = scenario_positions(scenario, 20, 20, 800, 600, seed=3)
+    assert len(positions) == 20
+    assert all(0 < x < 800 and 0 < y < 600 - 20 for x, y in positions)
+
+
+def test_rain_positions_depend_only_on_seed():
+    assert scenario_positions("rain", 10, 20, 800, 600, seed=1) == scenario_positions("rain", 10, 20, 800, 600, seed=1)
+    assert scenario_positions("rain", 10, 20, 800, 600, seed=1) != scenario_positions("rain", 10, 20, 800, 600, seed=2)
+
+
+def test_run_experiment_reports_all_parameters(repo_dir):
+    index, params, settle_step, max_speed, energy = run_experiment((7, {"mass": 3.0}, "stack", 0, 5, 60, 20))
+    assert index == 7
+    assert set(params) == set(SWEEP_PARAMETERS) and params["mass"] == 3.0
+    assert len(energy) == 3
+    assert max_speed >= 0 and settle_step >= -1
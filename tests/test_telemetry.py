@@ -0,0 +1,95 @@
+import math
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from telemetry import (TELEMETRY_HEADER, TELEMETRY_MAGIC, TELEMETRY_RECORD, TelemetryServer, encode_telemetry,
+                       parse_command, quantize_telemetry)
+
+
+def make_records(ids, x=0.0):
+    state = np.zeros((len(ids), 5))
+    state[:, 0] = x
+    return quantize_telemetry(np.array(ids), state, np.zeros((len(ids), 3)))
+
+
+def decode(frame):
+    magic, number, changed, removed = TELEMETRY_HEADER.unpack_from(frame)
+    assert magic == TELEMETRY_MAGIC
+    offset = TELEMETRY_HEADER.size
+    records = np.frombuffer(frame, TELEMETRY_RECORD, changed, offset)
+    offset += records.nbytes
+    return number, records, np.frombuffer(frame, "<u4", removed, offset)
+
+
+def test_quantize_sorts_wraps_angle_and_clips_speed():
+    state = np.array([[1.26, -2.0, 3 * math.pi / 2, 40000.0, -3.4],
+                      [5.0, 6.0, 0.5, 0.0, -40000.0]])
+    colors = np.array([[1, 2, 3], [4, 5, 6]])
+    records = quantize_telemetry(np.array([9, 2]), state, colors)
+    assert records["id"].tolist() == [2, 9]
+    assert records["x"].tolist() == [50, 13]
+    assert records["y"].tolist() == [60, -20]
+    # 3pi/2 приводится к -pi/2
+    assert records["angle"].tolist() == [5000, round(-math.pi / 2 * 10000)]
+    assert records["vx"].tolist() == [0, 32767]
+    assert records["vy"].tolist() == [-32768, -3]
+    assert records["color"].tolist() == [[4, 5, 6], [1, 2, 3]]
+
+
+def test_encode_sends_everything_first_then_only_changes():
+    first = make_records([1, 2, 3])
+    number, changed, removed = decode(encode_telemetry(7, first, None))
+    assert number == 7 and changed["id"].tolist() == [1, 2, 3] and not len(removed)
+    second = make_records([1, 3, 4])
+    second["x"][0] = 99
+    _, changed, removed = decode(encode_telemetry(8, second, first))
+    assert changed["id"].tolist() == [1, 4]
+    assert removed.tolist() == [2]
+    _, changed, removed = decode(encode_telemetry(9, second, second))
+    assert not len(changed) and not len(removed)
+
+
+def test_parse_command_accepts_known_commands():
+    assert parse_command('{"cmd": "spawn", "kind": "box", "x": 1, "y": "2"}') == ("spawn", "box", 1.0, 2.0)
+    assert parse_command(b'{"cmd": "clear"}\n') == ("clear",)
+    assert parse_command('{"cmd": "wind", "value": -0.5}') == ("wind", -0.5)
+
+
+@pytest.mark.parametrize("line", [
+    "not json", "[]", '{"kind": "box"}', '{"cmd": "jump"}', '{"cmd": "spawn", "kind": "cat", "x": 0, "y": 0}',
+    '{"cmd": "spawn", "kind": "ball"}', '{"cmd": "wind", "value": "fast"}', '{"cmd": "attraction", "value": NaN}',
+])
+def test_parse_command_rejects_bad_lines(line):
+    with pytest.raises(ValueError):
+        parse_command(line)
+
+
+def test_server_streams_frames_and_queues_commands():
+    server = TelemetryServer(port=0, rate=1000)
+    try:
+        with socket.create_connection((server.host, server.port), timeout=5) as client:
+            client.sendall(b'{"cmd": "clear"}\nbroken\n')
+            deadline = time.monotonic() + 5
+            while not server.due() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            server.publish(3, make_records([5]))
+            frame = client.recv(TELEMETRY_HEADER.size + TELEMETRY_RECORD.itemsize)
+            while server.rejected < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            commands = server.poll_commands()
+    finally:
+        server.close()
+    number, records, _ = decode(frame)
+    assert number == 3 and records["id"].tolist() == [5]
+    assert commands == [("clear",)] and server.rejected == 1
+
+
+def test_server_startup_error_is_raised():
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        with pytest.raises(OSError):
+            TelemetryServer(port=busy.getsockname()[1])
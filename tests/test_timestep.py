@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+
+def test_long_frame_is_clamped_to_catch_up_limit(sandbox):
+    limit = sandbox.substeps * sandbox.max_catchup_frames
+    assert sandbox.advance_physics(1.0) == limit
+    assert 0 <= sandbox.render_alpha < 1
+    # Отброшенное время не приходит лавиной шагов в следующем кадре
+    assert sandbox.advance_physics(1 / sandbox.fps) <= sandbox.substeps + 1
+
+
+def test_leftover_time_carries_to_next_frame(sandbox):
+    dt = sandbox.physics_dt
+    assert sandbox.advance_physics(1.5 * dt) == 1
+    assert sandbox.render_alpha == pytest.approx(0.5)
+    assert sandbox.advance_physics(0.6 * dt) == 1
+    assert sandbox.render_alpha == pytest.approx(0.1)
+    assert sandbox.advance_physics(0.3 * dt) == 0
+    assert sandbox.render_alpha == pytest.approx(0.4)
+
+
+def test_alpha_stays_in_unit_interval(sandbox):
+    rng = random.Random(1)
+    total_steps = 0
+    frames = [rng.uniform(0, 2 / sandbox.fps) for _ in range(300)]
+    for frame_time in frames:
+        total_steps += sandbox.advance_physics(frame_time)
+        assert 0 <= sandbox.render_alpha < 1
+    # Без упора в лимит шаги точно покрывают прошедшее время
+    assert total_steps == int(sum(frames) / sandbox.physics_dt + 1e-9)
+
+
+def test_frame_steps_move_bodies_and_keep_previous_transforms(sandbox):
+    sandbox.add_ball((300, 300))
+    body = sandbox.entities.entities[0].body
+    calls = []
+    capture = sandbox.store_previous_transforms
+    sandbox.store_previous_transforms = lambda: calls.append(body.position.y) or capture()
+    steps = sandbox.advance_physics(1 / sandbox.fps)
+    assert steps == sandbox.substeps
+    # Предыдущее состояние снимается один раз - перед последним шагом кадра
+    assert len(calls) == 1 and 300 < calls[0] < body.position.y
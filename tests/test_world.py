@@ -0,0 +1,85 @@
+import pygame
+import pytest
+
+from world import Camera
+
+
+def make_camera():
+    camera = Camera((800, 600), pygame.Rect(0, -1800, 6400, 2400))
+    camera.reset()
+    return camera
+
+
+def test_reset_shows_bottom_left_corner():
+    camera = make_camera()
+    assert (camera.x, camera.y, camera.zoom) == (0, 0, 1.0)
+    assert camera.view_rect(10) == (-10, -10, 810, 610)
+
+
+def test_screen_world_round_trip():
+    camera = make_camera()
+    camera.zoom_at((0, 0), 2.0)
+    camera.move_to(1000, -500)
+    world = camera.screen_to_world((123, 456))
+    assert world == (1000 + 123 / 2, -500 + 456 / 2)
+    assert camera.world_to_screen(world) == pytest.approx((123, 456))
+
+
+def test_view_is_clamped_to_world():
+    camera = make_camera()
+    camera.pan(-500, 500)
+    assert (camera.x, camera.y) == (0, 0)
+    camera.move_to(10000, -10000)
+    assert (camera.x, camera.y) == (6400 - 800, -1800)
+
+
+def test_world_smaller_than_view_is_centered():
+    camera = Camera((800, 600), pygame.Rect(0, 0, 800, 600), min_zoom=0.25)
+    camera.zoom_at((400, 300), 0.5)
+    assert camera.zoom == 0.5
+    assert camera.view_rect() == (-400, -300, 1200, 900)
+
+
+def test_zoom_keeps_point_under_cursor_and_respects_limits():
+    camera = make_camera()
+    camera.move_to(2000, -1000)
+    anchor = camera.screen_to_world((300, 200))
+    camera.zoom_at((300, 200), 1.5)
+    assert camera.screen_to_world((300, 200)) == pytest.approx(anchor)
+    camera.zoom_at((300, 200), 100)
+    assert camera.zoom == camera.max_zoom
+    camera.zoom_at((300, 200), 0.001)
+    assert camera.zoom == camera.min_zoom
+
+
+def test_version_changes_only_on_real_moves():
+    camera = make_camera()
+    version = camera.version
+    camera.move_to(0, 0)
+    camera.zoom_at((0, 0), 1.0)
+    assert camera.version == version
+    camera.pan(10, 0)
+    assert camera.version == version + 1
+
+
+def test_default_world_is_one_screen(sandbox):
+    assert sandbox.world_rect == pygame.Rect(0, 0, sandbox.width, sandbox.height)
+    assert sandbox.camera.min_zoom == 1.0
+    # Весь рельеф - один чанк, который никогда не выгружается
+    assert len(sandbox.terrain_chunks) == 1 and sandbox.terrain_chunks[0].loaded
+
+
+def test_large_world_streams_chunks_around_camera(repo_dir):
+    from main import PhysicsSandbox
+    sandbox = PhysicsSandbox(headless=True, large_world=True)
+    try:
+        sandbox.camera.reset()
+        sandbox.update_streaming()
+        loaded = [chunk for chunk in sandbox.terrain_chunks if chunk.loaded]
+        assert loaded and len(loaded) < len(sandbox.terrain_chunks)
+        assert all(chunk.left <= sandbox.camera.view_rect()[2] + sandbox.chunk_margin for chunk in loaded)
+        sandbox.camera.move_to(sandbox.world_rect.right, 0)
+        sandbox.update_streaming()
+        assert sandbox.terrain_chunks[-1].loaded and not sandbox.terrain_chunks[0].loaded
+    finally:
+        pygame.quit()
@@ -0,0 +1,83 @@
+"""Камера над большим миром и чанки статического рельефа"""
+
+
+class Camera:
+    """Камера над миром: смещение левого верхнего угла вида и масштаб.
+
+    Мировые координаты переводятся в экранные как (p - (x, y)) * zoom.
+    Вид не выходит за границы мира world_rect, а если мир меньше вида,
+    камера ставит его по центру.
+    """
+
+    def __init__(self, size, world_rect, min_zoom=0.25, max_zoom=2.0):
+        self.width, self.height = size
+        self.world_rect = world_rect
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = 1.0
+        self.version = 0  # Меняется при каждом сдвиге или масштабировании
+
+    def screen_to_world(self, pos):
+        return (self.x + pos[0] / self.zoom, self.y + pos[1] / self.zoom)
+
+    def world_to_screen(self, pos):
+        return ((pos[0] - self.x) * self.zoom, (pos[1] - self.y) * self.zoom)
+
+    def view_rect(self, margin=0.0):
+        """Видимая область мира (левая, верхняя, правая, нижняя граница) с запасом margin"""
+        return (self.x - margin, self.y - margin,
+                self.x + self.width / self.zoom + margin, self.y + self.height / self.zoom + margin)
+
+    def pan(self, dx, dy):
+        """Сдвигает вид на (dx, dy) экранных пикселей"""
+        self.move_to(self.x + dx / self.zoom, self.y + dy / self.zoom)
+
+    def zoom_at(self, pos, factor):
+        """Меняет масштаб, оставляя точку мира под экранной точкой pos на месте"""
+        world_x, world_y = self.screen_to_world(pos)
+        zoom = min(self.max_zoom, max(self.min_zoom, self.zoom * factor))
+        if zoom != self.zoom:
+            self.zoom = zoom
+            self.version += 1
+        self.move_to(world_x - pos[0] / zoom, world_y - pos[1] / zoom)
+
+    def move_to(self, x, y):
+        """Ставит левый верхний угол вида в точку мира (x, y) в пределах мира"""
+        world = self.world_rect
+        view_width, view_height = self.width / self.zoom, self.height / self.zoom
+        if view_width >= world.width:
+            x = world.centerx - view_width / 2
+        else:
+            x = min(max(x, world.left), world.right - view_width)
+        if view_height >= world.height:
+            y = world.centery - view_height / 2
+        else:
+            y = min(max(y, world.top), world.bottom - view_height)
+        if (x, y) != (self.x, self.y):
+            self.x, self.y = x, y
+            self.version += 1
+
+    def reset(self):
+        """Возвращает исходный вид: масштаб 1, левый нижний угол мира"""
+        if self.zoom != 1.0:
+            self.zoom = 1.0
+            self.version += 1
+        self.move_to(self.world_rect.left, self.world_rect.bottom - self.height)
+
+
+class TerrainChunk:
+    """Полоса статического рельефа шириной в один чанк.
+
+    Отрезки чанка создаются один раз и добавляются в пространство или
+    убираются из него целиком, когда камера подходит к чанку или уходит.
+    """
+
+    __slots__ = ("left", "right", "shapes", "loaded")
+
+    def __init__(self, left, right, shapes):
+        self.left = left
+        self.right = right
+        self.shapes = shapes
+        self.loaded = False